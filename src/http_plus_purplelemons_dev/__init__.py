@@ -27,11 +27,22 @@ You can customize error pages by creating a folder in `./errors` with the name o
 __version__ = "0.2.4"
 NAME = "http_plus_purplelemons_dev"
 
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import wraps
 from http.server import HTTPServer, ThreadingHTTPServer
+from inspect import iscoroutinefunction, isasyncgenfunction, isgeneratorfunction
 from typing import Callable
 from .auth import Auth
+from .cache import ResolutionCache, AssetCache
+from .brython import PageCache, Runtime
+from .compression import Compression
+from .json_backend import use as use_json_backend
 from .communications import *
-from .asyncServer import AsyncHandler
+from .asyncServer import AsyncHandler, new_event_loop
+from .parser import MAX_BODY_SIZE, MAX_HEADER_SIZE
+from .gql import QueryCache
+from .workers import make_httpd, serve_worker, supervise
 
 class Server:
     """
@@ -41,7 +52,7 @@ class Server:
         for example `@server.get("/")`.
     """
 
-    def __init__(self, /, *, brython:bool=True, page_dir:str="./pages", error_dir="./errors", debug:bool=False, **kwargs):
+    def __init__(self, /, *, brython:bool=True, page_dir:str="./pages", error_dir="./errors", debug:bool=False, file_cache_size:int=1024, asset_cache_size:int=0, max_workers:int=None, backlog:int=64, keep_alive_timeout:float=5.0, max_keep_alive_requests:int=100, gql_cache_size:int=256, brython_runtime:"str|Runtime"=None, compression:"bool|Compression"=False, json_backend:str="auto", reuse_objects:bool=False, **kwargs):
         """
         Listen to HTTP methods with `@server.<method>(path)`, for example...
         ```
@@ -56,25 +67,68 @@ class Server:
             page_dir (str): The directory to serve pages from.
             error_dir (str): The directory to serve error pages from.
             debug (bool): Whether or not to print debug messages.
+            file_cache_size (int): How many resolved (or missing) `page_dir` lookups to remember.
+            asset_cache_size (int): How many bytes of small, frequently served files to keep in memory.
+                Defaults to 0, which disables the asset cache.
+            max_workers (int): Handle connections on a fixed pool of this many threads. Defaults to
+                `None`, which starts a new thread for every connection.
+            backlog (int): With `max_workers`, how many connections can wait for a free thread
+                before new ones are turned away with a `503`.
+            keep_alive_timeout (float): How long (in seconds) an idle keep-alive connection is kept open.
+            max_keep_alive_requests (int): How many requests a connection can make before it's closed.
+                `None` for no limit.
+            gql_cache_size (int): How many parsed and validated queries each `@server.gql` endpoint remembers.
+            brython_runtime (str|Runtime): A directory with a copy of brython (`brython.min.js` and
+                `brython_stdlib.js`) to serve under `/_brython/` instead of linking pages to jsDelivr.
+                Each page gets a stdlib bundle of just the modules it imports. See `http_plus.brython.Runtime`.
+            compression (bool|Compression): Compress responses (and `page_dir` files) for clients that accept
+                brotli, gzip or deflate. `True` for the defaults of `http_plus.compression.Compression`.
+            json_backend (str): What encodes and decodes JSON: `"orjson"`, `"ujson"`, `"json"` (the standard
+                library), or `"auto"` for the fastest one installed. See `http_plus.json_backend`.
+            reuse_objects (bool): Have each connection reset and reuse its `Request` and `Response` objects
+                instead of allocating new ones for every request. Listeners must not hold on to them
+                (e.g. in background tasks) after returning.
         """
         self.debug = debug
+        self.max_workers = max_workers
+        self.backlog = backlog
+        self.gql_cache_size = gql_cache_size
+        use_json_backend(json_backend)
         self.handler = Handler
         self.handler.responses
         self.handler.debug = debug
         self.handler.brython = brython
         self.handler.page_dir = page_dir[:-1] if page_dir.endswith("/") else page_dir
         self.handler.error_dir = error_dir[:-1] if error_dir.endswith("/") else error_dir
-
-    def listen(self, port:int, ip:str=None) -> None:
+        self.handler.path_cache = ResolutionCache(file_cache_size)
+        self.handler.asset_cache = AssetCache(asset_cache_size) if asset_cache_size else None
+        if isinstance(brython_runtime, str):
+            brython_runtime = Runtime(brython_runtime, self.handler.page_dir)
+        self.handler.brython_runtime = brython_runtime
+        self.handler.brython_cache = PageCache(runtime=brython_runtime)
+        self.handler.compression = Compression() if compression is True else compression or None
+        self.handler.reuse_objects = reuse_objects
+        self.handler.keep_alive_timeout = keep_alive_timeout
+        self.handler.max_keep_alive_requests = max_keep_alive_requests
+
+    def listen(self, port:int, ip:str=None, workers:int=1, reuse_port:bool=False, drain_timeout:float=30.0) -> None:
         """
         Starts the server, a blocking loop on the current thread.
         The IP will default to all interfaces (`0.0.0.0`) if not specified, unless if the
         server was initialized with `debug=True`, in which case it will default to loopback
         (`127.0.0.1`).
 
+        With `workers` > 1, the server forks that many processes to handle requests (so
+        more than one core gets used), restarts them if they die, and stops them gracefully
+        on `SIGTERM`. Not available on Windows.
+
         Args:
             port (int): The port to listen on. Must be available, otherwise the server will raise a binding error.
             ip (str): String in the form of an IP address to listen on. Must be an address on the current machine.
+            workers (int): How many processes to handle requests with.
+            reuse_port (bool): Have every worker bind its own socket with `SO_REUSEPORT` instead of
+                sharing one, which spreads connections between workers more evenly on Linux.
+            drain_timeout (float): How long a stopping worker waits for in-flight requests, in seconds.
         """
         if self.debug:
             if ip is None:
@@ -85,12 +139,28 @@ class Server:
             # No debug and no IP specified, use all interfaces
             ip = "0.0.0.0"
         try:
-            ThreadingHTTPServer((ip,port), self.handler).serve_forever()
+            if workers > 1:
+                if reuse_port:
+                    worker_httpd = lambda: self._make_httpd(ip, port, reuse_port=True)
+                else:
+                    # bound before forking so every worker inherits the same listening socket
+                    httpd = self._make_httpd(ip, port)
+                    worker_httpd = lambda: httpd
+                supervise(workers, lambda: serve_worker(worker_httpd(), drain_timeout))
+                print("\nServer stopped.")
+            else:
+                self._make_httpd(ip, port).serve_forever()
         except KeyboardInterrupt:
             print("\nServer stopped.")
         except Exception as e:
             print(f"Server error: {e}")
 
+    def _make_httpd(self, ip:str, port:int, reuse_port:bool=False):
+        return make_httpd(
+            (ip,port), self.handler,
+            max_workers=self.max_workers, backlog=self.backlog, reuse_port=reuse_port
+        )
+
     @staticmethod
     def _make_method(server_wrapper:Callable):
         """
@@ -102,11 +172,19 @@ class Server:
             def decorator(func:Callable):
                 try:
                     self.handler.responses[server_wrapper.__name__][path] = func
+                    # compiled once here so requests don't have to re-parse the route
+                    self.handler.route_trees[server_wrapper.__name__].insert(path, self._wrap_listener(func))
                 except KeyError:
                     raise RouteExistsError(path)
             return decorator
         return method
     
+    def _wrap_listener(self, func:Callable) -> Callable:
+        """
+        Called on every listener when it's registered. Returns what the handler should call instead.
+        """
+        return func
+
     def log(self, func:Callable):
         """
         A decorator that adds a custom logger to the server.
@@ -136,20 +214,28 @@ class Server:
                     raise RouteExistsError(path)
         return decorator
 
-    def gql(self, schema:str, endpoint:str="/api/graphql"):
+    def gql(self, schema:str, endpoint:str="/api/graphql", cache_ttl:float=None):
         """
         A decorator that adds a route to the server. Listens *ONLY* to GET requests.
 
         If you use a keyword wildcard in the route url, arguments will be passed into
         the function via **kwargs (e.g. `@server.gql("/product/:id")` passes in `{"id": "..."}`).
 
+        The endpoint takes a single operation (`{"query": ..., "variables": ..., "operationName": ...}`)
+        or a JSON array of them, which are executed together and answered with an array of results.
+
         Args:
             endpoint (str): The endpoint that the server will listen on.
+            cache_ttl (float): Reuse the result of a query (not a mutation) for the same variables for
+                this many seconds. Only for endpoints whose results don't depend on who's asking.
+                Defaults to `None`, no caching.
         """
         def decorator(func:Callable):
             try:
-                self.handler.gql_endpoints[endpoint] = func
+                self.handler.gql_endpoints[endpoint] = self._wrap_listener(func)
                 self.handler.gql_schemas[endpoint] = schema
+                # built once here, along with the cache of parsed queries
+                self.handler.gql_caches[endpoint] = QueryCache(schema, self.gql_cache_size, cache_ttl)
             except KeyError:
                 raise RouteExistsError(endpoint)
         return decorator
@@ -264,17 +350,47 @@ class Server:
 
 
 class AsyncServer(Server):
-    def __init__(self, /, *, brython: bool = True, page_dir: str = "./pages", error_dir="./errors", debug: bool = False, **kwargs):
+    def __init__(self, /, *, brython: bool = True, page_dir: str = "./pages", error_dir="./errors", debug: bool = False, max_header_size: int = MAX_HEADER_SIZE, max_body_size: "int | None" = MAX_BODY_SIZE, write_high_water: int = 64 * 1024, write_low_water: int = 16 * 1024, max_pending: int = 32, executor:Executor=None, max_sync_calls:int=64, **kwargs):
+        """
+        Args:
+            max_header_size (int): Requests with a longer request line plus headers are answered with a `431`.
+            max_body_size (int): Requests with a larger body are answered with a `413`. Bodies are read into memory whole, so
+                this defaults to 16 MiB. `None` for no limit.
+            write_high_water (int): Writing to a connection pauses once this many bytes are buffered for it.
+            write_low_water (int): Writing resumes once the buffer is down to this many bytes.
+            max_pending (int): Reading from a connection pauses while this many pipelined requests are waiting.
+            executor (Executor): Runs listeners defined with a plain `def` (and sync generators), so
+                they can't block the event loop. Defaults to a `ThreadPoolExecutor` with `max_workers` threads.
+            max_sync_calls (int): How many sync listeners can be running or waiting for the executor at once.
+                Requests past that wait their turn on the event loop.
+        
+        See `Server` for the other arguments.
+        """
         super().__init__(brython=brython, page_dir=page_dir, error_dir=error_dir, debug=debug, **kwargs)
         self.handler = AsyncHandler
+        self.handler.max_header_size = max_header_size
+        self.handler.max_body_size = max_body_size
+        self.handler.write_high_water = write_high_water
+        self.handler.write_low_water = write_low_water
+        self.handler.max_pending = max_pending
+        self.handler.executor = executor or ThreadPoolExecutor(self.max_workers, thread_name_prefix="http+")
+        self.handler.max_sync_calls = max_sync_calls
         self.handler.debug = debug
         self.handler.brython = brython
         self.handler.page_dir = page_dir[:-1] if page_dir.endswith("/") else page_dir
         self.handler.error_dir = error_dir[:-1] if error_dir.endswith("/") else error_dir
         self.handler.protocol = "HTTP/1.1"
         self.handler.server_version = f"http+/{__version__}"
+        self.handler.server_header = f"Server: {self.handler.server_version}\r\n".encode("latin-1")
+        # `Server.__init__` set the caches up on `Handler`, share them
+        self.handler.path_cache = Handler.path_cache
+        self.handler.asset_cache = Handler.asset_cache
+        self.handler.brython_cache = Handler.brython_cache
+        self.handler.brython_runtime = Handler.brython_runtime
+        self.handler.compression = Handler.compression
+        self.handler.reuse_objects = Handler.reuse_objects
 
-    def listen(self, port:int, ip:str=None) -> None:
+    def listen(self, port:int, ip:str=None, loop:str="auto", backlog:int=100, reuse_port:bool=False) -> None:
         """
         Starts the server, a blocking loop on the current thread.
         The IP will default to all interfaces (`0.0.0.0`) if not specified, unless if the
@@ -284,6 +400,10 @@ class AsyncServer(Server):
         Args:
             port (int): The port to listen on. Must be available, otherwise the server will raise a binding error.
             ip (str): String in the form of an IP address to listen on. Must be an address on the current machine.
+            loop (str): The event loop to run on: `"uvloop"`, `"asyncio"`, or `"auto"` (the default),
+                which uses uvloop if it's installed. uvloop is usually a good deal faster.
+            backlog (int): How many connections the OS queues up before they're accepted.
+            reuse_port (bool): Bind with `SO_REUSEPORT`, so several processes can listen on the same port.
         """
         if self.debug:
             if ip is None:
@@ -294,23 +414,52 @@ class AsyncServer(Server):
             # No debug and no IP specified, use all interfaces
             ip = "0.0.0.0"
         try:
-            import asyncio
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            self.handler.create_task = loop.create_task
-            coro = loop.create_server(self.handler, ip, port)
-            server = loop.run_until_complete(coro)
+            event_loop = new_event_loop(loop)
+            asyncio.set_event_loop(event_loop)
+            server = event_loop.run_until_complete(self.serve(port, ip, backlog=backlog, reuse_port=reuse_port))
             try:
-                loop.run_forever()
+                event_loop.run_forever()
             except KeyboardInterrupt:
                 pass
             server.close()
-            loop.run_until_complete(server.wait_closed())
-            loop.close()
+            event_loop.run_until_complete(server.wait_closed())
+            event_loop.close()
         except Exception as e:
             print(f"Server error: {e}")
             raise e
 
+    async def serve(self, port:int, ip:str="0.0.0.0", backlog:int=100, reuse_port:bool=False, start_serving:bool=True) -> asyncio.Server:
+        """
+        Creates the server on the running event loop and returns it, for running alongside other
+        asyncio code. `listen` does this on an event loop of its own.
+
+        Args:
+            port (int): The port to listen on.
+            ip (str): The IP to listen on. Defaults to all interfaces.
+            backlog (int): How many connections the OS queues up before they're accepted.
+            reuse_port (bool): Bind with `SO_REUSEPORT`, so several processes can listen on the same port.
+            start_serving (bool): Whether to accept connections straight away. If not, call
+                `start_serving()` or `serve_forever()` on the returned server once you're ready.
+        """
+        event_loop = asyncio.get_running_loop()
+        self.handler.create_task = event_loop.create_task
+        self.handler.sync_slots = asyncio.Semaphore(self.handler.max_sync_calls)
+        return await event_loop.create_server(
+            self.handler, ip, port, backlog=backlog, reuse_port=reuse_port or None, start_serving=start_serving
+        )
+
+    def _wrap_listener(self, func:Callable) -> Callable:
+        """
+        Sync listeners are wrapped to run on the executor. Coroutines, and generators (which
+        `AsyncHandler` already steps through on the executor), are left as they are.
+        """
+        if iscoroutinefunction(func) or isasyncgenfunction(func) or isgeneratorfunction(func):
+            return func
+        @wraps(func)
+        async def listener(request:Request, response:Response):
+            return await request.request.run_sync(func, request, response)
+        return listener
+
 def init():
     """
     Initializes the current directory for HTTP+
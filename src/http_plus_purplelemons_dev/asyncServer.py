@@ -1,18 +1,94 @@
-from traceback import print_exception as print_exc
-import aiofiles
+from traceback import print_exception as print_exc, format_exc
 import asyncio
 from asyncio.transports import Transport
-from typing import Callable
-import json
+from concurrent.futures import Executor
+from inspect import isawaitable
+from typing import Any, AsyncIterable, AsyncIterator, BinaryIO, Callable, Iterable
+import os
 from .communications import (
     STATUS_MESSAGES,
+    Event,
     Request,
     Response,
     StreamResponse,
     GQLResponse,
     Handler,
+    CHUNK_SIZE,
+    _UNPARSED,
+    encode_chunk,
 )
-from datetime import datetime as dt
+from .brython import RUNTIME_ROUTE, PageCache, Runtime
+from .cache import (
+    ResolutionCache,
+    Asset,
+    AssetCache,
+    compressed_file_headers,
+    file_headers,
+    validator_headers,
+)
+from .compression import Compression
+from .content_types import detect_content_type
+from .gql import QueryCache
+from .ranges import ByteRanges, negotiate
+from .routing import RouteTree
+from .static_responses import error_body
+from .parser import (
+    MAX_BODY_SIZE,
+    MAX_HEADER_SIZE,
+    Headers,
+    ParsedRequest,
+    ParseError,
+    RequestParser,
+)
+from collections import deque
+from email.utils import formatdate
+from time import time
+
+STATUS_LINES: dict[int, bytes] = {
+    code: f"HTTP/1.1 {code} {message}\r\n".encode("latin-1")
+    for code, message in STATUS_MESSAGES.items()
+}
+"Pre-encoded `HTTP/1.1` status lines for every code in `STATUS_MESSAGES`."
+
+_date_header: "tuple[int, bytes]" = (0, b"")
+
+
+def date_header() -> bytes:
+    """
+    Returns the encoded `Date` header line for the current second. It's only formatted
+    once a second, however many responses are sent.
+    """
+    global _date_header
+    now = int(time())
+    if _date_header[0] != now:
+        _date_header = (now, f"Date: {formatdate(now, usegmt=True)}\r\n".encode("latin-1"))
+    return _date_header[1]
+
+
+def new_event_loop(kind: str = "auto") -> asyncio.AbstractEventLoop:
+    """
+    Creates the event loop `AsyncServer.listen` runs on.
+
+    Args:
+        kind (str): `"uvloop"` for uvloop (which must be installed), `"asyncio"` for the
+            standard event loop, or `"auto"` for uvloop if it's installed and asyncio otherwise.
+    """
+    if kind not in ("auto", "asyncio", "uvloop"):
+        raise ValueError(f"Unknown event loop {kind}.")
+    if kind != "asyncio":
+        try:
+            import uvloop
+        except ImportError:
+            if kind == "uvloop":
+                raise ImportError("`loop=\"uvloop\"` needs uvloop, `pip install uvloop`.")
+        else:
+            return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+def encode_headers(headers: "Iterable[tuple[str, Any]]") -> bytes:
+    "Encodes `(name, value)` pairs as `Name: value\\r\\n` header lines."
+    return "".join(f"{name}: {value}\r\n" for name, value in headers).encode("latin-1")
 
 
 class AsyncHandler(asyncio.Protocol):
@@ -33,52 +109,609 @@ class AsyncHandler(asyncio.Protocol):
         # Again, not an HTTP method. Used for GraphQL.
         "gql": {},
     }
-    body: "str|dict|list|None" = None
+    route_trees: dict[str, RouteTree] = {method: RouteTree() for method in responses}
+    "Compiled versions of `responses`, filled in by `@server.<method>`."
+    gql_endpoints: dict[str, Callable[..., "GQLResponse"]] = {}
+    "Endpoint to GQL resolver mappings"
+    gql_schemas: dict[str, str] = {}
+    "Endpoint to GQL schema mappings"
+    gql_caches: dict[str, QueryCache] = {}
+    "Endpoint to built schema and query document cache mappings"
+    page_dir: str
+    error_dir: str
+    debug: bool
+    brython: bool
+    path_cache: ResolutionCache = ResolutionCache()
+    "Shared with `Handler`, see `Handler.serve_filename`."
+    asset_cache: "AssetCache | None" = None
+    "Shared with `Handler`, see `Server(asset_cache_size=...)`."
+    error_cache: AssetCache = Handler.error_cache
+    "Shared with `Handler`."
+    brython_cache: PageCache = PageCache()
+    "Shared with `Handler`."
+    brython_runtime: "Runtime | None" = None
+    "Shared with `Handler`."
+    compression: "Compression | None" = None
+    "Shared with `Handler`, see `Server(compression=...)`."
+    reuse_objects: bool = False
+    "Shared with `Handler`, see `Server(reuse_objects=True)`."
+    spare_request: "Request | None" = None
+    spare_response: "Response | None" = None
+    compressing: "set[tuple[str, str]]" = set()
+    "`(filename, encoding)`s being compressed on the executor, so a busy file is only compressed once."
+    body: bytes = b""
+    _json: Any = _UNPARSED
+    body_json = Handler.body_json
+    json = Handler.json
     http_version = "HTTP/1.1"
-    headers: dict[str, str] = {}
-    "`Content-Length` is set automatically"
+    headers: Headers = Headers()
+    "The headers of the request being handled."
+    omit_body: bool = False
+    "Whether the request being handled is a `HEAD`, see `Handler.omit_body`."
     server_version: str
+    server_header: bytes = b""
+    "The encoded `Server` header line, set by `AsyncServer` from `server_version`."
+    max_header_size: int = MAX_HEADER_SIZE
+    "Requests with a longer request line plus headers are answered with a `431`."
+    max_body_size: "int | None" = MAX_BODY_SIZE
+    "Requests with a larger body are answered with a `413`. `None` for no limit."
+    write_high_water: int = 64 * 1024
+    "Writing is paused (see `drain`) once the transport buffers this many bytes."
+    write_low_water: int = 16 * 1024
+    "Writing resumes once the transport's buffer is back down to this many bytes."
+    max_pending: int = 32
+    "Reading from the client is paused while this many pipelined requests are waiting."
+    executor: "Executor | None" = None
+    "Where `run_sync` runs blocking code. `None` for the event loop's default executor."
+    max_sync_calls: int = 64
+    sync_slots: "asyncio.Semaphore | None" = None
+    "Limits `run_sync` to `max_sync_calls` at once, set by `AsyncServer.listen`."
 
     @staticmethod
     def create_task(coro) -> asyncio.Task:
         pass
 
-    @staticmethod
-    def match_route(path: str, route: str) -> tuple[bool, dict[str, str]]:
-        return Handler.match_route(path, route)
+    match_route = staticmethod(Handler.match_route)
+
+    # the lookups only touch the filesystem on a cache miss, so they're shared with `Handler`
+    serve_filename = Handler.serve_filename
+    _serve_filename = Handler._serve_filename
+    brython_scripts = Handler.brython_scripts
+    error_page = Handler.error_page
+    new_request = Handler.new_request
+    new_response = Handler.new_response
 
     def connection_made(self, transport: Transport) -> None:
         self.transport = transport
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+        self.parser: "RequestParser | None" = RequestParser(self.max_header_size, self.max_body_size)
+        "`None` once the client sent something unparsable, nothing it sends after that is read."
+        self.pending: "deque[ParsedRequest | ParseError]" = deque()
+        """
+        Requests that arrived (pipelined) while another one was being answered. A `ParseError`
+        is answered like a request, after the requests before it, and then the connection closes.
+        """
+        self.busy = False
+        self.keep_alive = True
+        self._reading_paused = False
+        transport.set_write_buffer_limits(self.write_high_water, self.write_low_water)
         return super().connection_made(transport)
 
+    def connection_lost(self, exc: "Exception | None") -> None:
+        self.pending.clear()
+        # wake up anything waiting on `drain` so it can notice the transport is gone
+        self._can_write.set()
+        return super().connection_lost(exc)
+
+    def pause_writing(self) -> None:
+        self._can_write.clear()
+        self.update_reading()
+
+    def resume_writing(self) -> None:
+        self._can_write.set()
+        self.update_reading()
+        self.next_request()
+
+    def update_reading(self) -> None:
+        """
+        Stops reading from the client while it isn't reading our responses, or while too
+        many of its requests are queued up, so neither can grow without bound.
+        """
+        backed_up = not self._can_write.is_set() or len(self.pending) >= self.max_pending
+        if backed_up and not self._reading_paused:
+            self._reading_paused = True
+            self.transport.pause_reading()
+        elif not backed_up and self._reading_paused and not self.transport.is_closing():
+            self._reading_paused = False
+            self.transport.resume_reading()
+
+    async def drain(self) -> None:
+        """
+        Waits until the transport's write buffer has room again.
+        Raises `ConnectionResetError` if the client went away.
+        """
+        await self._can_write.wait()
+        if self.transport.is_closing():
+            raise ConnectionResetError("Connection lost.")
+
     def send_data(self, message: str):
         self.transport.write(message.encode())
 
-    def respond(self, code: int, message: str, body: str = ""):
-        response = f"{self.http_version} {code} {message}\r\n"
-        for header_key, header_value in self.headers.items():
-            response += f"{header_key}: {header_value}\r\n"
-        response += "\r\n"
-        if body:
-            response += f"{body}\r\n"
-        self.send_data(response)
+    def status_line(self, code: int, message: "str | None" = None) -> bytes:
+        "Returns the encoded status line, from `STATUS_LINES` unless a custom `message` is given."
+        if message is None and self.http_version == "HTTP/1.1" and code in STATUS_LINES:
+            return STATUS_LINES[code]
+        if message is None:
+            message = STATUS_MESSAGES.get(code, "")
+        return f"{self.http_version} {code} {message}\r\n".encode("latin-1")
+
+    def respond(self, code: int, message: str, body: "str | bytes" = ""):
+        encoded = body if isinstance(body, bytes) else body.encode()
+        head = [self.status_line(code, message), date_header(), self.server_header]
+        if self.compression is not None and self.compression.compressible("text/html", len(encoded)):
+            head.append(b"Vary: Accept-Encoding\r\n")
+            encoding = self.compression.encoding(self.headers.get("Accept-Encoding"))
+            if encoding is not None:
+                encoded = self.compression.compress(encoded, encoding)
+                head.append(b"Content-Encoding: %s\r\n" % encoding.encode())
+        head.append(b"Content-Type: text/html\r\nContent-Length: %d\r\n" % len(encoded))
+        if not self.keep_alive:
+            head.append(b"Connection: close\r\n")
+        head.append(b"\r\n")
+        if not self.omit_body:
+            head.append(encoded)
+        self.transport.writelines(head)
 
     # @staticmethod
     def send_response(self, response: "Response"):
-        self.send_data(
-            f"{self.http_version} {response.status_code} {STATUS_MESSAGES[response.status_code]}\r\n"
+        chunked = False
+        if response.stream is not None:
+            chunked = response.frame_stream(self.request_version)
+        else:
+            response.compress(self.compression, self.headers.get("Accept-Encoding"))
+        # everything up to (and for plain bodies, including) the body goes out in one write
+        head = [
+            self.status_line(response.status_code),
+            date_header(),
+            self.server_header,
+        ]
+        if (
+            "Content-Length" not in response.headers
+            and response.stream is None
+            and response.status_code not in (204, 304)
+        ):
+            head.append(b"Content-Length: %d\r\n" % memoryview(response.body).nbytes)
+        if not self.keep_alive:
+            head.append(b"Connection: close\r\n")
+        head.append(
+            "".join(
+                f"{header_key}: {header_value}\r\n"
+                for header_key, header_value in response.headers.items()
+            ).encode("latin-1")
+        )
+        head.append(b"\r\n")
+        if self.omit_body:
+            # `HEAD`, the headers are the whole response
+            if response.file is not None:
+                response.file.close()
+            if response.stream is not None:
+                self.discard(response.stream)
+                if not chunked:
+                    # `frame_stream` promised `Connection: close`
+                    self.keep_alive = False
+            self.transport.writelines(head)
+            self.finish_response()
+        elif response.file is not None and response.ranges is not None:
+            self.transport.writelines(head)
+            writer = self.create_task(self.write_ranges(response.file, response.ranges))
+            writer.add_done_callback(self._finish_body)
+        elif response.file is not None:
+            self.transport.writelines(head)
+            self.create_task(self.write_file(response.file)).add_done_callback(self._finish_body)
+        elif response.stream is not None:
+            self.transport.writelines(head)
+            writer = self.create_task(self.write_stream(response.stream, chunked))
+            writer.add_done_callback(self._finish_body)
+        else:
+            head.append(response.body)
+            self.transport.writelines(head)
+            self.finish_response()
+
+    def finish_response(self):
+        """
+        Called once a response has been completely written. Closes the connection or moves
+        on to the next pipelined request.
+        """
+        self.busy = False
+        if not self.keep_alive:
+            self.transport.close()
+        else:
+            # not called directly, a long pipeline of synchronous responses would recurse
+            asyncio.get_running_loop().call_soon(self.next_request)
+
+    def _finish_body(self, task: asyncio.Task) -> None:
+        """
+        Done-callback of the tasks that write a body. If one failed part way, the client can't
+        tell where the response ends anymore, so the connection is closed instead of reused.
+        """
+        if task.cancelled() or task.exception() is not None:
+            if self.debug and not task.cancelled():
+                print_exc(task.exception())
+            self.keep_alive = False
+        self.finish_response()
+
+    def respond_file(self, code: int, filename: str, cache: "AssetCache | None" = None) -> None:
+        """
+        Responds to the client with a file, like `Handler.respond_file`. A file that's in the
+        asset cache (and was checked recently) is sent straight away. Otherwise it's opened,
+        `stat`ed or read into the cache on the executor first, and then sent with
+        `loop.sendfile`, so the event loop never waits on the disk.
+
+        Args:
+            code (int): The HTTP status code to respond with.
+            filename (str): The file to respond with.
+            cache (AssetCache): The cache to use instead of `asset_cache`, e.g. `error_cache`.
+        """
+        if cache is None:
+            cache = self.asset_cache
+        asset = cache.fresh(filename) if cache is not None else None
+        if asset is not None:
+            self._respond_asset(code, filename, asset)
+        else:
+            self.create_task(self._respond_file(code, filename, cache))
+
+    async def _respond_file(self, code: int, filename: str, cache: "AssetCache | None") -> None:
+        try:
+            loaded = await self.run_sync(self._load_file, filename, cache)
+        except Exception as e:
+            if cache is self.error_cache:
+                # the page went away since it was looked up, the built-in one will do
+                self.respond(code, STATUS_MESSAGES.get(code, ""), error_body(code))
+                self.finish_response()
+            else:
+                self._internal_error(e)
+            return
+        if isinstance(loaded, Asset):
+            self._respond_asset(code, filename, loaded)
+            return
+        file, stat = loaded
+        try:
+            header_block = encode_headers(file_headers(filename, stat))
+            self._respond_source(code, filename, file, stat.st_mtime_ns, stat.st_size, header_block)
+        except Exception as e:
+            file.close()
+            self._internal_error(e)
+
+    def _load_file(
+        self, filename: str, cache: "AssetCache | None"
+    ) -> "Asset | tuple[BinaryIO, os.stat_result]":
+        """
+        Runs on the executor for `respond_file`: loads the file into `cache`, or opens and
+        `stat`s it if it can't be cached. A fresh `.gz`/`.br` sibling is loaded too, so
+        `compressed` finds it without the disk.
+        """
+        asset = cache.get(filename) if cache is not None else None
+        if asset is not None:
+            self._load_variant(filename, asset.mtime_ns, asset.size)
+            return asset
+        file = open(filename, "rb")
+        try:
+            stat = os.fstat(file.fileno())
+            self._load_variant(filename, stat.st_mtime_ns, stat.st_size)
+        except BaseException:
+            file.close()
+            raise
+        return file, stat
+
+    def _load_variant(self, filename: str, mtime_ns: int, size: int) -> None:
+        compression = self.compression
+        if compression is None or not compression.compressible(detect_content_type(filename), size):
+            return
+        encoding = compression.encoding(self.headers.get("Accept-Encoding"))
+        if encoding is not None:
+            compression.static_variant(filename, mtime_ns, size, encoding, create=False)
+
+    def _respond_asset(self, code: int, filename: str, asset: Asset) -> None:
+        self._respond_source(
+            code, filename, asset.body, asset.mtime_ns, asset.size, asset.header_block
+        )
+
+    def _respond_source(
+        self,
+        code: int,
+        filename: str,
+        source: "bytes | BinaryIO",
+        mtime_ns: int,
+        size: int,
+        header_block: bytes,
+    ) -> None:
+        "Sends `source` (an asset's bytes or an open file) as the response for `filename`."
+        ranges = None
+        if code == 200:
+            code, ranges = negotiate(
+                self.headers, size, mtime_ns, detect_content_type(filename)
+            )
+        head = [self.status_line(code), date_header(), self.server_header]
+        if not self.keep_alive:
+            head.append(b"Connection: close\r\n")
+        if code == 304:
+            head.append(encode_headers(validator_headers(mtime_ns, size)))
+        elif code == 416:
+            head.append(encode_headers([("Content-Range", f"bytes */{size}"), ("Content-length", 0)]))
+        elif ranges is not None:
+            head.append(encode_headers([*ranges.headers(), *validator_headers(mtime_ns, size)]))
+        elif code == 200 and self.compressed(head, filename, mtime_ns, size):
+            if not isinstance(source, bytes):
+                source.close()
+            self.transport.writelines(head)
+            self.finish_response()
+            return
+        else:
+            head.append(header_block)
+        head.append(b"\r\n")
+
+        if code in (304, 416) or self.omit_body:
+            writer = None
+        elif ranges is not None:
+            writer = self.write_ranges(source, ranges)
+        elif isinstance(source, bytes):
+            head.append(source)
+            writer = None
+        else:
+            writer = self.write_file(source)
+        if writer is None and not isinstance(source, bytes):
+            source.close()
+        self.transport.writelines(head)
+        if writer is None:
+            self.finish_response()
+        else:
+            self.create_task(writer).add_done_callback(self._finish_body)
+
+    def compressed(self, head: "list[bytes]", filename: str, mtime_ns: int, size: int) -> bool:
+        """
+        Adds a compressed version of a `page_dir` file to `head` (headers and body), if the
+        client accepts one and it's been compressed already. Otherwise it's compressed on the
+        executor for the next request, and the file is sent as is.
+
+        Returns:
+            bool: Whether `head` is the whole response now.
+        """
+        compression = self.compression
+        if compression is None:
+            return False
+        content_type = detect_content_type(filename)
+        if not compression.compressible(content_type, size):
+            return False
+        head.append(b"Vary: Accept-Encoding\r\n")
+        encoding = compression.encoding(self.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return False
+        compressed = compression.cached_variant(filename, mtime_ns, size, encoding)
+        if compressed is None:
+            key = (filename, encoding)
+            if key not in self.compressing:
+                self.compressing.add(key)
+                self.executor.submit(
+                    compression.static_variant, filename, mtime_ns, size, encoding
+                ).add_done_callback(lambda future: self.compressing.discard(key))
+            return False
+        headers = compressed_file_headers(content_type, compressed, encoding, mtime_ns, size)
+        head += (encode_headers(headers), b"\r\n")
+        if not self.omit_body:
+            head.append(compressed)
+        return True
+
+    async def write_file(self, file: BinaryIO, offset: int = 0, count: "int | None" = None):
+        """
+        Writes an open file to the transport, using `os.sendfile` when the event loop supports it.
+        The file is closed afterwards.
+
+        Args:
+            file (BinaryIO): The file to send, opened in binary mode.
+            offset (int): Where in the file to start.
+            count (int): How many bytes to send. Defaults to the rest of the file.
+        """
+        try:
+            await self.sendfile(file, offset, count)
+        except ConnectionError:
+            pass
+        finally:
+            file.close()
+
+    async def sendfile(self, file: BinaryIO, offset: int = 0, count: "int | None" = None):
+        """
+        `loop.sendfile` for event loops that have it. Others (like uvloop) get the file
+        read on `executor`, `CHUNK_SIZE` at a time.
+        """
+        try:
+            await asyncio.get_running_loop().sendfile(self.transport, file, offset, count)
+            return
+        except NotImplementedError:
+            pass
+        file.seek(offset)
+        remaining = count
+        while remaining is None or remaining > 0:
+            size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+            chunk = await self.run_sync(file.read, size)
+            if not chunk:
+                break
+            self.transport.write(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+            await self.drain()
+
+    async def write_ranges(self, source: "bytes | BinaryIO", ranges: ByteRanges):
+        """
+        Writes the body of a `206 Partial Content` response, see `Handler.write_ranges`.
+        A file `source` is closed afterwards.
+        """
+        try:
+            for prefix, start, end in ranges.parts():
+                if prefix:
+                    self.transport.write(prefix)
+                if end > start:
+                    if isinstance(source, bytes):
+                        self.transport.write(memoryview(source)[start:end])
+                        await self.drain()
+                    else:
+                        await self.sendfile(source, start, end - start)
+        except ConnectionError:
+            pass
+        finally:
+            if not isinstance(source, bytes):
+                source.close()
+
+    async def run_sync(self, func: Callable, *args) -> Any:
+        """
+        Runs a blocking function on `executor`, so it doesn't stall the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self.sync_slots is None:
+            return await loop.run_in_executor(self.executor, func, *args)
+        async with self.sync_slots:
+            return await loop.run_in_executor(self.executor, func, *args)
+
+    async def iterate(self, iterable: "Iterable | AsyncIterable") -> AsyncIterator:
+        """
+        Iterates over an async iterable, or a sync one with every item produced on `executor`
+        (a generator might block between items). Lists and tuples are iterated directly.
+        """
+        if hasattr(iterable, "__aiter__"):
+            async for item in iterable:  # type: ignore
+                yield item
+            return
+        if isinstance(iterable, (list, tuple)):
+            for item in iterable:
+                yield item
+            return
+        iterator = iter(iterable)  # type: ignore
+        done = object()
+        try:
+            while (item := await self.run_sync(next, iterator, done)) is not done:
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    async def write_stream(self, stream: "Iterable | AsyncIterable", chunked: bool):
+        """
+        Writes a streamed body to the transport, waiting for the client to catch up
+        (`drain`) after every chunk.
+        """
+        try:
+            async for chunk in self.iterate(stream):
+                if chunk:
+                    self._write_chunk(chunk, chunked)
+                    await self.drain()
+            if chunked:
+                self.transport.write(b"0\r\n\r\n")
+            else:
+                self.transport.close()
+        except ConnectionResetError:
+            pass
+
+    def _write_chunk(self, chunk: "bytes | str", chunked: bool):
+        if chunked:
+            self.transport.write(encode_chunk(chunk))
+        else:
+            self.transport.write(chunk.encode() if isinstance(chunk, str) else chunk)
+
+    def send_events(self, events: "Iterable[Event] | AsyncIterable[Event]") -> None:
+        """
+        Starts an event stream (`text/event-stream`) with the events of a `@server.stream` listener.
+        The connection is closed once the stream ends.
+        """
+        self.keep_alive = False
+        self.transport.writelines(
+            [
+                self.status_line(200),
+                date_header(),
+                self.server_header,
+                b"Content-Type: text/event-stream\r\n"
+                b"Cache-Control: no-cache\r\n"
+                b"Connection: close\r\n\r\n",
+            ]
         )
-        self.send_data(f"Content-Length: {len(response.body)}\r\n")
-        self.send_data(f"Date: {dt.utcnow()}\r\n")
-        self.send_data(f"Server: {self.server_version}\r\n")
-        for header_key, header_value in response.headers.items():
-            self.send_data(f"{header_key}: {header_value}\r\n")
-        self.send_data("\r\n")
-        self.send_data(response.body)
-
-    def error(self, code: int, message: str, body: str = ""):
-        self.respond(code, message, body)
-        self.transport.close()
+        if self.omit_body:
+            self.discard(events)
+            self.finish_response()
+            return
+        self.create_task(self.write_events(events)).add_done_callback(self._finish_body)
+
+    def discard(self, stream: "Iterable | AsyncIterable") -> None:
+        """
+        Closes a streamed body that won't be sent (the response to a `HEAD`), so a generator
+        that already started runs its `finally` blocks now instead of whenever it's garbage
+        collected.
+        """
+        if hasattr(stream, "aclose"):
+            # async generators can only be closed on the loop
+            self.create_task(stream.aclose())  # type: ignore
+        elif hasattr(stream, "close"):
+            # generators, and coroutines that would have returned one
+            stream.close()  # type: ignore
+
+    async def write_events(self, events: "Iterable[Event] | AsyncIterable[Event]"):
+        """
+        Writes events as they're produced, waiting for the client to catch up between them,
+        until the stream ends, yields a `close` event, or the client disconnects.
+        """
+        try:
+            if isawaitable(events):
+                # `async def` listeners that return their generator
+                events = await events
+            async for event in self.iterate(events):  # type: ignore
+                self.transport.write(event.to_bytes())
+                if event.event_name == "close":
+                    break
+                await self.drain()
+        except ConnectionResetError:
+            pass
+        except Exception as e:
+            # too late for a 500, the stream just ends
+            if self.debug:
+                print_exc(e)
+
+    def respond_runtime(self, path: str) -> None:
+        "Responds with a file of the vendored brython runtime, like `Handler.respond_runtime`."
+        file = self.brython_runtime.get(path)  # type: ignore
+        if file is None:
+            self.error(404, message=path)
+            return
+        code, body, headers = file.negotiate(
+            self.headers.get("Accept-Encoding"), self.headers.get("If-None-Match")
+        )
+        head = [self.status_line(code), date_header(), self.server_header]
+        if not self.keep_alive:
+            head.append(b"Connection: close\r\n")
+        head += (encode_headers(headers), b"\r\n")
+        if not self.omit_body:
+            head.append(body)
+        self.transport.writelines(head)
+        self.finish_response()
+
+    async def brython_page(self, path: str) -> Response:
+        "Returns a brython page like `Handler` does, only touching the disk on the executor."
+        directory = f"{self.page_dir}{path}"
+        body = self.brython_cache.fresh(directory)
+        if body is None:
+            body = await self.run_sync(self.brython_cache.get, directory)
+        return Response(self).set_body(body).set_header("Content-Type", "text/html")
+
+    def error(self, code: int, *, message: "str | None" = None, traceback: str = "", **kwargs):
+        """
+        Responds with the error page for `code` from `error_dir`, or the built-in one.
+        """
+        error_page_path = self.error_page(code)
+        if error_page_path is not None:
+            self.respond_file(code, error_page_path, self.error_cache)
+            return
+        self.respond(code, STATUS_MESSAGES.get(code, ""), error_body(code, message or "", traceback))
+        if self.debug:
+            print(f"Error {code} occured, but no error page was found at {self.error_dir}/{code}/.html.")
+        self.finish_response()
 
     @staticmethod
     def _make_method(http_method: Callable):
@@ -90,30 +723,62 @@ class AsyncHandler(asyncio.Protocol):
         return method
 
     def data_received(self, data: bytes) -> None:
+        if self.parser is None:
+            return
         try:
-            # headers
-            headers = data.split(b"\r\n\r\n")[0]
-            # exclude first line because it's the method
-            headers = b"\r\n".join(headers.split(b"\r\n")[1:])
-            client_headers = {}
-            # limit to 3 b" " splits
-            self.method, self.path, self.protocol_version = map(
-                bytes.decode, data.split(b" ")[:3]
-            )
-            self.method, self.protocol_version = map(
-                str.upper, (self.method, self.protocol_version)
-            )
+            requests = self.parser.feed(data)
+        except ParseError as e:
+            # the rest of the stream can't be trusted: the requests before it are answered,
+            # then the error, then the connection is closed
+            self.parser = None
+            self.pending.extend(e.requests)
+            self.pending.append(e)
+        else:
+            self.pending.extend(requests)
+        self.next_request()
+        self.update_reading()
+
+    def reject(self, error: ParseError) -> None:
+        "Answers a request that couldn't be parsed, and closes the connection."
+        self.keep_alive = False
+        self.omit_body = False
+        self.respond(error.code, STATUS_MESSAGES[error.code], str(error))
+        self.finish_response()
 
-            for line in headers.split(b"\r\n"):
-                name, value = line.split(b": ")
-                client_headers[name.decode()] = value.decode()
+    def next_request(self) -> None:
+        "Starts on the oldest pending request, unless one is already being answered."
+        if (
+            self.busy
+            or not self.pending
+            or self.transport.is_closing()
+            # the client isn't reading, don't pile more responses onto the buffer
+            or not self._can_write.is_set()
+        ):
+            return
+        self.busy = True
+        request = self.pending.popleft()
+        self.update_reading()
+        if isinstance(request, ParseError):
+            self.reject(request)
+        else:
+            self.handle_request(request)
 
-            # body
-            body: str = data.split(b"\r\n\r\n")[1].decode()
-            if self.headers.get("Content-Type") == "application/json":
-                body: "dict|list" = json.loads(body)
+    def handle_request(self, request: ParsedRequest) -> None:
+        try:
+            self.method = request.method
+            self.command = self.method.lower()
+            self.path = request.path
+            self.protocol_version = self.request_version = request.version
+            self.headers = request.headers
+            self.keep_alive = request.keep_alive
+            self.omit_body = request.method == "HEAD"
+            self.body = request.body
+            self._json = _UNPARSED
+            self.client_address = self.transport.get_extra_info(
+                "peername"
+            )  # if that doesnt work, go here: https://stackoverflow.com/questions/61963107/when-asyncio-transport-get-extra-infopeername-returns-none
 
-            if self.method in (
+            if self.method not in (
                 "GET",
                 "POST",
                 "PUT",
@@ -123,42 +788,104 @@ class AsyncHandler(asyncio.Protocol):
                 "HEAD",
                 "TRACE",
             ):
-                # check for stream under GET
-                ...
-                # check for gql under POST
-                ...
-                # try file serve
-                ...
-                # also try brython
-                # searh from reponses dict
-                self.command = self.method.lower()
-                for func_path in self.responses[self.command]:
-                    self.client_address = self.transport.get_extra_info(
-                        "peername"
-                    )  # if that doesnt work, go here: https://stackoverflow.com/questions/61963107/when-asyncio-transport-get-extra-infopeername-returns-none
-
-                    matched, kwargs = self.match_route(self.path, func_path)
-                    if matched:
-                        self.create_task(
-                            self.responses[self.command][func_path](
-                                Request(self, params=kwargs), Response(self)
-                            )
-                        ).add_done_callback(
-                            lambda task: self.send_response(task.result())
-                        )
-                        return
+                self.error(405, message=self.path)
+                return
+            route_path = self.path.split("?", 1)[0]
+
+            # streams
+            if self.headers.get("Accept") == "text/event-stream":
+                matched = self.route_trees["stream"].lookup(route_path)
+                if matched is not None:
+                    func, kwargs = matched
+                    self.send_events(func(self.new_request(kwargs), StreamResponse(self)))
+                    return
+
+            # GQL
+            if self.path in self.gql_endpoints:
+                self.dispatch(
+                    self.gql_endpoints[self.path], self.new_request({}), GQLResponse(self)
+                )
+                return
 
-                # otherwise, 404
+            # file serve, `HEAD` gets the same headers as `GET` would
+            if self.command in ("get", "head"):
+                if self.brython_runtime is not None and route_path.startswith(RUNTIME_ROUTE):
+                    self.respond_runtime(route_path)
+                    return
+                path = self.path
+                if "." in path.split("/")[-1]:
+                    extension = path.split("/")[-1].split(".")[-1].lower()
+                    # everything up to the .
+                    path = path[: -len(extension) - 1]
                 else:
-                    self.error(
-                        404, message=f"Not Found", body=f"Path {self.path} not found"
+                    # otherwise, assume html
+                    extension = "html"
+
+                py_files = self.brython_scripts(path) if extension == "html" else ()
+                if extension == "html" and not py_files:
+                    filename = self.serve_filename(path, extension)
+                    if filename is not None:
+                        self.respond_file(200, filename)
+                        return
+                elif extension == "html" and self.brython:
+                    self.create_task(self.brython_page(path)).add_done_callback(
+                        self._send_result
                     )
-            else:
-                self.error(405, "Method Not Allowed")
+                    return
+                elif extension in ["css", "js", "py"]:
+                    filename = self.serve_filename(path, extension)
+                    if filename is not None:
+                        self.respond_file(200, filename)
+                        return
+
+            # search the compiled route tree
+            matched = self.route_trees[self.command].lookup(route_path)
+            if matched is not None:
+                func, kwargs = matched
+                self.dispatch(func, self.new_request(kwargs), self.new_response())
+                return
 
+            # otherwise, 404
+            self.error(404, message=self.path)
+
+        except Exception as e:
+            self._internal_error(e)
+
+    def dispatch(self, func: Callable, request: Request, response: Response) -> None:
+        "Calls a listener and sends what it returns, awaiting it first if it's a coroutine."
+        result = func(request, response)
+        if isawaitable(result):
+            self.create_task(result).add_done_callback(self._send_result)  # type: ignore
+        else:
+            self.complete(result)
+
+    def _send_result(self, task: asyncio.Task) -> None:
+        try:
+            self.complete(task.result())
         except Exception as e:
+            self._internal_error(e)
+
+    def complete(self, response: Response) -> None:
+        "Sends the `Response` a listener returned."
+        if isinstance(response, GQLResponse):
+            self.create_task(self._complete_gql(response))
+            return
+        self.send_response(response)
+
+    async def _complete_gql(self, response: GQLResponse) -> None:
+        try:
+            # sync resolvers would block every connection, so the query is executed on the
+            # executor, and only async resolvers are awaited back on the loop
+            await response.prepare_async(self.run_sync)
+        except Exception as e:
+            self._internal_error(e)
+            return
+        self.send_response(response)
+
+    def _internal_error(self, e: Exception) -> None:
+        if self.debug:
             print_exc(e)
-            self.error(500, "Internal Server Error")
+        self.error(500, message=str(e), traceback=format_exc() if self.debug else "")
 
     # @_make_method
     # def do_GET(self):
@@ -0,0 +1,407 @@
+"""
+Responsible for brython pages: page directories with a `.html` file and one or more python
+scripts, which are injected into the html and run in the browser by brython.
+
+Assembled pages are kept in memory (`PageCache`) and can be built ahead of time with
+`build_pages`, or from the command line with `python -m http_plus_purplelemons_dev.server --build`.
+
+The brython runtime itself comes from jsDelivr, unless the server has a vendored copy
+(`Runtime`, see `Server(brython_runtime=...)`) to serve under `RUNTIME_ROUTE`.
+"""
+
+from dataclasses import dataclass
+from hashlib import sha256
+from time import monotonic
+from typing import Iterable
+import ast
+import json
+import os
+from .cache import LRUCache, mtimes
+from .compression import choose_encoding, precompress
+from .ranges import etag_matches
+
+BUILT_PAGE = ".brython.html"
+"The name `build_pages` gives an assembled page, in its page directory."
+CDN_SCRIPTS = (
+    "https://cdn.jsdelivr.net/npm/brython@3/brython.min.js",
+    "https://cdn.jsdelivr.net/npm/brython@3/brython_stdlib.js",
+)
+"The runtime pages link to when the server doesn't have a `Runtime`."
+RUNTIME_ROUTE = "/_brython/"
+"The path a `Runtime` is served under."
+RUNTIME_CACHE_CONTROL = "public, max-age=31536000, immutable"
+"Runtime urls include a hash of their content, so browsers never need to ask for them again."
+
+
+def inject_brython(
+    html: str, py_scripts: "Iterable[str]", runtime_scripts: "Iterable[str]" = CDN_SCRIPTS
+) -> str:
+    """
+    Adds the brython runtime and a page's python scripts to its html, and runs brython on load.
+
+    Args:
+        html (str): The page's html, which must have a `<body>` tag.
+        py_scripts (Iterable[str]): The source of each python script.
+        runtime_scripts (Iterable[str]): The urls of brython and its stdlib. Defaults to jsDelivr's.
+    """
+    body_location = html.index("<body")
+    # insert `onload="brython()"` into body tag
+    html = html[: body_location + 5] + ' onload="brython()"' + html[body_location + 5 :]
+
+    end_of_body = html.index("</body>")
+    script_injection = "".join(f'<script src="{src}"></script>\n' for src in runtime_scripts)
+    for py_script in py_scripts:
+        script_injection += f'<script type="text/python">{py_script}</script>\n'
+
+    return html[:end_of_body] + script_injection + html[end_of_body:]
+
+
+def page_sources(directory: str) -> "tuple[str, ...]":
+    "Returns the files a brython page is assembled from: its `.html`, then its scripts in name order."
+    scripts = sorted(file for file in os.listdir(directory) if file.endswith(".py"))
+    return (f"{directory}/.html", *(f"{directory}/{script}" for script in scripts))
+
+
+def page_directories(page_dir: str) -> "Iterable[str]":
+    "Yields every brython page directory under `page_dir`."
+    for directory, _, files in os.walk(page_dir):
+        # same rule as `Handler.brython_scripts`
+        if ".html" in files and ".py" in files:
+            yield directory
+
+
+def read_scripts(directory: str) -> "list[str]":
+    "Returns the source of each of a page directory's scripts, in name order."
+    py_scripts = []
+    for script in page_sources(directory)[1:]:
+        with open(script, "r") as f:
+            py_scripts.append(f.read())
+    return py_scripts
+
+
+def assemble_page(directory: str, runtime: "Runtime | None" = None) -> bytes:
+    """
+    Reads a page directory's html and scripts and returns the encoded page.
+
+    Args:
+        directory (str): The page directory.
+        runtime (Runtime): The vendored runtime to link to. Defaults to jsDelivr's.
+    """
+    with open(page_sources(directory)[0], "r") as f:
+        page = f.read()
+    py_scripts = read_scripts(directory)
+    runtime_scripts = CDN_SCRIPTS if runtime is None else runtime.scripts(py_scripts)
+    return inject_brython(page, py_scripts, runtime_scripts).encode()
+
+
+def script_imports(py_scripts: "Iterable[str]") -> "set[str] | None":
+    """
+    Returns every module the scripts import, or `None` if one of them doesn't parse (in
+    which case there's no telling). `from a import b` counts as importing `a` and `a.b`,
+    since `b` may be a submodule.
+    """
+    imports: set[str] = set()
+    for py_script in py_scripts:
+        try:
+            tree = ast.parse(py_script)
+        except SyntaxError:
+            return None
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                imports.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                imports.add(node.module)
+                imports.update(f"{node.module}.{alias.name}" for alias in node.names)
+    return imports
+
+
+@dataclass
+class RuntimeFile:
+    """
+    A file of a `Runtime`, held in memory along with its compressed variants.
+
+    Attributes:
+        body (bytes): The file.
+        variants (dict[str,bytes]): `Content-Encoding` values mapped to the compressed file.
+        etag (str): The uncompressed file's `ETag`, from the same hash as its url.
+    """
+
+    body: bytes
+    variants: "dict[str, bytes]"
+    etag: str
+
+    def variant_etag(self, encoding: "str | None") -> str:
+        "Returns the `ETag` of the variant for `encoding`, each one is a different set of bytes."
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+    def negotiate(
+        self, accept_encoding: "str | None", if_none_match: "str | None" = None
+    ) -> "tuple[int, bytes, list[tuple[str, str]]]":
+        """
+        Returns the status, body and headers to send for a request's `Accept-Encoding` and
+        `If-None-Match` headers: a `304` if the client has the variant it would get already.
+        """
+        encoding = choose_encoding(accept_encoding, self.variants)
+        etag = self.variant_etag(encoding)
+        headers = [
+            ("Cache-Control", RUNTIME_CACHE_CONTROL),
+            ("ETag", etag),
+            ("Vary", "Accept-Encoding"),
+        ]
+        if if_none_match is not None and etag_matches(if_none_match, etag):
+            return 304, b"", headers
+        body = self.body if encoding is None else self.variants[encoding]
+        headers += [("Content-Type", "text/javascript"), ("Content-Length", f"{len(body)}")]
+        if encoding is not None:
+            headers.append(("Content-Encoding", encoding))
+        return 200, body, headers
+
+
+class Runtime:
+    """
+    A vendored copy of brython, served by the server itself under `RUNTIME_ROUTE` instead of
+    linking pages to jsDelivr. Works offline, and saves the browser a connection to a third party.
+
+    Every file is held in memory with gzip (and brotli, if installed) variants compressed
+    ahead of time. `.gz`/`.br` files next to the runtime's files are used instead of
+    compressing them again. Urls contain a hash of the file, so they're sent with
+    `Cache-Control: immutable`.
+
+    Rather than brython's whole stdlib (a few MB), each page gets a bundle of just the modules
+    its scripts import and what those import in turn, like `brython-cli make_modules` does.
+
+    Example:
+    >>> runtime = Runtime("./brython")  # has brython.min.js and brython_stdlib.js
+    >>> runtime.scripts(["from browser import document"])
+    ('/_brython/5e1d.../brython.min.js', '/_brython/93ab.../brython_modules.js')
+    """
+
+    def __init__(self, directory: str, page_dir: "str | None" = None, trim_stdlib: bool = True):
+        """
+        Args:
+            directory (str): Has `brython.min.js` (or `brython.js`) and `brython_stdlib.js`, as
+                found in brython's releases.
+            page_dir (str): Bundles are made for the pages in here straight away, so pages
+                assembled by `build_pages` link to bundles the server already has.
+            trim_stdlib (bool): Whether to bundle only the imported modules. Pages that import
+                modules dynamically (`__import__`) need the whole stdlib.
+        """
+        self.directory = directory
+        self.files: dict[str, RuntimeFile] = {}
+        "Urls mapped to the files served under them."
+        core = "brython.min.js"
+        if not os.path.exists(f"{directory}/{core}"):
+            core = "brython.js"
+        self.core_url = self._add(core, *self._read(core))
+        self._stdlib_url: "str | None" = None
+        self.vfs: "dict[str, list] | None" = None
+        "brython's stdlib, module names mapped to `[extension, source, imports, is_package?]`."
+        if trim_stdlib:
+            self.vfs = self._parse_stdlib(self._read("brython_stdlib.js")[0])
+        if page_dir is not None:
+            for page in page_directories(page_dir):
+                self.scripts(read_scripts(page))
+
+    def _read(self, name: str) -> "tuple[bytes, dict[str, bytes] | None]":
+        "Reads one of the runtime's files, and its precompressed variants if it has any."
+        with open(f"{self.directory}/{name}", "rb") as f:
+            body = f.read()
+        mtime = os.stat(f"{self.directory}/{name}").st_mtime_ns
+        variants = {}
+        for encoding, extension in (("br", "br"), ("gzip", "gz")):
+            compressed = f"{self.directory}/{name}.{extension}"
+            # one older than the file is left over from a previous version
+            if os.path.exists(compressed) and os.stat(compressed).st_mtime_ns >= mtime:
+                with open(compressed, "rb") as f:
+                    variants[encoding] = f.read()
+        return body, variants or None
+
+    @staticmethod
+    def _parse_stdlib(stdlib: bytes) -> "dict[str, list] | None":
+        """
+        Pulls the modules out of `brython_stdlib.js`, which is a script assigning them to
+        `var scripts = {...}`. `None` if it isn't in that format.
+        """
+        text = stdlib.decode()
+        start = text.find("{", text.find("var scripts"))
+        end = text.rfind("}") + 1
+        try:
+            vfs = json.loads(text[start:end])
+        except ValueError:
+            return None
+        return vfs if isinstance(vfs, dict) else None
+
+    def _add(self, name: str, body: bytes, variants: "dict[str, bytes] | None" = None) -> str:
+        "Serves `body` as `name`, under a url with its hash. Returns the url."
+        digest = sha256(body).hexdigest()[:16]
+        url = f"{RUNTIME_ROUTE}{digest}/{name}"
+        if url not in self.files:
+            self.files[url] = RuntimeFile(
+                body, precompress(body) if variants is None else variants, f'"{digest}"'
+            )
+        return url
+
+    @property
+    def stdlib_url(self) -> str:
+        "The url of the whole stdlib, only loaded and compressed once a page needs it."
+        if self._stdlib_url is None:
+            self._stdlib_url = self._add("brython_stdlib.js", *self._read("brython_stdlib.js"))
+        return self._stdlib_url
+
+    def modules(self, imports: "Iterable[str]") -> "set[str]":
+        "Returns the stdlib modules needed to import `imports`: them, their parents, and their imports."
+        vfs: dict[str, list] = self.vfs  # type: ignore
+        needed: set[str] = set()
+        todo = list(imports)
+        while todo:
+            name = todo.pop()
+            if name in needed or name not in vfs:
+                # not from the stdlib (or not a module), brython looks for it elsewhere
+                continue
+            needed.add(name)
+            if len(vfs[name]) > 2:
+                todo.extend(vfs[name][2])
+            if "." in name:
+                todo.append(name.rsplit(".", 1)[0])
+        return needed
+
+    def scripts(self, py_scripts: "Iterable[str]") -> "tuple[str, str]":
+        """
+        Returns the urls of brython and of the stdlib bundle a page with these scripts needs.
+        The bundle is made (and compressed) the first time a page needs it.
+        """
+        imports = script_imports(py_scripts) if self.vfs is not None else None
+        if imports is None:
+            return self.core_url, self.stdlib_url
+        vfs: dict[str, list] = self.vfs  # type: ignore
+        bundle = {"$timestamp": vfs.get("$timestamp", 0)}
+        bundle.update((name, vfs[name]) for name in sorted(self.modules(imports)))
+        encoded = (
+            "__BRYTHON__.use_VFS = true;\n"
+            f"var scripts = {json.dumps(bundle, separators=(',', ':'))}\n"
+            "__BRYTHON__.update_VFS(scripts)\n"
+        ).encode()
+        return self.core_url, self._add("brython_modules.js", encoded)
+
+    def get(self, url: str) -> "RuntimeFile | None":
+        "Returns the file served under `url`, if there is one."
+        return self.files.get(url)
+
+
+@dataclass
+class Page:
+    """
+    An assembled brython page held by `PageCache`.
+
+    Attributes:
+        body (bytes): The encoded page.
+        paths (tuple[str,...]): The page directory and the files the page was assembled from.
+        mtimes (tuple[int|None,...]): The modification times of `paths` when it was assembled.
+        checked_at (float): When `mtimes` were last compared against the disk (`time.monotonic`).
+    """
+
+    body: bytes
+    paths: "tuple[str, ...]"
+    mtimes: "tuple[int | None, ...]"
+    checked_at: float
+
+
+class PageCache:
+    """
+    Keeps assembled brython pages in memory, so serving one costs the same as serving a
+    static file. A page is re-assembled when its directory (a script added or removed), its
+    html or one of its scripts changes, which is checked at most every `revalidate_after` seconds.
+
+    Pages built by `build_pages` are used instead of assembling them, as long as they're
+    newer than everything they were built from and link to the same runtime.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        revalidate_after: float = 1.0,
+        runtime: "Runtime | None" = None,
+    ):
+        """
+        Args:
+            maxsize (int): How many pages to keep.
+            revalidate_after (float): Seconds between checks of a cached page's files.
+            runtime (Runtime): The vendored runtime pages link to. Defaults to jsDelivr's.
+        """
+        self.pages = LRUCache(maxsize)
+        self.revalidate_after = revalidate_after
+        self.runtime = runtime
+
+    def fresh(self, directory: str) -> "bytes | None":
+        """
+        Returns the cached page if it was checked against the disk recently, without touching
+        the disk. Otherwise `None`, and `get` has to be called.
+        """
+        page: Page | None = self.pages.get(directory)
+        if page is not None and monotonic() - page.checked_at < self.revalidate_after:
+            return page.body
+        return None
+
+    def get(self, directory: str) -> bytes:
+        """
+        Returns the assembled page for a page directory, assembling it if needed.
+
+        Args:
+            directory (str): The page directory, which has a `.html` and at least one `.py` file.
+        """
+        now = monotonic()
+        page: Page | None = self.pages.get(directory)
+        if page is not None:
+            if now - page.checked_at < self.revalidate_after:
+                return page.body
+            if mtimes(page.paths) == page.mtimes:
+                page.checked_at = now
+                return page.body
+        paths = (directory, *page_sources(directory))
+        # mtimes are taken before reading so a change made mid-read is caught next time
+        current = mtimes(paths)
+        body = self._built(directory, current)
+        if body is None:
+            body = assemble_page(directory, self.runtime)
+        self.pages[directory] = Page(body, paths, current, now)
+        return body
+
+    def _built(self, directory: str, sources: "tuple[int | None, ...]") -> "bytes | None":
+        "Returns the page `build_pages` wrote, if it's up to date."
+        try:
+            built = os.stat(f"{directory}/{BUILT_PAGE}").st_mtime_ns
+        except OSError:
+            return None
+        if None in sources or built < max(sources):  # type: ignore
+            return None
+        with open(f"{directory}/{BUILT_PAGE}", "rb") as f:
+            body = f.read()
+        # built against another runtime (or the CDN), its script urls are wrong here
+        core_url = CDN_SCRIPTS[0] if self.runtime is None else self.runtime.core_url
+        if f'src="{core_url}"'.encode() not in body:
+            return None
+        return body
+
+    def clear(self) -> None:
+        self.pages.clear()
+
+
+def build_pages(page_dir: str, runtime: "Runtime | None" = None) -> "list[str]":
+    """
+    Assembles every brython page under `page_dir` ahead of time, writing each one to a
+    `.brython.html` file in its page directory.
+
+    Args:
+        page_dir (str): The directory pages are served from.
+        runtime (Runtime): The vendored runtime the pages link to, which must be the one
+            the server uses. Defaults to jsDelivr's.
+    Returns:
+        list[str]: The files written.
+    """
+    written = []
+    for directory in page_directories(page_dir):
+        target = f"{directory}/{BUILT_PAGE}"
+        with open(target, "wb") as f:
+            f.write(assemble_page(directory, runtime))
+        written.append(target)
+    return written
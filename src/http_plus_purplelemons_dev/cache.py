@@ -0,0 +1,272 @@
+"""
+Responsible for the in-memory caches the handlers use to avoid repeating work across requests.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import formatdate
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Hashable, TypeVar
+import os
+from .content_types import detect_content_type
+from .ranges import make_etag
+
+T = TypeVar("T")
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    A thread-safe, size bounded mapping that evicts the least recently used entry first.
+
+    By default every entry counts as 1 towards `maxsize`. Pass `weigh` to bound the cache
+    by something else, e.g. `weigh=len` to bound it by the total size of its values.
+
+    Example:
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache["a"] = 1
+    >>> cache.get("a")
+    1
+    """
+
+    def __init__(self, maxsize: int = 1024, weigh: "Callable[[Any], int] | None" = None):
+        self.maxsize = maxsize
+        self.weigh = weigh
+        self.weight = 0
+        "The combined weight of every entry currently in the cache."
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def _weight_of(self, value: Any) -> int:
+        return 1 if self.weigh is None else self.weigh(value)
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            if key in self._data:
+                self.weight -= self._weight_of(self._data[key])
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self.weight += self._weight_of(value)
+            while self.weight > self.maxsize and self._data:
+                _, evicted = self._data.popitem(last=False)
+                self.weight -= self._weight_of(evicted)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self.weight -= self._weight_of(value)
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+
+def mtimes(paths: "tuple[str, ...]") -> "tuple[int | None, ...]":
+    """
+    Returns the modification time (in ns) of each path, or `None` for paths that don't exist.
+    """
+    result: list[int | None] = []
+    for path in paths:
+        try:
+            result.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            result.append(None)
+    return tuple(result)
+
+
+class ResolutionCache:
+    """
+    Remembers the result of a filesystem lookup, including "not found", until the mtime
+    of one of the directories it depends on changes.
+
+    Directory mtimes are only re-checked once an entry is older than `revalidate_after`
+    seconds, so a cached lookup is a single dict hit in the common case.
+    """
+
+    def __init__(self, maxsize: int = 1024, revalidate_after: float = 1.0):
+        self.entries = LRUCache(maxsize)
+        self.revalidate_after = revalidate_after
+
+    def get(self, key: Hashable, resolve: Callable[[], T], dirs: "tuple[str, ...]") -> T:
+        """
+        Args:
+            key (Hashable): What the lookup is cached under.
+            resolve (Callable): Does the actual lookup on a cache miss.
+            dirs (tuple[str,...]): The directories whose contents decide the result of `resolve`.
+        Returns:
+            The cached or freshly resolved value.
+        """
+        now = monotonic()
+        entry = self.entries.get(key, _MISSING)
+        if entry is not _MISSING:
+            value, checked_mtimes, checked_at = entry
+            if now - checked_at < self.revalidate_after:
+                return value
+            current = mtimes(dirs)
+            if current == checked_mtimes:
+                self.entries[key] = (value, current, now)
+                return value
+        else:
+            current = mtimes(dirs)
+        # mtimes are taken before resolving so a change made mid-lookup is caught next time
+        value = resolve()
+        self.entries[key] = (value, current, now)
+        return value
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+def file_headers(filename: str, stat: os.stat_result) -> "list[tuple[str, str]]":
+    """
+    Returns the entity headers sent along with a file: `Content-type`, `Content-length`,
+    `Accept-Ranges`, `ETag` and `Last-Modified`.
+    """
+    return [
+        ("Content-type", detect_content_type(filename)),
+        ("Content-length", f"{stat.st_size}"),
+        *validator_headers(stat.st_mtime_ns, stat.st_size),
+    ]
+
+
+def compressed_file_headers(
+    content_type: str, compressed: bytes, encoding: str, mtime_ns: int, size: int
+) -> "list[tuple[str, str]]":
+    """
+    Returns the entity headers sent along with a compressed version of a file. Its `ETag` is
+    weak, since it isn't byte-for-byte the file, and there's no `Accept-Ranges`.
+    """
+    return [
+        ("Content-type", content_type),
+        ("Content-length", f"{len(compressed)}"),
+        ("Content-Encoding", encoding),
+        ("ETag", f"W/{make_etag(mtime_ns, size)}"),
+        ("Last-Modified", formatdate(mtime_ns / 1e9, usegmt=True)),
+    ]
+
+
+def validator_headers(mtime_ns: int, size: int) -> "list[tuple[str, str]]":
+    """
+    Returns the headers a client needs to make conditional and range requests for a file.
+    These are also the headers sent with a `304 Not Modified`.
+    """
+    return [
+        ("Accept-Ranges", "bytes"),
+        ("ETag", make_etag(mtime_ns, size)),
+        ("Last-Modified", formatdate(mtime_ns / 1e9, usegmt=True)),
+    ]
+
+
+@dataclass
+class Asset:
+    """
+    A file held in memory by `AssetCache`.
+
+    Attributes:
+        body (bytes): The contents of the file.
+        header_block (bytes): The file's headers, already encoded as `Name: value\\r\\n` lines.
+        mtime_ns (int): The modification time of the file when it was read.
+        size (int): The size of the file when it was read.
+        checked_at (float): When the file was last compared against the disk (`time.monotonic`).
+    """
+
+    body: bytes
+    header_block: bytes
+    mtime_ns: int
+    size: int
+    checked_at: float
+
+
+class AssetCache:
+    """
+    Keeps the contents and headers of small, frequently served files in memory,
+    bounded by the total size of the cached files.
+
+    Files are re-`stat`ed at most once every `revalidate_after` seconds and re-read if
+    their mtime or size changed.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        max_file_size: "int | None" = None,
+        revalidate_after: float = 1.0,
+    ):
+        """
+        Args:
+            max_bytes (int): The combined size of every cached file.
+            max_file_size (int): Files larger than this are never cached. Defaults to `max_bytes // 16`.
+            revalidate_after (float): Seconds between checks of a cached file's mtime.
+        """
+        self.assets = LRUCache(max_bytes, weigh=lambda asset: asset.size)
+        self.max_file_size = max_bytes // 16 if max_file_size is None else max_file_size
+        self.revalidate_after = revalidate_after
+
+    def fresh(self, filename: str) -> "Asset | None":
+        """
+        Returns the cached file if it was checked against the disk recently, without touching
+        the disk. Otherwise `None`, and `get` has to be called.
+        """
+        asset: Asset | None = self.assets.get(filename)
+        if asset is not None and monotonic() - asset.checked_at < self.revalidate_after:
+            return asset
+        return None
+
+    def get(self, filename: str) -> "Asset | None":
+        """
+        Returns the cached file, loading it if needed. Returns `None` if the file is missing
+        or too large to cache, in which case it should be read from the disk as usual.
+        """
+        now = monotonic()
+        asset: Asset | None = self.assets.get(filename)
+        if asset is not None and now - asset.checked_at < self.revalidate_after:
+            return asset
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            self.assets.pop(filename)
+            return None
+        if asset is not None and (asset.mtime_ns, asset.size) == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            asset.checked_at = now
+            return asset
+        if stat.st_size > self.max_file_size:
+            self.assets.pop(filename)
+            return None
+        with open(filename, "rb") as f:
+            body = f.read()
+        if len(body) != stat.st_size:
+            # changed between the stat and the read, let the next request try again
+            return None
+        header_block = "".join(
+            f"{header}: {value}\r\n" for header, value in file_headers(filename, stat)
+        ).encode("latin-1")
+        asset = Asset(body, header_block, stat.st_mtime_ns, len(body), now)
+        self.assets[filename] = asset
+        return asset
+
+    def clear(self) -> None:
+        self.assets.clear()
@@ -2,9 +2,8 @@
 Responsible for defining communication objects and functions.
 """
 
-from json import dumps, loads
 from dataclasses import dataclass
-from typing import Any, Callable
+from typing import Any, AsyncIterable, Awaitable, BinaryIO, Callable, Iterable, Iterator
 from platform import system as detect_os
 import graphql
 from http.server import BaseHTTPRequestHandler
@@ -13,10 +12,19 @@ from os.path import exists
 import os
 from traceback import print_exception as print_exc, format_exc
 from . import __version__
-from .static_responses import SEND_RESPONSE_CODE
+from .static_responses import error_body
 from .content_types import detect_content_type
-import json
-from itertools import zip_longest
+from .routing import RouteTree, match_route
+from .cache import ResolutionCache, AssetCache, compressed_file_headers, file_headers, validator_headers
+from .ranges import ByteRanges, negotiate
+from .compression import Compression
+from . import json_backend
+from .brython import RUNTIME_ROUTE, PageCache, Runtime
+from .gql import DataLoader, QueryCache, PersistedQueryNotFound
+from inspect import isawaitable
+import asyncio
+
+_UNPARSED = object()
 
 STATUS_MESSAGES = {
     # INFORMATIONAL
@@ -87,6 +95,30 @@ STATUS_MESSAGES = {
     511: "Network Authentication Required",
 }
 
+CHUNK_SIZE = 64 * 1024
+"How much of a file-like body `Response.set_body` reads at a time."
+
+
+def encode_chunk(chunk: "bytes | str") -> bytes:
+    """
+    Frames a piece of a streamed body for `Transfer-Encoding: chunked`.
+    An empty `chunk` would end the body, so don't pass one unless that's what you mean.
+    """
+    if isinstance(chunk, str):
+        chunk = chunk.encode()
+    return b"%x\r\n%b\r\n" % (len(chunk), chunk)
+
+
+def read_chunks(file: Any) -> "Iterator[bytes | str]":
+    "Reads a file-like object `CHUNK_SIZE` at a time, closing it once it's exhausted."
+    try:
+        while chunk := file.read(CHUNK_SIZE):
+            yield chunk
+    finally:
+        close = getattr(file, "close", None)
+        if close is not None:
+            close()
+
 
 class Handler(BaseHTTPRequestHandler):
     """
@@ -121,6 +153,8 @@ class Handler(BaseHTTPRequestHandler):
         # Again, not an HTTP method. Used for GraphQL.
         "gql": {},
     }
+    route_trees: dict[str, RouteTree] = {method: RouteTree() for method in responses}
+    "Compiled versions of `responses`, filled in by `@server.<method>`."
     page_dir: str
     error_dir: str
     debug: bool
@@ -128,12 +162,46 @@ class Handler(BaseHTTPRequestHandler):
     protocol_version: str = "HTTP/1.1"
     status: int
     body: bytes = b""
-    json: dict = {}
+    _json: Any = _UNPARSED
+    "The parsed body, see `body_json`."
     brython: bool
     gql_endpoints: dict[str, Callable[..., "GQLResponse"]] = {}
     "Endpoint to GQL resolver mappings"
     gql_schemas: dict[str, str] = {}
     "Endpoint to GQL schema mappings"
+    gql_caches: dict[str, QueryCache] = {}
+    "Endpoint to built schema and query document cache mappings"
+    path_cache: ResolutionCache = ResolutionCache()
+    "Remembers which file (if any) `page_dir` has for a requested path."
+    asset_cache: "AssetCache | None" = None
+    "Opt-in in-memory cache for `respond_file`, see `Server(asset_cache_size=...)`."
+    error_cache: AssetCache = AssetCache(1024 * 1024, max_file_size=256 * 1024)
+    "Custom error pages from `error_dir`, re-read when they change."
+    brython_cache: PageCache = PageCache()
+    "Assembled brython pages."
+    brython_runtime: "Runtime | None" = None
+    "The vendored brython runtime, see `Server(brython_runtime=...)`. `None` to link to jsDelivr."
+    compression: "Compression | None" = None
+    "Opt-in response compression, see `Server(compression=...)`."
+    keep_alive_timeout: "float | None" = 5.0
+    "How long (in seconds) an idle keep-alive connection waits for its next request."
+    max_keep_alive_requests: "int | None" = 100
+    "How many requests a single connection may make before it's closed."
+    requests_handled: int = 0
+    "How many requests this connection has made so far."
+    stopping: bool = False
+    "Set once a worker is shutting down (see `workers.serve_worker`), every response then closes its connection."
+    response_started: bool = False
+    "Whether the status line of the current response has been sent."
+    omit_body: bool = False
+    "Whether the current request is a `HEAD`: its response has every header (`Content-Length` too) but no body."
+    reuse_objects: bool = False
+    "Whether a connection reuses its `Request` and `Response` objects, see `Server(reuse_objects=True)`."
+    spare_request: "Request | None" = None
+    spare_response: "Response | None" = None
+    # headers and body are separate writes, with Nagle's algorithm the body of every
+    # keep-alive response would wait for the client's delayed ACK (~40ms)
+    disable_nagle_algorithm = True
 
     @property
     def ip(self):
@@ -151,15 +219,117 @@ class Handler(BaseHTTPRequestHandler):
     def proto(self):
         return self.protocol_version
 
+    def new_request(self, params: "dict[str, str | type]") -> "Request":
+        """
+        Returns the `Request` passed to a listener. With `reuse_objects`, the one this connection
+        used for its previous request is reset instead of allocating another.
+        """
+        if not self.reuse_objects:
+            return Request(self, params=params)
+        if self.spare_request is None:
+            self.spare_request = Request(self, params=params)
+            return self.spare_request
+        return self.spare_request.reset(self, params)
+
+    def new_response(self) -> "Response":
+        "Returns the `Response` passed to a route listener, reused like `new_request`'s."
+        if not self.reuse_objects:
+            return Response(self)
+        if self.spare_response is None:
+            self.spare_response = Response(self)
+            return self.spare_response
+        return self.spare_response.reset(self)
+
+    def body_json(self) -> Any:
+        """
+        Returns the request body parsed as JSON, whatever its `Content-Type`. It's only parsed
+        once per request, by the backend in `http_plus.json_backend`.
+
+        Raises:
+            ValueError: If the body isn't valid JSON.
+        """
+        if self._json is _UNPARSED:
+            self._json = json_backend.loads(self.body)
+        return self._json
+
+    @property
+    def json(self) -> Any:
+        "The request body parsed as JSON (on first access) if it was sent as `application/json`, otherwise `{}`."
+        content_type = self.headers.get("Content-Type") or ""
+        if not self.body or content_type.split(";", 1)[0].strip() != "application/json":
+            return {}
+        return self.body_json()
+
     def custom_logger(self):
         "Override this"
         pass
 
+    def handle(self) -> None:
+        """
+        Handles requests until the client (or `keep_alive_timeout`, or
+        `max_keep_alive_requests`) closes the connection. Pipelined requests are
+        handled in the order they arrive.
+        """
+        self.close_connection = True
+        self.handle_one_request()
+        self.requests_handled += 1
+        while not self.close_connection:
+            if not self.wait_for_request():
+                return
+            self.handle_one_request()
+            self.requests_handled += 1
+
+    def wait_for_request(self) -> bool:
+        """
+        Waits up to `keep_alive_timeout` seconds for the next request on this connection.
+
+        Returns:
+            bool: Whether a request arrived (or was already buffered, when pipelining).
+        """
+        self.connection.settimeout(self.keep_alive_timeout)
+        try:
+            # returns straight away if a pipelined request is already buffered
+            return bool(self.rfile.peek(1))
+        except OSError:  # includes timeouts
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def send_response(self, code: int, message: "str | None" = None) -> None:
+        # `responses` is our routing table, so `BaseHTTPRequestHandler` can't find a reason phrase in it
+        if message is None:
+            message = STATUS_MESSAGES.get(code, "")
+        super().send_response(code, message)
+        self.response_started = True
+        if self.stopping or (
+            self.max_keep_alive_requests is not None
+            and self.requests_handled + 1 >= self.max_keep_alive_requests
+        ):
+            self.send_header("Connection", "close")
+
+    def read_chunked_body(self) -> bytes:
+        "Reads a request body sent with `Transfer-Encoding: chunked`."
+        chunks: list[bytes] = []
+        while True:
+            size = int(self.rfile.readline(65537).split(b";", 1)[0], 16)
+            if size == 0:
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline(65537)
+        # trailers
+        while self.rfile.readline(65537) not in (b"\r\n", b"\n", b""):
+            pass
+        return b"".join(chunks)
+
     def log_message(self, fmt: str, *args) -> None:
         """
         Do not override. Use `@server.log`.
         """
-        self.status = int(args[1])
+        try:
+            self.status = int(args[1])
+        except (IndexError, ValueError):
+            # `log_error` calls this too, with a different format
+            pass
         # bit of a hacky way of checking if the user has overriden the custom logger
         if self.custom_logger.__doc__ == "Override this":
             return super().log_message(fmt, *args)
@@ -175,58 +345,215 @@ class Handler(BaseHTTPRequestHandler):
         traceback: str = "",
         **kwargs,
     ) -> None:
-        error_page_path = f"{self.error_dir}/{code}/.html"
-        if exists(error_page_path):
+        error_page_path = self.error_page(code)
+        if error_page_path is not None:
+            asset = self.error_cache.get(error_page_path)
+            if asset is not None:
+                self._respond_source(
+                    code,
+                    error_page_path,
+                    asset.body,
+                    asset.mtime_ns,
+                    asset.size,
+                    asset.header_block,
+                )
+                return
             self.respond_file(code, error_page_path)
         else:
-            assert message is not None
-            assert headers is not None
             self.respond(
                 code=code,
-                headers=headers,
-                message=SEND_RESPONSE_CODE(
-                    code=code, path=message, traceback=traceback, **kwargs
-                ),
+                headers=headers or {},
+                message=error_body(code, message or "", traceback),
             )
             if self.debug:
                 print(
-                    f"Error {code} occured, but no error page was found at {error_page_path}."
+                    f"Error {code} occured, but no error page was found at {self.error_dir}/{code}/.html."
                 )
 
+    def error_page(self, code: int) -> "str | None":
+        """
+        Returns the custom page `error_dir` has for `code`, if any. Cached (including misses)
+        in `path_cache` until the directories involved change, so a flood of 404s doesn't
+        `stat` anything.
+        """
+        directory = f"{self.error_dir}/{code}"
+        return self.path_cache.get(
+            ("error", self.error_dir, code),
+            lambda: f"{directory}/.html" if exists(f"{directory}/.html") else None,
+            (directory, self.error_dir),
+        )
+
     def respond_file(self, code: int, filename: str) -> None:
         """
         Responds to the client with a file.
         The filename (filepath) must be relative to the root directory of the server.
 
+        `200` responses honor the request's `If-None-Match`/`If-Modified-Since` (`304`)
+        and `Range`/`If-Range` (`206`, `416`) headers.
+
         Args:
             code (int): The HTTP status code to respond with.
             filename (str): The file to respond with.
         """
-        self.send_response(code)
-        self.send_header("Content-type", detect_content_type(filename))
+        asset = self.asset_cache.get(filename) if self.asset_cache is not None else None
+        if asset is not None:
+            self._respond_source(
+                code,
+                filename,
+                asset.body,
+                asset.mtime_ns,
+                asset.size,
+                asset.header_block,
+            )
+            return
         with open(filename, "rb") as f:
-            self.send_header("Content-length", f"{os.path.getsize(filename)}")
+            stat = os.fstat(f.fileno())
+            self._respond_source(code, filename, f, stat.st_mtime_ns, stat.st_size)
+
+    def _respond_source(
+        self,
+        code: int,
+        filename: str,
+        source: "bytes | BinaryIO",
+        mtime_ns: int,
+        size: int,
+        header_block: bytes = b"",
+    ) -> None:
+        "Sends `source` (an asset's bytes or an open file) as the response for `filename`."
+        ranges = None
+        if code == 200:
+            code, ranges = negotiate(
+                self.headers, size, mtime_ns, detect_content_type(filename)
+            )
+        self.send_response(code)
+        if code == 304:
+            for header, value in validator_headers(mtime_ns, size):
+                self.send_header(header, value)
+            self.end_headers()
+            return
+        if code == 416:
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-length", "0")
             self.end_headers()
-            self.wfile.write(f.read())
+            return
+        if ranges is not None:
+            for header, value in (*ranges.headers(), *validator_headers(mtime_ns, size)):
+                self.send_header(header, value)
+            self.end_headers()
+            if not self.omit_body:
+                self.write_ranges(source, ranges)
+            return
+        if code == 200 and self.compression is not None:
+            content_type = detect_content_type(filename)
+            if self.compression.compressible(content_type, size):
+                self.send_header("Vary", "Accept-Encoding")
+                encoding = self.compression.encoding(self.headers.get("Accept-Encoding"))
+                compressed = None
+                if encoding is not None:
+                    compressed = self.compression.static_variant(filename, mtime_ns, size, encoding)
+                if compressed is not None:
+                    for header, value in compressed_file_headers(
+                        content_type, compressed, encoding, mtime_ns, size  # type: ignore
+                    ):
+                        self.send_header(header, value)
+                    self.end_headers()
+                    if not self.omit_body:
+                        self.wfile.write(compressed)
+                    return
+        if header_block:
+            # the header lines are already encoded, skip `send_header`'s per-header formatting
+            self._headers_buffer.append(header_block)
+        else:
+            for header, value in file_headers(filename, os.fstat(source.fileno())):  # type: ignore
+                self.send_header(header, value)
+        self.end_headers()
+        if self.omit_body:
+            return
+        if isinstance(source, bytes):
+            self.wfile.write(source)
+        else:
+            self.write_file(source)
+
+    def write_ranges(self, source: "bytes | BinaryIO", ranges: ByteRanges) -> None:
+        """
+        Writes the body of a `206 Partial Content` response.
+
+        Args:
+            source (bytes|BinaryIO): The whole file, either in memory or opened in binary mode.
+            ranges (ByteRanges): The parts of the file to send.
+        """
+        for prefix, start, end in ranges.parts():
+            if prefix:
+                self.wfile.write(prefix)
+            if end > start:
+                if isinstance(source, bytes):
+                    self.wfile.write(memoryview(source)[start:end])
+                else:
+                    self.write_file(source, start, end - start)
 
-    def respond(self, code: int, message: str, headers: dict[str, str]) -> None:
+    def write_file(self, file: BinaryIO, offset: int = 0, count: "int | None" = None) -> None:
+        """
+        Writes an open file straight to the client's socket. Uses `os.sendfile` where the
+        platform supports it, so the file is never copied into Python memory.
+
+        Args:
+            file (BinaryIO): The file to send, opened in binary mode.
+            offset (int): Where in the file to start.
+            count (int): How many bytes to send. Defaults to the rest of the file.
+        """
+        self.wfile.flush()
+        self.connection.sendfile(file, offset, count)
+
+    def respond_runtime(self, path: str) -> None:
+        """
+        Responds with a file of the vendored brython runtime, compressed if the client accepts it.
+
+        Args:
+            path (str): The requested path, under `RUNTIME_ROUTE`.
+        """
+        file = self.brython_runtime.get(path)  # type: ignore
+        if file is None:
+            self.error(404, message=path)
+            return
+        code, body, headers = file.negotiate(
+            self.headers.get("Accept-Encoding"), self.headers.get("If-None-Match")
+        )
+        self.send_response(code)
+        for header, value in headers:
+            self.send_header(header, value)
+        self.end_headers()
+        if not self.omit_body:
+            self.wfile.write(body)
+
+    def respond(self, code: int, message: "str | bytes", headers: dict[str, str]) -> None:
         """Responds to the client with a message custom message. See `respond_file` for the prefered response method.
 
         Args:
             code (int): The HTTP status code to respond with.
-            message (str): The message to respond with.
+            message (str|bytes): The message to respond with, `bytes` if it's already encoded.
         """
+        body = message if isinstance(message, bytes) else message.encode() if message else b""
+        encoding = None
+        if self.compression is not None and self.compression.compressible(
+            headers.get("Content-type", "text/html"), len(body)
+        ):
+            encoding = self.compression.encoding(self.headers.get("Accept-Encoding"))
+            headers = {**headers, "Vary": "Accept-Encoding"}
+        if encoding is not None:
+            body = self.compression.compress(body, encoding)  # type: ignore
+            headers = {**headers, "Content-Encoding": encoding, "Content-length": f"{len(body)}"}
         self.send_response(code)
         if headers:
             for header, value in headers.items():
                 self.send_header(header, value)
-        if "Content-type" not in self.headers:
+        # every response needs a length, otherwise keep-alive clients hang waiting for more
+        if "Content-type" not in headers:
             self.send_header("Content-type", "text/html")
-        if "Content-length" not in self.headers and message:
-            self.send_header("Content-length", f"{len(message)}")
+        if "Content-length" not in headers:
+            self.send_header("Content-length", f"{len(body)}")
         self.end_headers()
-        if message:
-            self.wfile.write(message.encode())
+        if body and not self.omit_body:
+            self.wfile.write(body)
 
     def resolve_path(self, method: str, path: str) -> str:
         """
@@ -249,44 +576,15 @@ class Handler(BaseHTTPRequestHandler):
             tuple[bool,dict[str,str]]: A tuple containing a boolean value indicating whether the path
             matches the route, and a dictionary containing the keyword variables from the route.
         """
-        if len(path.split("/")) == len(route.split("/")):
-            kwargs: dict[str, type | str] = {}
-            for path_part, route_part in zip(path.split("/"), route.split("/")):
-                if route_part.startswith(":"):
-                    # Check if the route part specifies a type
-                    split = route_part.split(":")[1:]
-                    # standard route syntax validation
-                    if len(split) == 2:
-                        route_part, type_ = split
-                    elif len(split) == 1:
-                        route_part, type_ = route_part[1:], "str"
-                    else:
-                        raise ValueError("Invalid route syntax.")
-
-                    try:
-                        # Fancy way of converting the type string to a type
-                        kwargs[route_part[1:]] = {
-                            "int": int,
-                            "float": float,
-                            "str": str,
-                            "bool": bool,
-                        }[type_]
-                    except (KeyError, ValueError):
-                        raise ValueError(f"Invalid type {type_}.")
-                    # The route part does not specify a type, default to `str`
-                    kwargs[route_part] = path_part
-                elif route_part == "*":
-                    # TODO: Implement further wildcard matching
-                    pass
-                elif route_part != path_part:
-                    break
-            else:
-                return True, kwargs
-        return False, {}
+        params = match_route(path, route)
+        if params is None:
+            return False, {}
+        return True, params
 
     def serve_filename(self, path: str, target_ext: str = "html") -> "str|None":
         """
         Returns the filename of a path. If the path is not a file, returns `None`.
+        Results are cached in `Handler.path_cache` until the directories involved change.
 
         Args:
             path (str): The requested uri path.
@@ -294,6 +592,15 @@ class Handler(BaseHTTPRequestHandler):
         Returns:
             str|None: The path to the desired file, or `None` if the file does not exist.
         """
+        base = f"{self.page_dir}{path}"
+        return self.path_cache.get(
+            ("file", self.page_dir, path, target_ext),
+            lambda: self._serve_filename(path, target_ext),
+            (base, os.path.dirname(base), self.page_dir),
+        )
+
+    def _serve_filename(self, path: str, target_ext: str) -> "str|None":
+        "Uncached version of `serve_filename`."
         # Search for files in the form `pages/path/.ext`
         target = f"{self.page_dir}{path}/.{target_ext}"
         if not os.path.exists(target):
@@ -306,6 +613,27 @@ class Handler(BaseHTTPRequestHandler):
                     target = ""
         return target if target else None
 
+    def brython_scripts(self, path: str) -> "tuple[str, ...]":
+        """
+        Returns the python scripts in the page directory for `path`. Empty unless the
+        directory has a `.py` file. Cached the same way as `serve_filename`.
+
+        Args:
+            path (str): The requested uri path.
+        """
+        directory = f"{self.page_dir}{path}"
+
+        def resolve() -> "tuple[str, ...]":
+            if not os.path.exists(f"{directory}/.py"):
+                return ()
+            return tuple(file for file in os.listdir(directory) if file.endswith(".py"))
+
+        return self.path_cache.get(
+            ("brython", self.page_dir, path),
+            resolve,
+            (directory, os.path.dirname(directory)),
+        )
+
     @staticmethod
     def _make_method(http_method: Callable):
         """
@@ -314,44 +642,54 @@ class Handler(BaseHTTPRequestHandler):
         method_name = http_method.__name__[3:].lower()
 
         def method(self: "Handler"):
+            self.response_started = False
+            self.omit_body = method_name == "head"
+            self.body = b""
+            # parsed by `json` when it's first needed
+            self._json = _UNPARSED
             # Getting body:
             length = int(self.headers.get("Content-Length", 0))
-            if length:
+            if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+                self.body = self.read_chunked_body()
+            elif length:
                 self.body = self.rfile.read(length)
-                # Setting up json
-                if self.headers.get("Content-Type") == "application/json":
-                    self.json = json.loads(self.body)
             try:
+                route_path = self.path.split("?", 1)[0]
                 # streams
                 if self.headers.get("Accept") == "text/event-stream":
-                    for func_path in self.responses["stream"]:
-                        matched, kwargs = self.match_route(self.path, func_path)
-                        if matched:
-                            self.send_response(200)
-                            self.send_header("Content-Type", "text/event-stream")
-                            self.send_header("Cache-Control", "no-cache")
-                            self.send_header("Connection", "keep-alive")
-                            self.end_headers()
-                            self.flush_headers()
-
-                            for e in self.responses["stream"][func_path](
-                                Request(self, params=kwargs), StreamResponse(self)
-                            ):
-                                event: Event = e
-                                self.wfile.write(event.to_bytes())
-                                if event.event_name == "close":
-                                    return
+                    matched = self.route_trees["stream"].lookup(route_path)
+                    if matched is not None:
+                        func, kwargs = matched
+                        self.send_response(200)
+                        self.send_header("Content-Type", "text/event-stream")
+                        self.send_header("Cache-Control", "no-cache")
+                        self.send_header("Connection", "close")
+                        self.end_headers()
+                        self.flush_headers()
+
+                        # event streams have no length, they end when the connection does
+                        self.close_connection = True
+                        if self.omit_body:
                             return
+                        for e in func(self.new_request(kwargs), StreamResponse(self)):
+                            event: Event = e
+                            self.wfile.write(event.to_bytes())
+                            if event.event_name == "close":
+                                return
+                        return
 
                 # GQL
                 if self.path in self.gql_endpoints:
                     self.gql_endpoints[self.path](
-                        Request(self, params={}), GQLResponse(self)
+                        self.new_request({}), GQLResponse(self)
                     )()
                     return
 
-                # file serve
-                if method_name == "get":
+                # file serve, `HEAD` gets the same headers as `GET` would
+                if method_name in ("get", "head"):
+                    if self.brython_runtime is not None and route_path.startswith(RUNTIME_ROUTE):
+                        self.respond_runtime(route_path)
+                        return
                     path = self.path
                     if "." in path.split("/")[-1]:
                         extension = path.split("/")[-1].split(".")[-1].lower()
@@ -361,54 +699,22 @@ class Handler(BaseHTTPRequestHandler):
                         # otherwise, assume html
                         extension = "html"
 
-                    if extension == "html" and not os.path.exists(
-                        f"{self.page_dir}{path}/.py"
-                    ):
+                    py_files = self.brython_scripts(path) if extension == "html" else ()
+                    if extension == "html" and not py_files:
                         filename = self.serve_filename(path, extension)
                         if filename is not None:
                             self.respond_file(200, filename)
                             return
 
                     elif extension == "html" and self.brython:
-                        # check if python script in directory
-                        py_files = []
-                        for file in os.listdir(f"{self.page_dir}{path}"):
-                            if file.endswith(".py"):
-                                py_files.append(file)
-                        
                         if py_files:
-                            html_filename = f"{self.page_dir}{path}/.{extension}"
-                            with open(html_filename, "r") as f:
-                                html = f.read()
-
-                                body_location = html.index("<body")
-                                # insert `onload="brython()"` into body tag
-                                html = (
-                                    html[: body_location + 5]
-                                    + ' onload="brython()"'
-                                    + html[body_location + 5 :]
-                                )
-
-                                end_of_body = html.index("</body>")
-                                script_injection = '<script src="https://cdn.jsdelivr.net/npm/brython@3/brython.min.js">\n</script><script src="https://cdn.jsdelivr.net/npm/brython@3/brython_stdlib.js"></script>\n'
-                                for py_file in py_files:
-                                    with open(
-                                        f"{self.page_dir}{path}/{py_file}", "r"
-                                    ) as f:
-                                        py_script = f.read()
-                                    script_injection += f'<script type="text/python">{py_script}</script>\n'
-
-                                new_html = (
-                                    html[:end_of_body]
-                                    + script_injection
-                                    + html[end_of_body:]
-                                )
-
-                                self.send_response(200)
-                                self.send_header("Content-Type", "text/html")
-                                self.send_header("Content-Length", f"{len(new_html)}")
-                                self.end_headers()
-                                self.wfile.write(new_html.encode())
+                            new_html = self.brython_cache.get(f"{self.page_dir}{path}")
+                            self.send_response(200)
+                            self.send_header("Content-Type", "text/html")
+                            self.send_header("Content-Length", f"{len(new_html)}")
+                            self.end_headers()
+                            if not self.omit_body:
+                                self.wfile.write(new_html)
                             return
 
                     elif extension in ["css", "js", "py"]:
@@ -417,41 +723,25 @@ class Handler(BaseHTTPRequestHandler):
                             self.respond_file(200, filename)
                             return
 
-                # for route_path in self.routes[method_name]:
-                #    if route_path == self.path:
-                #        route = self.routes[method_name][route_path]
-                #        self.respond_file(
-                #            200, self.resolve_path(method_name, route.full_path)
-                #        )
-                #        return
-                # for func_path in self.responses[method_name]:
-                #    matched, kwargs = self.match_route(self.path, func_path)
-                #    if matched:
-                #        self.responses[method_name][func_path](
-                #            Request(self, params=kwargs), Response(self)
-                #        )()
-                #        return
-                for route_path, func_path in zip_longest(
-                    self.routes[method_name],
-                    self.responses[method_name],
-                    fillvalue=None,
-                ):
-                    if route_path == self.path:
-                        route = self.routes[method_name][route_path]
-                        self.respond_file(
-                            200, self.resolve_path(method_name, route.full_path)
-                        )
-                        return
-                    if func_path == self.path:
-                        self.responses[method_name][func_path](
-                            Request(self, params={}), Response(self)
-                        )()
-                        return
-                else:
-                    self.error(404, message=self.path)
+                if self.path in self.routes[method_name]:
+                    route = self.routes[method_name][self.path]
+                    self.respond_file(
+                        200, self.resolve_path(method_name, route.full_path)
+                    )
+                    return
+                matched = self.route_trees[method_name].lookup(route_path)
+                if matched is not None:
+                    func, kwargs = matched
+                    func(self.new_request(kwargs), self.new_response())()
+                    return
+                self.error(404, message=self.path)
             except Exception as e:
                 if self.debug:
                     print_exc(e)
+                if self.response_started:
+                    # too late for a 500, the client can't tell where this response ends anymore
+                    self.close_connection = True
+                    return
                 self.error(
                     code=500,
                     message=str(e),
@@ -506,6 +796,8 @@ class RouteExistsError(Exception):
 
 
 class Event:
+    __slots__ = ("data", "event_name", "id")
+
     def __init__(
         self, data: str, event_name: str | None = None, id: str | int | None = None
     ):
@@ -571,19 +863,26 @@ class Request:
         `Request.params["example-id"]` or `Request.params.get("example-id")`.
         """
 
+        __slots__ = ("_params",)
+
         def __init__(self, kwargs: dict[str, str | type]):
-            for param, value in kwargs.items():
-                # Fun fact, setattr is ~39% faster than __setattr__.
-                setattr(self, param, value)
+            # a view of the route's dict, instead of copying every param into a `__dict__`
+            self._params = kwargs
+
+        def __getattr__(self, param: str) -> str:
+            try:
+                return self._params[param]  # type: ignore
+            except KeyError:
+                raise AttributeError(param) from None
 
         def __getitem__(self, key: str) -> str:
-            return getattr(self, key)
+            return self.__getattr__(key)
 
         def get(self, param: str) -> str:
-            return getattr(self, param)
+            return self.__getattr__(param)
 
         def __repr__(self) -> str:
-            return f"Request.params({self.__dict__})"
+            return f"Request.params({self._params})"
 
         def __str__(self) -> str:
             return self.__repr__()
@@ -591,19 +890,56 @@ class Request:
         def __eq__(self, o: object) -> bool:
             return self.__repr__() == o.__repr__()
 
+    __slots__ = (
+        "request",
+        "path",
+        "method",
+        "headers",
+        "body",
+        "ip",
+        "port",
+        "_params",
+        "_params_view",
+        "_authorization",
+        "_text",
+    )
+
     def __init__(self, request: Handler, /, *, params: dict[str, str | type]):
+        self.reset(request, params)
+
+    def reset(self, request: Handler, params: dict[str, str | type]) -> "Request":
+        """
+        Points this object at a new request. Used to reuse it, see `Server(reuse_objects=True)`.
+        You should not call this manually unless you are modifying `http_plus.Server`.
+        """
         self.request = request
         "The request object directly from the HTTP Server."
         self.path = request.path
         self.method = request.command
         self.headers = request.headers
         "The headers of the request (equivalent to request.headers)."
-        self.authorization = self.get_auth()
-        "The authorization header of the request, if it exists, in the format `(scheme,token)`. Is `None` if it doesn't exist."
         self.body = request.body
         self.ip, self.port = request.client_address
-        self.params = self.Params(params)
+        # params, authorization and text are only worked out if the listener asks for them
+        self._params = params
+        self._params_view: Request.Params | None = None
+        self._authorization: Any = _UNPARSED
+        self._text: str | None = None
+        return self
+
+    @property
+    def params(self) -> "Request.Params":
         "The a dictionary-like object containing the parameters from the request url's keyword path."
+        if self._params_view is None:
+            self._params_view = self.Params(self._params)
+        return self._params_view
+
+    @property
+    def authorization(self) -> "list[str] | None":
+        "The authorization header of the request, if it exists, in the format `(scheme,token)`. Is `None` if it doesn't exist."
+        if self._authorization is _UNPARSED:
+            self._authorization = self.get_auth()
+        return self._authorization
 
     # Dunder pog
     def __repr__(self) -> str:
@@ -651,12 +987,16 @@ class Request:
             return default
 
     @property
-    def json(self) -> dict:
-        return loads(self.body)
+    def json(self) -> Any:
+        "The body parsed as JSON. It's parsed once per request, however often this is used."
+        return self.request.body_json()
 
     @property
     def text(self) -> str:
-        return self.body.decode()
+        "The body decoded as `utf-8`, decoded on first access."
+        if self._text is None:
+            self._text = self.body.decode()
+        return self._text
 
     def param(self, param: str) -> str:
         return self.params[param]
@@ -669,13 +1009,40 @@ class Response:
     You *must* return this from the HTTP method listener function.
     """
 
+    __slots__ = (
+        "response",
+        "headers",
+        "body",
+        "status_code",
+        "isLinked",
+        "file",
+        "ranges",
+        "stream",
+        "_route",
+    )
+
     def __init__(self, response: Handler):
+        self.reset(response)
+
+    def reset(self, response: Handler) -> "Response":
+        """
+        Clears this object for a new response. Used to reuse it, see `Server(reuse_objects=True)`.
+        You should not call this manually unless you are modifying `http_plus.Server`.
+        """
         self.response = response
         self.headers: dict[str, str] = {}
-        self.body: str = ""
+        self.body: "bytes | memoryview" = b""
+        "Already encoded, `set_body` takes care of that."
         self.status_code = 200
         self.isLinked = False
+        self.file: "BinaryIO | None" = None
+        "Set by `send_file`, sent in place of `body`."
+        self.ranges: "ByteRanges | None" = None
+        "Set by `send_file` for `206 Partial Content` responses."
+        self.stream: "Iterable[bytes | str] | AsyncIterable[bytes | str] | None" = None
+        "Set by `set_body` for iterable bodies, sent in place of `body`."
         self._route: Route
+        return self
 
     def __repr__(self) -> str:
         headers = self.headers
@@ -688,26 +1055,72 @@ class Response:
         self.headers[header] = value
         return self
 
-    def set_body(self, body: "bytes|str|dict") -> "Response":
+    def set_body(
+        self, body: "bytes|bytearray|memoryview|str|dict|Iterable|AsyncIterable"
+    ) -> "Response":
         """
         Automatically pareses the body into bytes, and sets the Content-Type header to application/json if the body is a dict.
         Will be overwritten if `Response` is returned from the HTTP method listener function.
 
+        The body is encoded (`utf-8`) exactly once, here, and `Content-Length` is its length in bytes.
+
+        Iterators, generators and file-like objects (anything with `.read()`) are streamed
+        instead: each item (`bytes` or `str`) is sent as it's produced, with
+        `Transfer-Encoding: chunked` on HTTP/1.1. File-like objects are closed afterwards.
+        Async iterables are only supported by `AsyncServer`.
+
         Args:
-            body (bytes|str|dict): The body of the response.
+            body (bytes|bytearray|memoryview|str|dict|Iterable|AsyncIterable): The body of the response.
         """
         self.set_header("Content-Type", "text/plain")
         if isinstance(body, dict):
             self.set_header("Content-Type", "application/json")
-            self.body = dumps(body)
-        elif isinstance(body, bytes):
+            self.body = json_backend.dumps(body)
+        elif isinstance(body, (bytes, bytearray, memoryview)):
             self.set_header("Content-Type", "application/octet-stream")
-            self.body = body.decode()
+            # bytes-like objects are sent as-is, no copy
+            self.body = body if isinstance(body, bytes) else memoryview(body)
+        elif isinstance(body, str):
+            self.body = body.encode()
+        elif hasattr(body, "read"):
+            return self._set_stream(read_chunks(body))
+        elif hasattr(body, "__iter__") or hasattr(body, "__aiter__"):
+            return self._set_stream(body)
         else:
-            self.body = body
-        self.set_header("Content-Length", len(self.body))
+            raise TypeError(f"Unsupported body type {type(body).__name__}.")
+        self.set_header("Content-Length", memoryview(self.body).nbytes)
+        return self
+
+    async def drain(self) -> None:
+        """
+        On `AsyncServer`, waits until the client has read enough of what was already sent
+        for the connection to take more. Does nothing on `Server`, where writes block anyway.
+        """
+        drain = getattr(self.response, "drain", None)
+        if drain is not None:
+            await drain()
+
+    def _set_stream(self, stream: "Iterable | AsyncIterable") -> "Response":
+        self.body = b""
+        self.stream = stream
+        self.headers.pop("Content-Length", None)
         return self
 
+    def frame_stream(self, request_version: str) -> bool:
+        """
+        Sets the headers that frame `stream`: chunked on HTTP/1.1, otherwise the body ends
+        when the connection is closed.
+        You should not call this manually unless you are modifying `http_plus.Server`.
+
+        Returns:
+            bool: Whether the stream must be sent with `encode_chunk`.
+        """
+        if request_version == "HTTP/1.1":
+            self.set_header("Transfer-Encoding", "chunked")
+            return True
+        self.set_header("Connection", "close")
+        return False
+
     def send_file(self, path: str) -> "Response":
         """
         Serves a file to the client. This is useful if you want to do backend logic before sending a file.
@@ -715,10 +1128,31 @@ class Response:
         Args:
             path (str): The path to the file to send.
         """
-        with open(path, "rb") as f:
-            # .decode() could be more efficient because we .encode() later.
-            self.body = f.read().decode()
-        self.set_header("Content-Length", len(self.body))
+        # the file is only opened here, `__call__` hands it to `Handler.write_file`
+        self.file = open(path, "rb")
+        self.body = b""
+        stat = os.fstat(self.file.fileno())
+        content_type = self.headers.get("Content-Type") or detect_content_type(path)
+        self.set_header("Content-Type", content_type)
+        self.set_header("Content-Length", stat.st_size)
+        for header, value in validator_headers(stat.st_mtime_ns, stat.st_size):
+            self.set_header(header, value)
+        if self.status_code == 200:
+            self.status_code, self.ranges = negotiate(
+                self.response.headers, stat.st_size, stat.st_mtime_ns, content_type
+            )
+            if self.status_code in (304, 416):
+                self.file.close()
+                self.file = None
+                del self.headers["Content-Type"]
+                if self.status_code == 304:
+                    del self.headers["Content-Length"]
+                else:
+                    self.set_header("Content-Length", 0)
+                    self.set_header("Content-Range", f"bytes */{stat.st_size}")
+            elif self.ranges is not None:
+                for header, value in self.ranges.headers():
+                    self.set_header(header.title(), value)
         return self
 
     def prompt_download(self, path: str, filename: str | None = None) -> "Response":
@@ -763,17 +1197,86 @@ class Response:
         self.isLinked = True
         return self
 
+    def compress(self, compression: "Compression | None", accept_encoding: "str | None") -> None:
+        """
+        Compresses `body` if the client accepts an encoding and it's worth it, see `Compression`.
+        Does nothing if the listener set `Content-Encoding` itself.
+        You should not call this manually unless you are modifying `http_plus.Server`.
+        """
+        if (
+            compression is None
+            or self.isLinked
+            or self.file is not None
+            or self.stream is not None
+            or self.status_code in (204, 206, 304)
+            or "Content-Encoding" in self.headers
+        ):
+            return
+        size = memoryview(self.body).nbytes
+        if not compression.compressible(self.headers.get("Content-Type"), size):
+            return
+        # caches have to keep the versions apart, even for clients that got it uncompressed
+        vary = self.headers.get("Vary")
+        self.headers["Vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+        encoding = compression.encoding(accept_encoding)
+        if encoding is None:
+            return
+        self.body = compression.compress(bytes(self.body), encoding)
+        self.headers["Content-Encoding"] = encoding
+        self.headers["Content-Length"] = f"{len(self.body)}"
+        etag = self.headers.get("ETag")
+        if etag is not None and not etag.startswith("W/"):
+            # not byte-for-byte what the strong ETag promised anymore
+            self.headers["ETag"] = f"W/{etag}"
+
     def __call__(self) -> None:
         """
         Sends the response to the client.
         You should not call this manually unless you are modifying `http_plus.Server`.
         """
+        chunked = False
+        self.compress(self.response.compression, self.response.headers.get("Accept-Encoding"))
+        if self.stream is not None and not self.isLinked:
+            if hasattr(self.stream, "__aiter__"):
+                raise TypeError("Async iterable bodies need `AsyncServer`.")
+            chunked = self.frame_stream(self.response.request_version)
+        elif (self.isLinked or self.file is None) and self.status_code not in (204, 304):
+            self.set_header("Content-Length", 0 if self.isLinked else memoryview(self.body).nbytes)
         self.response.send_response(self.status_code)
         for header, value in self.headers.items():
             self.response.send_header(header, value)
         self.response.end_headers()
-        if not self.isLinked:
-            self.response.wfile.write(self.body.encode())
+        if self.file is not None:
+            try:
+                if self.isLinked or self.response.omit_body:
+                    pass
+                elif self.ranges is not None:
+                    self.response.write_ranges(self.file, self.ranges)
+                else:
+                    self.response.write_file(self.file)
+            finally:
+                self.file.close()
+        elif self.response.omit_body:
+            # `HEAD`, the headers are the whole response
+            if self.stream is not None and hasattr(self.stream, "close"):
+                # so a started generator runs its `finally` blocks now
+                self.stream.close()  # type: ignore
+            return
+        elif self.stream is not None and not self.isLinked:
+            # writes block while the client is behind, which is all the back-pressure we need here
+            for chunk in self.stream:
+                if not chunk:
+                    continue
+                if chunked:
+                    self.response.wfile.write(encode_chunk(chunk))
+                else:
+                    self.response.wfile.write(
+                        chunk.encode() if isinstance(chunk, str) else chunk
+                    )
+            if chunked:
+                self.response.wfile.write(b"0\r\n\r\n")
+        elif not self.isLinked:
+            self.response.wfile.write(self.body)
         return
 
 
@@ -785,6 +1288,8 @@ class StreamResponse(Response):
     and `event` and `id` is optional (`event` defaults to "message").
     """
 
+    __slots__ = ()
+
     def event(
         self, data: str, event_name: str | None = None, id: int | None = None
     ) -> Event:
@@ -802,13 +1307,46 @@ class StreamResponse(Response):
         return Event(data, event_name, id)
 
 
+GQL_ERROR = {"error": "An error occurred."}
+"The body for an operation that fails to parse, validate or execute."
+PERSISTED_QUERY_NOT_FOUND = {
+    "errors": [
+        {
+            "message": "PersistedQueryNotFound",
+            "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"},
+        }
+    ]
+}
+"Tells the client to send the whole query, see `QueryCache`."
+PERSISTED_QUERY_INVALID = {
+    "errors": [
+        {
+            "message": "Invalid persisted query extension",
+            "extensions": {"code": "PERSISTED_QUERY_INVALID"},
+        }
+    ]
+}
+"For a `persistedQuery` extension that isn't `{\"sha256Hash\": <string>}`."
+
+
 class GQLResponse(Response):
     """
     GQLResponse should be used exclusively with `@http_plus.gql(path=str)`.
 
     You *must* return this from the GraphQL method listener function.
+
+    Resolvers get this response as `info.context`, so they can share a `loader` per request.
+    Resolvers can be coroutines: on `AsyncServer` they run on its event loop, on `Server`
+    each query with async resolvers gets an event loop of its own.
     """
 
+    __slots__ = ("database", "loaders")
+
+    def __init__(self, response: Handler):
+        super().__init__(response)
+        self.database: Any = None
+        self.loaders: dict[Callable, DataLoader] = {}
+
     def set_database(self, database: dict[str, Any]):
         """
         Resolves a GQL query with the specified database/dict.
@@ -816,20 +1354,146 @@ class GQLResponse(Response):
         self.database = database
         return self
 
-    def _resolve(self) -> dict[str, Any] | None:
-        schema = self.response.gql_schemas[self.response.path]
-        parsed_schema = graphql.build_schema(schema)
-        query = self.response.json["query"]
+    def loader(self, batch_load: Callable, max_batch_size: "int | None" = None) -> DataLoader:
+        """
+        Returns this request's `DataLoader` for `batch_load`, creating it the first time.
 
-        return graphql.graphql_sync(
-            schema=parsed_schema, source=query, root_value=self.database
-        ).data
+        Args:
+            batch_load (Callable): Loads a list of keys at once, see `DataLoader`.
+            max_batch_size (int): Splits larger batches into several calls. Defaults to no limit.
+        """
+        loader = self.loaders.get(batch_load)
+        if loader is None:
+            loader = self.loaders[batch_load] = DataLoader(batch_load, max_batch_size)
+        return loader
+
+    def _operations(self) -> "tuple[list[Any], bool]":
+        "Returns the operations in the request, and whether they were sent as a batch (a JSON array)."
+        request = self.response.json
+        if isinstance(request, list):
+            return request, True
+        return [request], False
+
+    def _execute(self, operation: Any) -> "dict[str, Any] | Awaitable[dict[str, Any] | None] | None":
+        """
+        Executes one operation (`{"query", "variables", "operationName"}`). Returns its
+        result, or an awaitable of it if any resolver is async. `None` if it failed.
+        """
+        if not isinstance(operation, dict):
+            return None
+        cache = self.response.gql_caches[self.response.path]
+        query = operation.get("query")
+        if query is not None and not isinstance(query, str):
+            return None
+        # `null` is the same as leaving it out, any other value has to be well-formed
+        extensions = operation.get("extensions")
+        if extensions is None:
+            extensions = {}
+        elif not isinstance(extensions, dict):
+            return PERSISTED_QUERY_INVALID
+        persisted_query = extensions.get("persistedQuery")
+        sha256_hash = None
+        if persisted_query is not None:
+            if not isinstance(persisted_query, dict):
+                return PERSISTED_QUERY_INVALID
+            sha256_hash = persisted_query.get("sha256Hash")
+            if not isinstance(sha256_hash, str):
+                return PERSISTED_QUERY_INVALID
+        # only the execution is left once the document is cached
+        try:
+            document, errors = cache.document(query, sha256_hash)
+        except PersistedQueryNotFound:
+            return PERSISTED_QUERY_NOT_FOUND
+        if errors:
+            return None
+
+        variables = operation.get("variables")
+        operation_name = operation.get("operationName")
+        key = cache.result_key(query or sha256_hash, document, operation_name, variables)  # type: ignore
+        if key is not None:
+            cached = cache.cached_result(key)
+            if cached is not None:
+                return cached
+
+        result = graphql.execute(
+            schema=cache.schema,
+            document=document,  # type: ignore
+            root_value=self.database,
+            context_value=self,
+            variable_values=variables,
+            operation_name=operation_name,
+        )
+        if isawaitable(result):
+            return self._finish(result, cache, key)  # type: ignore
+        return self._finish_sync(result, cache, key)  # type: ignore
+
+    def _finish_sync(
+        self, result: graphql.ExecutionResult, cache: QueryCache, key: "tuple | None"
+    ) -> "dict[str, Any] | None":
+        if key is not None and not result.errors:
+            cache.store_result(key, result.data)
+        return result.data
+
+    async def _finish(
+        self, result: "Awaitable[graphql.ExecutionResult]", cache: QueryCache, key: "tuple | None"
+    ) -> "dict[str, Any] | None":
+        return self._finish_sync(await result, cache, key)
 
-    def __call__(self) -> None:
-        resolved = self._resolve()
-        if resolved is not None:
-            self.set_body(resolved)
+    @staticmethod
+    async def _await_all(results: list) -> list:
+        "Awaits the awaitable results concurrently, so a batch shares its `loader` batches."
+        pending = [i for i, result in enumerate(results) if isawaitable(result)]
+        for i, result in zip(pending, await asyncio.gather(*(results[i] for i in pending))):
+            results[i] = result
+        return results
+
+    def _execute_all(self) -> "tuple[list, bool]":
+        "Executes every operation. The results of those with async resolvers are still awaitables."
+        operations, batched = self._operations()
+        return [self._execute(operation) for operation in operations], batched
+
+    def _resolve(self) -> "tuple[list[dict[str, Any] | None], bool]":
+        results, batched = self._execute_all()
+        if any(isawaitable(result) for result in results):
+            results = asyncio.run(self._await_all(results))
+        return results, batched  # type: ignore
+
+    def prepare(self) -> "GQLResponse":
+        """
+        Resolves the query (or batch of queries) and sets the result as the body.
+        You should not call this manually unless you are modifying `http_plus.Server`.
+        """
+        return self._set_result(*self._resolve())
+
+    async def prepare_async(self, run_sync: "Callable | None" = None) -> "GQLResponse":
+        """
+        `prepare`, for when an event loop is already running.
+
+        Args:
+            run_sync (Callable): Runs a blocking function off the loop and returns an awaitable
+                of its result, like `AsyncHandler.run_sync`. The queries are executed with it,
+                so sync resolvers don't block the loop, and only the results of async resolvers
+                are awaited on the loop. Defaults to executing on the loop.
+        """
+        if run_sync is None:
+            results, batched = self._execute_all()
+        else:
+            results, batched = await run_sync(self._execute_all)
+        return self._set_result(await self._await_all(results), batched)
+
+    def _set_result(self, results: "list[dict[str, Any] | None]", batched: bool) -> "GQLResponse":
+        if batched:
+            # one failed operation doesn't fail the others
+            body = json_backend.dumps([GQL_ERROR if result is None else result for result in results])
+            # `set_body` would stream a list, it's encoded here instead
+            return self.set_body(body).set_header("Content-Type", "application/json")
+        if results[0] is not None:
+            self.set_body(results[0])
         else:
             self.status(500)
-            self.set_body({"error": "An error occurred."})
+            self.set_body(GQL_ERROR)
+        return self
+
+    def __call__(self) -> None:
+        self.prepare()
         return super().__call__()
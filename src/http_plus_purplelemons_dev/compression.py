@@ -0,0 +1,216 @@
+"""
+Responsible for compressing response bodies, and for picking the encoding a client accepts.
+
+Brotli is used when the `brotli` package is installed, gzip and deflate are always available.
+See `Compression` (`Server(compression=...)`) for what gets compressed.
+"""
+
+from typing import Iterable
+import gzip
+import os
+import zlib
+from .cache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/xhtml+xml",
+    "application/graphql-response+json",
+    "image/svg+xml",
+)
+"Content types (or prefixes of them) that are worth compressing. Images, video and archives already are."
+ENCODINGS = ("br", "gzip", "deflate") if brotli is not None else ("gzip", "deflate")
+"The encodings `Compression` can use, best first."
+STATIC_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+"Precompressed siblings `Compression.static_variant` looks for, e.g. `app.js.gz` for `app.js`."
+
+
+def precompress(body: bytes) -> "dict[str, bytes]":
+    """
+    Compresses `body` with every available encoding at its highest level. Meant for bodies
+    that are compressed once and sent many times. Encodings that don't make `body` smaller
+    are left out.
+
+    Returns:
+        dict[str,bytes]: `Content-Encoding` values mapped to the compressed body, brotli
+        (which compresses better) first.
+    """
+    variants = {}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    variants["gzip"] = gzip.compress(body, 9, mtime=0)
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(body)}
+
+
+def accepted_encodings(accept_encoding: str) -> "dict[str, float]":
+    "Parses an `Accept-Encoding` header into encodings mapped to their `q` values."
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        encoding, *params = item.split(";")
+        encoding = encoding.strip().lower()
+        if not encoding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[encoding] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: "str | None", available: "Iterable[str]") -> "str | None":
+    """
+    Returns the encoding out of `available` the client prefers, or `None` to send the body
+    as is. Ties go to whichever comes first in `available`.
+
+    Args:
+        accept_encoding (str): The request's `Accept-Encoding` header, if it has one.
+        available (Iterable[str]): The encodings the body can be sent with, best first.
+    """
+    if not accept_encoding:
+        return None
+    accepted = accepted_encodings(accept_encoding)
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str, level: int = 6, brotli_quality: int = 4) -> bytes:
+    """
+    Compresses `body` for a `Content-Encoding`.
+
+    Args:
+        body (bytes): What to compress.
+        encoding (str): `br`, `gzip` or `deflate`.
+        level (int): The zlib level (1-9) for gzip and deflate.
+        brotli_quality (int): The brotli quality (0-11).
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)  # type: ignore
+    if encoding == "gzip":
+        return gzip.compress(body, level, mtime=0)
+    if encoding == "deflate":
+        # HTTP's "deflate" is the zlib format
+        return zlib.compress(body, level)
+    raise ValueError(f"Unknown encoding {encoding}.")
+
+
+class Compression:
+    """
+    The compression settings of a server, see `Server(compression=...)`.
+
+    Bodies of at least `min_size` bytes with a content type in `content_types` are compressed
+    with the encoding the client prefers (brotli, gzip or deflate). Streamed bodies, files
+    sent with `Response.send_file` and `Range` requests are sent as is.
+
+    Files from `page_dir` are sent precompressed: from a `.br`/`.gz` file next to them if
+    there's an up to date one, otherwise compressed once (at the highest level) and kept in
+    memory, up to `static_cache_size` bytes of compressed files.
+
+    Example:
+    >>> server = Server(compression=Compression(level=5, content_types=("text/", "application/json")))
+    """
+
+    def __init__(
+        self,
+        min_size: int = 1024,
+        level: int = 6,
+        brotli_quality: int = 4,
+        content_types: "Iterable[str]" = COMPRESSIBLE_TYPES,
+        static_cache_size: int = 32 * 1024 * 1024,
+        max_static_size: int = 1024 * 1024,
+    ):
+        """
+        Args:
+            min_size (int): Smaller bodies aren't worth the CPU (or even get bigger).
+            level (int): The zlib level (1-9) dynamic responses are compressed with.
+            brotli_quality (int): The brotli quality (0-11) dynamic responses are compressed with.
+            content_types (Iterable[str]): Content types, or prefixes of them like `text/`, to compress.
+            static_cache_size (int): How many bytes of compressed `page_dir` files to keep in memory.
+            max_static_size (int): Larger files are only sent compressed if they have a `.br`/`.gz` sibling.
+        """
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.content_types = tuple(content_types)
+        self.max_static_size = max_static_size
+        self.static = LRUCache(static_cache_size, weigh=lambda variant: len(variant[2]))
+        "`(filename, encoding)` mapped to `(mtime_ns, size, compressed file)`."
+
+    def compressible(self, content_type: "str | None", size: int) -> bool:
+        "Whether a body of this type and size gets compressed for clients that accept it."
+        if size < self.min_size or not content_type:
+            return False
+        content_type = content_type.split(";", 1)[0].strip().lower()
+        return content_type.startswith(self.content_types)
+
+    def encoding(self, accept_encoding: "str | None") -> "str | None":
+        "Returns the encoding to compress with for a request's `Accept-Encoding`, if any."
+        return choose_encoding(accept_encoding, ENCODINGS)
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        "Compresses a dynamic response's body with this server's levels."
+        return compress(body, encoding, self.level, self.brotli_quality)
+
+    def cached_variant(
+        self, filename: str, mtime_ns: int, size: int, encoding: str
+    ) -> "bytes | None":
+        "Returns the compressed file if it's in memory already, see `static_variant`."
+        cached = self.static.get((filename, encoding))
+        if cached is not None and cached[:2] == (mtime_ns, size):
+            return cached[2]
+        return None
+
+    def static_variant(
+        self, filename: str, mtime_ns: int, size: int, encoding: str, create: bool = True
+    ) -> "bytes | None":
+        """
+        Returns a `page_dir` file compressed with `encoding`: cached, read from its sibling, or
+        compressed now if `create` is set. `None` if it can't be had.
+
+        Args:
+            filename (str): The file.
+            mtime_ns (int): The modification time of the version being sent.
+            size (int): The size of the version being sent.
+            encoding (str): The encoding the client accepts.
+            create (bool): Whether to compress the file if there's no sibling. Slow for big files,
+                `AsyncHandler` does it on the executor.
+        """
+        compressed = self.cached_variant(filename, mtime_ns, size, encoding)
+        if compressed is not None:
+            return compressed
+        suffix = STATIC_SUFFIXES.get(encoding)
+        if suffix is not None:
+            try:
+                # one older than the file is left over from a previous version
+                if os.stat(filename + suffix).st_mtime_ns >= mtime_ns:
+                    with open(filename + suffix, "rb") as f:
+                        compressed = f.read()
+            except OSError:
+                pass
+        if compressed is None:
+            if not create or size > self.max_static_size:
+                return None
+            with open(filename, "rb") as f:
+                body = f.read()
+            if len(body) != size:
+                # changed since it was stat'ed, don't cache it under the old version
+                return None
+            # compressed once and sent many times, so it's worth the highest level
+            compressed = compress(body, encoding, 9, 11)
+        self.static[(filename, encoding)] = (mtime_ns, size, compressed)
+        return compressed
@@ -0,0 +1,219 @@
+"""
+Responsible for the work GraphQL endpoints can do once instead of on every request
+(building the schema, and parsing and validating query documents), and for batching
+the lookups resolvers make (`DataLoader`).
+"""
+
+from hashlib import sha256
+from inspect import isawaitable
+from time import monotonic
+from typing import Awaitable, Callable, Hashable, Iterable
+import asyncio
+import graphql
+from .cache import LRUCache
+from . import json_backend
+
+
+class PersistedQueryNotFound(Exception):
+    """
+    Raised when a request only sends the hash of a query the server doesn't know (yet).
+    The client should retry with the full query, which is then persisted.
+    """
+
+
+class QueryCache:
+    """
+    The built schema of a `@server.gql` endpoint, along with an LRU of its parsed and
+    validated query documents, keyed by query text.
+
+    Also supports persisted queries (Apollo's "automatic persisted queries" protocol): a
+    client may send just the sha256 hash of a query it has sent before, instead of the
+    query itself.
+
+    Example:
+    >>> cache = QueryCache("type Query { hello: String }")
+    >>> document, errors = cache.document("{ hello }")
+    """
+
+    def __init__(
+        self,
+        schema: "str | graphql.GraphQLSchema",
+        maxsize: int = 256,
+        result_ttl: "float | None" = None,
+    ):
+        """
+        Args:
+            schema (str|GraphQLSchema): The schema, in SDL or already built.
+            maxsize (int): How many query documents (and persisted queries, and results) to remember.
+            result_ttl (float): How long (in seconds) to reuse the result of a query for the same
+                variables. Defaults to `None`, which doesn't cache results.
+        """
+        self.schema = graphql.build_schema(schema) if isinstance(schema, str) else schema
+        self.documents = LRUCache(maxsize)
+        "Query text mapped to `(document, validation errors)`."
+        self.persisted = LRUCache(maxsize)
+        "sha256 hashes mapped to query text."
+        self.result_ttl = result_ttl
+        self.results = LRUCache(maxsize)
+        "`result_key`s mapped to `(expiry, data)`."
+
+    def document(
+        self, query: "str | None", sha256_hash: "str | None" = None
+    ) -> "tuple[graphql.DocumentNode | None, list[graphql.GraphQLError]]":
+        """
+        Returns the parsed document of a query and its validation errors, from the cache if possible.
+
+        Args:
+            query (str): The query text. May be `None` if `sha256_hash` is a persisted query.
+            sha256_hash (str): The hash of the query, if the client uses persisted queries.
+        Returns:
+            tuple[DocumentNode|None,list[GraphQLError]]: The document (`None` if it doesn't parse)
+            and the errors that stop it from being executed.
+        Raises:
+            PersistedQueryNotFound: If only a hash was sent and it isn't known.
+        """
+        if sha256_hash is not None:
+            if query is None:
+                query = self.persisted.get(sha256_hash)
+                if query is None:
+                    raise PersistedQueryNotFound(sha256_hash)
+            elif sha256(query.encode()).hexdigest() != sha256_hash:
+                return None, [graphql.GraphQLError("provided sha does not match query")]
+            else:
+                self.persisted[sha256_hash] = query
+        if query is None:
+            return None, [graphql.GraphQLError("Must provide query string.")]
+
+        cached = self.documents.get(query)
+        if cached is not None:
+            return cached
+        try:
+            document = graphql.parse(query)
+        except graphql.GraphQLError as error:
+            result = (None, [error])
+        else:
+            result = (document, graphql.validate(self.schema, document))
+        # invalid queries are cached too, so repeating one doesn't re-parse it either
+        self.documents[query] = result
+        return result
+
+
+    def result_key(
+        self,
+        query: str,
+        document: graphql.DocumentNode,
+        operation_name: "str | None",
+        variables: "dict | None",
+    ) -> "tuple | None":
+        """
+        Returns the key the result of an operation is cached under, or `None` if it isn't
+        cached: when `result_ttl` isn't set, or for mutations and subscriptions.
+
+        Args:
+            query (str): The query text, or its persisted query hash.
+            document (DocumentNode): The parsed query.
+            operation_name (str): Which operation of the document is executed.
+            variables (dict): The variables it's executed with.
+        """
+        if self.result_ttl is None:
+            return None
+        operation = graphql.get_operation_ast(document, operation_name)
+        if operation is None or operation.operation != graphql.OperationType.QUERY:
+            return None
+        try:
+            return query, operation_name, json_backend.dumps(variables, sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+
+    def cached_result(self, key: tuple) -> "dict | None":
+        "Returns the cached result for `key`, unless it's expired."
+        entry = self.results.get(key)
+        if entry is None or entry[0] < monotonic():
+            return None
+        return entry[1]
+
+    def store_result(self, key: tuple, data: "dict | None") -> None:
+        if data is not None:
+            self.results[key] = (monotonic() + self.result_ttl, data)  # type: ignore
+
+
+class DataLoader:
+    """
+    Coalesces the `load(key)` calls resolvers make while a query executes into as few
+    calls of `batch_load(keys)` as possible, and remembers every result for the rest of
+    the request. A query then makes one lookup per level instead of one per field.
+
+    Get one with `GQLResponse.loader(batch_load)` from inside a resolver, so each request
+    has its own (and its own cache).
+
+    Example:
+    >>> async def users_by_id(ids: list[int]) -> list[dict]:
+    ...     return await db.fetch_users(ids)  # one query for every id
+    >>> async def resolve_author(post, info):
+    ...     return await info.context.loader(users_by_id).load(post["author_id"])
+    """
+
+    def __init__(
+        self,
+        batch_load: "Callable[[list], Awaitable[Iterable] | Iterable]",
+        max_batch_size: "int | None" = None,
+    ):
+        """
+        Args:
+            batch_load (Callable): Takes a list of keys and returns (or returns an awaitable of)
+                their values, in the same order. A value can be an `Exception` to fail just that key.
+            max_batch_size (int): Splits larger batches into several calls. Defaults to no limit.
+        """
+        self.batch_load = batch_load
+        self.max_batch_size = max_batch_size
+        self.cache: dict[Hashable, asyncio.Future] = {}
+        self._queue: list[tuple[Hashable, asyncio.Future]] = []
+
+    def load(self, key: Hashable) -> "asyncio.Future":
+        "Returns a future of the value for `key`, loaded with the next batch unless it's cached."
+        future = self.cache.get(key)
+        if future is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = self.cache[key] = loop.create_future()
+        self._queue.append((key, future))
+        if len(self._queue) == 1:
+            # sibling resolvers run before this callback, so their keys make it into the batch
+            loop.call_soon(self._dispatch)
+        return future
+
+    def load_many(self, keys: "Iterable[Hashable]") -> "asyncio.Future":
+        "Returns a future of the values for every key, in order."
+        return asyncio.gather(*(self.load(key) for key in keys))
+
+    def _dispatch(self) -> None:
+        queue, self._queue = self._queue, []
+        size = self.max_batch_size or len(queue)
+        for start in range(0, len(queue), size):
+            asyncio.ensure_future(self._load_batch(queue[start : start + size]))
+
+    async def _load_batch(self, batch: "list[tuple[Hashable, asyncio.Future]]") -> None:
+        keys = [key for key, _ in batch]
+        try:
+            values = self.batch_load(keys)
+            if isawaitable(values):
+                values = await values
+            values = list(values)  # type: ignore
+            if len(values) != len(keys):
+                raise ValueError(
+                    f"batch_load returned {len(values)} values for {len(keys)} keys."
+                )
+        except Exception as error:
+            for key, future in batch:
+                # failures aren't cached, a later load can try again
+                self.cache.pop(key, None)
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), value in zip(batch, values):
+            if future.done():
+                continue
+            if isinstance(value, Exception):
+                future.set_exception(value)
+            else:
+                future.set_result(value)
@@ -0,0 +1,100 @@
+"""
+Responsible for encoding and decoding JSON, with the fastest library that's installed:
+orjson, then ujson, then the standard library. JSON APIs spend most of their CPU here.
+
+Every backend produces compact JSON (no spaces after separators) and takes `bytes` or
+`str`. Pick one explicitly with `use` or `Server(json_backend=...)`.
+"""
+
+from typing import Any, Callable
+import json
+
+BACKENDS = ("orjson", "ujson", "json")
+"The supported backends, fastest first."
+
+backend: str = "json"
+"The name of the backend in use."
+_dumps: Callable[[Any, bool], bytes]
+_loads: Callable[["bytes | str"], Any]
+
+
+def _stdlib_dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), sort_keys=sort_keys).encode()
+
+
+def _stdlib_loads(data: "bytes | str") -> Any:
+    return json.loads(data)
+
+
+def use(name: str = "auto") -> str:
+    """
+    Switches the JSON backend.
+
+    Args:
+        name (str): `"orjson"`, `"ujson"`, `"json"` (the standard library), or `"auto"` for the
+            fastest one that's installed.
+    Returns:
+        str: The backend now in use.
+    Raises:
+        ImportError: If the requested backend isn't installed.
+    """
+    global backend, _dumps, _loads
+    if name not in (*BACKENDS, "auto"):
+        raise ValueError(f"Unknown JSON backend {name}.")
+    for candidate in BACKENDS if name == "auto" else (name,):
+        if candidate == "orjson":
+            try:
+                import orjson
+            except ImportError:
+                if name == "orjson":
+                    raise ImportError("`json_backend=\"orjson\"` needs orjson, `pip install orjson`.")
+                continue
+
+            def orjson_dumps(obj: Any, sort_keys: bool = False) -> bytes:
+                options = orjson.OPT_NON_STR_KEYS
+                if sort_keys:
+                    options |= orjson.OPT_SORT_KEYS
+                try:
+                    return orjson.dumps(obj, option=options)
+                except TypeError:
+                    # e.g. integers past 64 bits, which the standard library takes
+                    return _stdlib_dumps(obj, sort_keys)
+
+            _dumps, _loads = orjson_dumps, orjson.loads
+        elif candidate == "ujson":
+            try:
+                import ujson
+            except ImportError:
+                if name == "ujson":
+                    raise ImportError("`json_backend=\"ujson\"` needs ujson, `pip install ujson`.")
+                continue
+
+            def ujson_dumps(obj: Any, sort_keys: bool = False) -> bytes:
+                return ujson.dumps(obj, sort_keys=sort_keys).encode()
+
+            _dumps, _loads = ujson_dumps, ujson.loads
+        else:
+            _dumps, _loads = _stdlib_dumps, _stdlib_loads
+        backend = candidate
+        break
+    return backend
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    "Encodes `obj` as compact, `utf-8` encoded JSON."
+    return _dumps(obj, sort_keys)
+
+
+def loads(data: "bytes | bytearray | memoryview | str") -> Any:
+    """
+    Decodes JSON.
+
+    Raises:
+        ValueError: If `data` isn't valid JSON. Every backend's error is a `ValueError`.
+    """
+    if isinstance(data, (bytearray, memoryview)):
+        data = bytes(data)
+    return _loads(data)
+
+
+use()
@@ -0,0 +1,226 @@
+"""
+Responsible for parsing HTTP/1.x requests incrementally, as their bytes arrive, for `AsyncHandler`.
+"""
+
+from dataclasses import dataclass
+
+MAX_HEADER_SIZE = 64 * 1024
+"The default limit on the size of a request line plus its headers, in bytes."
+MAX_BODY_SIZE = 16 * 1024 * 1024
+"The default limit on the size of a request body, in bytes. Bodies are buffered whole."
+
+
+class ParseError(Exception):
+    def __init__(self, code: int, reason: str):
+        """
+        Raised when a request can't be parsed. `code` is the status code to answer with.
+        """
+        super().__init__(reason)
+        self.code = code
+        self.requests: "list[ParsedRequest]" = []
+        "The requests completed before the bad one, by the same `RequestParser.feed` call."
+
+
+class Headers(dict):
+    """
+    Request headers with case-insensitive names. Names are stored lower-cased.
+    """
+
+    def __getitem__(self, key: str) -> str:
+        return super().__getitem__(key.lower())
+
+    def __setitem__(self, key: str, value: str) -> None:
+        super().__setitem__(key.lower(), value)
+
+    def __contains__(self, key: object) -> bool:
+        return super().__contains__(key.lower() if isinstance(key, str) else key)
+
+    def get(self, key: str, default=None):  # type: ignore
+        return super().get(key.lower(), default)
+
+
+@dataclass
+class ParsedRequest:
+    """
+    A complete request, as produced by `RequestParser.feed`.
+    """
+
+    method: str
+    path: str
+    version: str
+    headers: Headers
+    body: bytes = b""
+
+    @property
+    def keep_alive(self) -> bool:
+        "Whether the client wants the connection kept open after this request."
+        connection = self.headers.get("Connection", "").lower()
+        if self.version == "HTTP/1.1":
+            return "close" not in connection
+        return "keep-alive" in connection
+
+
+class RequestParser:
+    """
+    Turns the bytes of a connection into requests, however they're split up by the network.
+
+    The request line and headers are parsed once, when the blank line that ends them
+    arrives. The body is then read according to `Content-Length` or
+    `Transfer-Encoding: chunked`. Bytes after the end of a request are kept for the next
+    one, so pipelined requests work.
+
+    Example:
+    >>> parser = RequestParser()
+    >>> parser.feed(b"GET / HTTP/1.1\\r\\nHo")
+    []
+    >>> parser.feed(b"st: example.com\\r\\n\\r\\n")
+    [ParsedRequest(method='GET', path='/', ...)]
+    """
+
+    def __init__(
+        self, max_header_size: int = MAX_HEADER_SIZE, max_body_size: "int | None" = MAX_BODY_SIZE
+    ):
+        """
+        Args:
+            max_header_size (int): Requests with a longer request line plus headers get a `431`.
+            max_body_size (int): Requests with a larger body get a `413`. `None` for no limit.
+        """
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.buffer = bytearray()
+        "Received bytes that haven't been parsed yet."
+        self._request: ParsedRequest | None = None
+        self._state = "head"
+        "One of `head`, `body`, `chunk_size`, `chunk_data`, `trailers` or `done`."
+        self._remaining = 0
+        self._scanned = 0
+        self._chunks = bytearray()
+
+    def feed(self, data: bytes) -> "list[ParsedRequest]":
+        """
+        Adds bytes received from the client.
+
+        Returns:
+            list[ParsedRequest]: The requests completed by these bytes, in order.
+        Raises:
+            ParseError: If the request is malformed or too large. The connection can't be
+            used for anything else afterwards. The requests before it are in its `requests`.
+        """
+        self.buffer += data
+        done: list[ParsedRequest] = []
+        try:
+            self._parse(done)
+        except ParseError as e:
+            e.requests = done
+            raise
+        return done
+
+    def _parse(self, done: "list[ParsedRequest]") -> None:
+        "Parses as much of `buffer` as possible, adding the completed requests to `done`."
+        while True:
+            if self._state == "head":
+                if not self._parse_head():
+                    break
+            elif self._state == "body":
+                if len(self.buffer) < self._remaining:
+                    break
+                # through a memoryview, so the body is only copied once
+                body = memoryview(self.buffer)[: self._remaining]
+                self._request.body = bytes(body)  # type: ignore
+                body.release()
+                del self.buffer[: self._remaining]
+                self._state = "done"
+            elif self._state == "chunk_size":
+                end = self.buffer.find(b"\r\n")
+                if end == -1:
+                    if len(self.buffer) > 1024:
+                        raise ParseError(400, "Chunk size line too long.")
+                    break
+                try:
+                    size = bytes(memoryview(self.buffer)[:end]).split(b";", 1)[0]
+                    self._remaining = int(size, 16)
+                except ValueError:
+                    raise ParseError(400, "Invalid chunk size.")
+                del self.buffer[: end + 2]
+                self._check_body_size(len(self._chunks) + self._remaining)
+                self._state = "chunk_data" if self._remaining else "trailers"
+            elif self._state == "chunk_data":
+                # the chunk is followed by a CRLF
+                if len(self.buffer) < self._remaining + 2:
+                    break
+                if not self.buffer.startswith(b"\r\n", self._remaining):
+                    raise ParseError(400, "Chunk data doesn't end with CRLF.")
+                self._chunks += memoryview(self.buffer)[: self._remaining]
+                del self.buffer[: self._remaining + 2]
+                self._state = "chunk_size"
+            elif self._state == "trailers":
+                end = self.buffer.find(b"\r\n")
+                if end == -1:
+                    if len(self.buffer) > self.max_header_size:
+                        raise ParseError(431, "Request trailers too large.")
+                    break
+                del self.buffer[: end + 2]
+                if end == 0:
+                    self._request.body = bytes(self._chunks)  # type: ignore
+                    self._chunks = bytearray()
+                    self._state = "done"
+            if self._state == "done":
+                done.append(self._request)  # type: ignore
+                self._request = None
+                self._state = "head"
+
+    def _parse_head(self) -> bool:
+        "Parses the request line and headers, if they've all arrived."
+        # clients may send stray CRLFs between requests
+        while self.buffer.startswith(b"\r\n"):
+            del self.buffer[:2]
+        # don't search the part that's already been searched again
+        end = self.buffer.find(b"\r\n\r\n", max(self._scanned - 3, 0))
+        if end == -1:
+            self._scanned = len(self.buffer)
+            if self._scanned > self.max_header_size:
+                raise ParseError(431, "Request headers too large.")
+            return False
+        if end > self.max_header_size:
+            raise ParseError(431, "Request headers too large.")
+        lines = bytes(memoryview(self.buffer)[:end]).decode("latin-1").split("\r\n")
+        del self.buffer[: end + 4]
+        self._scanned = 0
+
+        request_line = lines[0].split(" ")
+        if len(request_line) != 3:
+            raise ParseError(400, "Malformed request line.")
+        method, path, version = request_line
+        if not version.startswith("HTTP/1."):
+            raise ParseError(505, f"Unsupported protocol {version}.")
+        headers = Headers()
+        for line in lines[1:]:
+            name, colon, value = line.partition(":")
+            if not colon or not name or name != name.strip():
+                raise ParseError(400, "Malformed header.")
+            value = value.strip()
+            if name in headers:
+                value = f"{headers[name]}, {value}"
+            headers[name] = value
+        self._request = ParsedRequest(method.upper(), path, version.upper(), headers)
+
+        transfer_encoding = headers.get("Transfer-Encoding")
+        if transfer_encoding is not None:
+            if transfer_encoding.lower() != "chunked":
+                raise ParseError(501, f"Unsupported transfer encoding {transfer_encoding}.")
+            # Transfer-Encoding wins over Content-Length
+            self._state = "chunk_size"
+            return True
+        try:
+            self._remaining = int(headers.get("Content-Length", 0))
+        except ValueError:
+            raise ParseError(400, "Invalid Content-Length.")
+        if self._remaining < 0:
+            raise ParseError(400, "Invalid Content-Length.")
+        self._check_body_size(self._remaining)
+        self._state = "body" if self._remaining else "done"
+        return True
+
+    def _check_body_size(self, size: int) -> None:
+        if self.max_body_size is not None and size > self.max_body_size:
+            raise ParseError(413, "Request body too large.")
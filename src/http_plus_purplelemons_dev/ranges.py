@@ -0,0 +1,183 @@
+"""
+Responsible for conditional (`304 Not Modified`) and partial (`206 Partial Content`) file responses.
+"""
+
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime, formatdate
+from secrets import token_hex
+from typing import Any, Iterator
+
+MAX_RANGES = 16
+"Requests asking for more ranges than this get the whole file instead."
+
+
+def make_etag(mtime_ns: int, size: int) -> str:
+    "Returns the (strong) ETag of a file version."
+    return f'"{mtime_ns:x}-{size:x}"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """
+    Checks an `If-None-Match` header against an ETag, using the weak comparison.
+    """
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified(headers: Any, etag: str, mtime: float) -> bool:
+    """
+    Whether a `304 Not Modified` can be sent instead of the file.
+
+    Args:
+        headers: The request headers.
+        etag (str): The ETag of the file.
+        mtime (float): The modification time of the file.
+    """
+    if_none_match = headers.get("If-None-Match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is sent
+        return etag_matches(if_none_match, etag)
+    if_modified_since = headers.get("If-Modified-Since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError):
+            return False
+        # Last-Modified only has second precision
+        return int(mtime) <= since
+    return False
+
+
+def parse_range(header: str, size: int) -> "list[tuple[int, int]] | None":
+    """
+    Parses a `Range` header into `[start, end)` byte ranges of a file.
+
+    Args:
+        header (str): The value of the `Range` header, e.g. `bytes=0-99,-100`.
+        size (int): The size of the file.
+    Returns:
+        list[tuple[int,int]]|None: The satisfiable ranges, which is empty if none of them are.
+        `None` if the header is invalid or unsupported and should be ignored.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+    ranges: list[tuple[int, int]] = []
+    split = specs.split(",")
+    if len(split) > MAX_RANGES:
+        return None
+    for spec in split:
+        first, dash, last = spec.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if not first:
+                # suffix range, the last `last` bytes
+                length = int(last)
+                if length < 0:
+                    return None
+                if length:
+                    ranges.append((max(size - length, 0), size))
+                continue
+            start = int(first)
+            end = int(last) + 1 if last else None
+        except ValueError:
+            return None
+        if start < 0 or (end is not None and end <= start):
+            return None
+        if end is None:
+            end = size
+        if start < size:
+            ranges.append((start, min(end, size)))
+    return ranges
+
+
+@dataclass
+class ByteRanges:
+    """
+    The parts of a file sent in a `206 Partial Content` response.
+
+    A single range is sent as-is with a `Content-Range` header, more than one are sent
+    as a `multipart/byteranges` body.
+    """
+
+    ranges: "list[tuple[int, int]]"
+    size: int
+    content_type: str
+    boundary: str = field(default_factory=lambda: token_hex(12))
+
+    def parts(self) -> "Iterator[tuple[bytes, int, int]]":
+        """
+        Yields `(prefix, start, end)` for every part of the body: `prefix` is written as-is
+        and is followed by the file's bytes from `start` up to `end`.
+        """
+        if len(self.ranges) == 1:
+            start, end = self.ranges[0]
+            yield b"", start, end
+            return
+        for start, end in self.ranges:
+            yield (
+                f"\r\n--{self.boundary}\r\n"
+                f"Content-Type: {self.content_type}\r\n"
+                f"Content-Range: bytes {start}-{end - 1}/{self.size}\r\n\r\n"
+            ).encode("latin-1"), start, end
+        yield f"\r\n--{self.boundary}--\r\n".encode("latin-1"), 0, 0
+
+    def headers(self) -> "list[tuple[str, str]]":
+        "Returns the headers for the response, including `Content-length`."
+        length = sum(len(prefix) + end - start for prefix, start, end in self.parts())
+        if len(self.ranges) == 1:
+            start, end = self.ranges[0]
+            return [
+                ("Content-type", self.content_type),
+                ("Content-Range", f"bytes {start}-{end - 1}/{self.size}"),
+                ("Content-length", f"{length}"),
+            ]
+        return [
+            ("Content-type", f"multipart/byteranges; boundary={self.boundary}"),
+            ("Content-length", f"{length}"),
+        ]
+
+
+def negotiate(
+    headers: Any, size: int, mtime_ns: int, content_type: str
+) -> "tuple[int, ByteRanges | None]":
+    """
+    Decides how to answer a `GET` for a file, based on its conditional and `Range` headers.
+
+    Args:
+        headers: The request headers.
+        size (int): The size of the file.
+        mtime_ns (int): The modification time of the file, in nanoseconds.
+        content_type (str): The content type of the file.
+    Returns:
+        tuple[int,ByteRanges|None]: The status code (200, 206, 304 or 416), and the ranges
+        to send if it's 206.
+    """
+    etag = make_etag(mtime_ns, size)
+    mtime = mtime_ns / 1e9
+    if not_modified(headers, etag, mtime):
+        return 304, None
+    range_header = headers.get("Range")
+    if range_header is None:
+        return 200, None
+    if_range = headers.get("If-Range")
+    if if_range is not None and if_range.strip() not in (
+        etag,
+        formatdate(mtime, usegmt=True),
+    ):
+        # the client's copy is out of date, it needs the whole thing
+        return 200, None
+    ranges = parse_range(range_header, size)
+    if ranges is None:
+        return 200, None
+    if not ranges:
+        return 416, None
+    return 206, ByteRanges(ranges, size, content_type)
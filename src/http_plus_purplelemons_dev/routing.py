@@ -0,0 +1,190 @@
+"""
+Responsible for compiling route patterns into a tree and matching request paths against it.
+
+Routes are split on `/` once, when they are registered, so a lookup only walks as many
+nodes as the request path has segments, no matter how many routes are registered.
+"""
+
+from typing import Any, Callable
+
+CONVERTERS: dict[str, Callable[[str], Any]] = {
+    "int": int,
+    "float": float,
+    "str": str,
+    "bool": lambda value: {"true": True, "false": False, "1": True, "0": False}[
+        value.lower()
+    ],
+}
+"Type names usable in `:name:type` route segments, mapped to their converters."
+
+
+def compile_segment(segment: str) -> "tuple[str, Callable[[str], Any]] | None":
+    """
+    Parses a `:name` or `:name:type` route segment.
+
+    Args:
+        segment (str): A single segment of a route, e.g. `:id:int`.
+    Returns:
+        tuple[str,Callable]|None: The parameter name and its converter, or `None` if the
+        segment is not a keyword segment.
+    """
+    if not segment.startswith(":"):
+        return None
+    split = segment.split(":")[1:]
+    # standard route syntax validation
+    if len(split) == 2:
+        name, type_ = split
+    elif len(split) == 1:
+        name, type_ = split[0], "str"
+    else:
+        raise ValueError("Invalid route syntax.")
+    try:
+        return name, CONVERTERS[type_]
+    except KeyError:
+        raise ValueError(f"Invalid type {type_}.")
+
+
+def match_route(path: str, route: str) -> "dict[str, Any] | None":
+    """
+    Matches a request path against a single route, segment by segment, with the same
+    syntax as `RouteTree`. Use a `RouteTree` to match against many routes.
+
+    Args:
+        path (str): The path from the request, without the query string.
+        route (str): The route, e.g. `/product/:id:int`.
+    Returns:
+        dict[str,Any]|None: The converted keyword variables from the route, or `None` if
+        `path` doesn't match it.
+    """
+    segments = path.split("/")
+    route_segments = route.split("/")
+    if len(segments) != len(route_segments):
+        return None
+    params: dict[str, Any] = {}
+    for segment, route_segment in zip(segments, route_segments):
+        if route_segment == "*":
+            continue
+        compiled = compile_segment(route_segment)
+        if compiled is None:
+            if segment != route_segment:
+                return None
+            continue
+        name, converter = compiled
+        try:
+            params[name] = converter(segment)
+        except (KeyError, ValueError):
+            return None
+    return params
+
+
+class RouteNode:
+    """
+    A single path segment in a `RouteTree`.
+
+    Children are checked in order of specificity: static segments, then keyword
+    segments (in the order they were registered), then `*` wildcards.
+    """
+
+    __slots__ = ("static", "params", "wildcard", "func", "route")
+
+    def __init__(self):
+        self.static: dict[str, RouteNode] = {}
+        self.params: list[tuple[str, str, Callable[[str], Any], RouteNode]] = []
+        self.wildcard: RouteNode | None = None
+        self.func: Callable | None = None
+        self.route: str | None = None
+
+    def child(self, segment: str) -> "RouteNode":
+        """
+        Returns the child node for a route segment, creating it if it doesn't exist.
+        """
+        if segment == "*":
+            if self.wildcard is None:
+                self.wildcard = RouteNode()
+            return self.wildcard
+        compiled = compile_segment(segment)
+        if compiled is None:
+            try:
+                return self.static[segment]
+            except KeyError:
+                node = self.static[segment] = RouteNode()
+                return node
+        name, converter = compiled
+        for _, param_segment, _, node in self.params:
+            if param_segment == segment:
+                return node
+        node = RouteNode()
+        self.params.append((name, segment, converter, node))
+        return node
+
+
+class RouteTree:
+    """
+    Prefix tree of compiled routes for a single HTTP method.
+
+    Example:
+    >>> tree = RouteTree()
+    >>> tree.insert("/product/:id:int", func)
+    >>> tree.lookup("/product/12")
+    (func, {"id": 12})
+    """
+
+    def __init__(self):
+        self.root = RouteNode()
+
+    def insert(self, route: str, func: Callable) -> None:
+        """
+        Compiles `route` into the tree. Registering the same route twice overwrites it.
+
+        Args:
+            route (str): The route, e.g. `/product/:id:int`.
+            func (Callable): The function to respond with.
+        """
+        node = self.root
+        for segment in route.split("/"):
+            node = node.child(segment)
+        node.func = func
+        node.route = route
+
+    def lookup(self, path: str) -> "tuple[Callable, dict[str, Any]] | None":
+        """
+        Matches a request path against the tree.
+
+        Args:
+            path (str): The path from the request, without the query string.
+        Returns:
+            tuple[Callable,dict[str,Any]]|None: The matched function and the converted keyword
+            variables from the route, or `None` if no route matches.
+        """
+        params: dict[str, Any] = {}
+        node = self._lookup(self.root, path.split("/"), 0, params)
+        if node is None:
+            return None
+        return node.func, params  # type: ignore
+
+    def _lookup(
+        self, node: RouteNode, segments: list[str], depth: int, params: dict[str, Any]
+    ) -> "RouteNode | None":
+        if depth == len(segments):
+            return node if node.func is not None else None
+        segment = segments[depth]
+
+        child = node.static.get(segment)
+        if child is not None:
+            found = self._lookup(child, segments, depth + 1, params)
+            if found is not None:
+                return found
+
+        for name, _, converter, child in node.params:
+            try:
+                value = converter(segment)
+            except (KeyError, ValueError):
+                continue
+            found = self._lookup(child, segments, depth + 1, params)
+            if found is not None:
+                params[name] = value
+                return found
+
+        if node.wildcard is not None:
+            return self._lookup(node.wildcard, segments, depth + 1, params)
+        return None
@@ -2,12 +2,13 @@
 f"""
 Currently only supports command line usage. Do not use this in production.
 Usage:
-    `$ python -m http_plus_purplelemons_dev [-p PORT] [-d] [--bind IP] [-i] [--log '<fmt>'] [-s] [--page-dir PATH] [--error-dir PATH]`
+    `$ python -m http_plus_purplelemons_dev [-p PORT] [-d] [--bind IP] [-i] [--log '<fmt>'] [-s] [--page-dir PATH] [--error-dir PATH] [--brython-runtime PATH] [-b]`
 
 Run `$ python -m http_plus_purplelemons_dev -h` for more information.
 """
 
 from . import init, Server, Request, Response, NAME
+from .brython import Runtime, build_pages
 
 assert __name__ == "__main__", f"Do not import this module. Please run this module directly via `python -m {NAME}`."
 
@@ -19,10 +20,12 @@ parser.add_argument("-p", "--port", type=int, default=8000, help="The port to li
 parser.add_argument("-d", "--debug", action="store_true", help="Enables debug mode.")
 parser.add_argument("--bind", type=str, help="The host IP to listen on.")
 parser.add_argument("-i","--init", action="store_true", help="Does not start the server, but instead initializes the current directory for HTTP+")
+parser.add_argument("-b","--build", action="store_true", help="Does not start the server, but instead assembles every brython page in the page directory ahead of time.")
 parser.add_argument("--log","--format", metavar="'<fmt>'", type=str, help="The format for the log message. !ip is the client IP, !date is the day in YYYY/MM/DD, !time is the time in HH:MM:SS, !method is the HTTP request method, !path is the URI, !status is the HTTP response code, and !proto is the HTTP protocol version the request is made over.")
 parser.add_argument("-s", "--save", action="store_true", help="Saves the log to a file.")
 parser.add_argument("--page-dir", metavar="PATH", type=str, default="./pages", help="The directory to serve pages from.")
 parser.add_argument("--error-dir", metavar="PATH", type=str, default="./errors", help="The directory to serve error pages from.")
+parser.add_argument("--brython-runtime", metavar="PATH", type=str, help="A directory with brython.min.js and brython_stdlib.js to serve instead of linking pages to jsDelivr.")
 
 args = parser.parse_args()
 
@@ -30,10 +33,17 @@ if args.init:
     init()
     exit(0)
 
+if args.build:
+    runtime = Runtime(args.brython_runtime) if args.brython_runtime else None
+    for built in build_pages(args.page_dir, runtime):
+        print(f"Built {built}")
+    exit(0)
+
 server = Server(
     page_dir = args.page_dir,
     error_dir = args.error_dir,
-    debug = args.debug
+    debug = args.debug,
+    brython_runtime = args.brython_runtime
 )
 
 if args.log is not None:
@@ -6,44 +6,10 @@ def SEND_RESPONSE_CODE(code:int, path:str="", traceback:str="") -> str:
     Used explicitly for error code responses (400-599) for now.
     Informational responses should be header-only,
     and sucessful responses *usually* require a specified body.
+
+    Renders the page from scratch, see `error_body` for the pre-rendered ones.
     """
-    return {
-        # 400-499 - client error
-        400: _400,
-        401: _401,
-        403: _403,
-        404: _404,
-        405: _405,
-        406: _406,
-        407: _407,
-        408: _408,
-        409: _409,
-        410: _410,
-        411: _411,
-        412: _412,
-        413: _413,
-        414: _414,
-        415: _415,
-        416: _416,
-        417: _417,
-        418: _418,
-        421: _421,
-        426: _426,
-        428: _428,
-        429: _429,
-        431: _431,
-        451: _451,
-        # 500-599 - server error
-        500: _500,
-        501: _501,
-        502: _502,
-        503: _503,
-        504: _504,
-        505: _505,
-        506: _506,
-        510: _510,
-        511: _511,
-    }[code](path, traceback=traceback)
+    return ERROR_PAGES[code](path, traceback=traceback)
 
 def generate_html(code:int, title:str, body:str, traceback:str, include_explanation:bool=True) -> str:
     explanation = f"<p>Read more about the error <a href='https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/{code}'>here</a>.</p>" if include_explanation else ""
@@ -301,3 +267,71 @@ def _511(path:str="", *args, **kwargs) -> str:
     """
     message = f'"{path}"' if path else "The page you were looking for"
     return generate_html(511,"Network Authentication Required",f"{message} requires <em>network</em> authentication to access.", *args, **kwargs)
+
+
+ERROR_PAGES = {
+    # 400-499 - client error
+    400: _400,
+    401: _401,
+    403: _403,
+    404: _404,
+    405: _405,
+    406: _406,
+    407: _407,
+    408: _408,
+    409: _409,
+    410: _410,
+    411: _411,
+    412: _412,
+    413: _413,
+    414: _414,
+    415: _415,
+    416: _416,
+    417: _417,
+    418: _418,
+    421: _421,
+    426: _426,
+    428: _428,
+    429: _429,
+    431: _431,
+    451: _451,
+    # 500-599 - server error
+    500: _500,
+    501: _501,
+    502: _502,
+    503: _503,
+    504: _504,
+    505: _505,
+    506: _506,
+    510: _510,
+    511: _511,
+}
+"Status codes mapped to the function that renders their page."
+
+# stands in for the path while the pages are rendered, so it can be cut out of them again
+_PATH = "\x00path\x00"
+_RENDERED = {
+    code: (
+        page(traceback="").encode(),
+        tuple(part.encode() for part in page(_PATH, traceback="").split(_PATH)),
+    )
+    for code, page in ERROR_PAGES.items()
+}
+"Status codes mapped to their encoded page without a path, and the encoded parts around the path."
+
+def error_body(code:int, path:str="", traceback:str="") -> bytes:
+    """
+    Returns the encoded page for an error code. The pages are rendered once, when this module
+    is imported, so only pages with a `traceback` (debug mode) are rendered per request.
+
+    Args:
+        code (int): One of the codes in `ERROR_PAGES`.
+        path (str): The path (or message) the page mentions.
+        traceback (str): Shown on the page, for debugging.
+    """
+    if traceback:
+        return SEND_RESPONSE_CODE(code, path, traceback).encode()
+    default, parts = _RENDERED[code]
+    if not path:
+        return default
+    return path.encode().join(parts)
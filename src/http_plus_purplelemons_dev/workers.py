@@ -0,0 +1,272 @@
+"""
+Responsible for how the server spreads connections over threads and processes.
+
+`PooledHTTPServer` handles connections on a fixed pool of threads, see
+`Server(max_workers=N, backlog=M)`.
+
+`supervise` runs the server in several processes, see `Server.listen(..., workers=N)`.
+The parent process only supervises: it forks the workers, restarts any that die, and
+forwards `SIGTERM`/`SIGINT` to them so they can finish their in-flight requests.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
+from socketserver import BaseServer
+from time import monotonic, sleep
+from traceback import print_exc
+from typing import Callable
+import os
+import signal
+import socket
+import threading
+from .static_responses import error_body
+
+RESTART_BACKOFF = 1.0
+"Workers that die sooner than this (in seconds) after starting are restarted after a pause."
+REJECT_LINGER = 1.0
+"How long (in seconds) a connection turned away with a `503` is kept open, so it can be read."
+MAX_LINGERING = 256
+"Rejected connections past this many are closed straight away instead of lingering."
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    `HTTPServer` that handles connections on a fixed pool of threads instead of starting
+    a thread for each one.
+
+    At most `max_workers` connections are handled at once and `backlog` more wait for a
+    free thread. Anything past that is turned away with a `503` straight away, so a traffic
+    spike can't pile up threads or memory. Note that a keep-alive connection holds on to its
+    thread until it's closed.
+    """
+
+    def __init__(
+        self,
+        server_address: "tuple[str, int]",
+        RequestHandlerClass: "type[BaseHTTPRequestHandler]",
+        max_workers: int,
+        backlog: int = 0,
+        bind_and_activate: bool = True,
+    ):
+        super().__init__(server_address, RequestHandlerClass, bind_and_activate)
+        self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="http+")
+        self.capacity = max_workers + backlog
+        self.in_flight = 0
+        "Connections being handled or waiting for a thread."
+        self._lock = threading.Lock()
+        body = error_body(503)
+        self.rejection = (
+            b"HTTP/1.1 503 Service Unavailable\r\n"
+            b"Content-type: text/html\r\n"
+            b"Content-length: %d\r\n"
+            b"Retry-After: 1\r\n"
+            b"Connection: close\r\n\r\n%b" % (len(body), body)
+        )
+        "The whole `503` response sent by `reject`."
+        self.lingering: deque[tuple[float, socket.socket]] = deque()
+        "Rejected connections and when to close them, see `reject`."
+
+    def busy(self) -> bool:
+        return self.in_flight > 0
+
+    def process_request(self, request, client_address) -> None:
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                full = True
+            else:
+                full = False
+                self.in_flight += 1
+        if full:
+            self.reject(request)
+            return
+        try:
+            self.pool.submit(self.process_request_thread, request, client_address)
+        except RuntimeError:
+            # the pool has been shut down
+            self._done()
+            self.shutdown_request(request)
+
+    def process_request_thread(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._done()
+
+    def _done(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def reject(self, request: socket.socket) -> None:
+        """
+        Answers a connection with `503 Service Unavailable` without reading the request.
+        Runs on the accepting thread, so it never waits on the client.
+
+        Closing a socket with unread bytes makes the kernel reset the connection, which can
+        destroy the `503` before the client reads it. So the connection is half-closed after
+        the response, and only closed (after draining what the client sent) `REJECT_LINGER`
+        seconds later, by `close_rejected`.
+        """
+        try:
+            request.setblocking(False)
+            request.send(self.rejection)
+            request.shutdown(socket.SHUT_WR)
+        except OSError:
+            self.close_request(request)
+            return
+        self.lingering.append((monotonic() + REJECT_LINGER, request))
+        self.close_rejected()
+
+    def close_rejected(self, everything: bool = False) -> None:
+        "Closes the rejected connections that are done lingering, or all of them."
+        now = monotonic()
+        while self.lingering and (
+            everything or self.lingering[0][0] <= now or len(self.lingering) > MAX_LINGERING
+        ):
+            _, request = self.lingering.popleft()
+            try:
+                # bounded, a client that keeps sending just gets reset
+                for _ in range(16):
+                    if not request.recv(65536):
+                        break
+            except OSError:  # includes nothing left to read
+                pass
+            self.close_request(request)
+
+    def service_actions(self) -> None:
+        super().service_actions()
+        self.close_rejected()
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.close_rejected(everything=True)
+        self.pool.shutdown(wait=False)
+
+
+def make_httpd(
+    server_address: "tuple[str, int]",
+    RequestHandlerClass: "type[BaseHTTPRequestHandler]",
+    *,
+    max_workers: "int | None" = None,
+    backlog: int = 0,
+    reuse_port: bool = False,
+) -> HTTPServer:
+    """
+    Creates and binds the server that `Server.listen` runs.
+
+    Args:
+        server_address (tuple[str,int]): The IP and port to listen on.
+        RequestHandlerClass (type): The handler class, usually `Handler`.
+        max_workers (int): Use a `PooledHTTPServer` with this many threads. Defaults to
+            `None`, a `ThreadingHTTPServer` with a thread per connection.
+        backlog (int): How many connections can wait for a thread of the pool.
+        reuse_port (bool): Bind with `SO_REUSEPORT`, so several processes can each have
+            their own listening socket on the same port.
+    """
+    httpd: HTTPServer
+    if max_workers is None:
+        httpd = ThreadingHTTPServer(
+            server_address, RequestHandlerClass, bind_and_activate=False
+        )
+    else:
+        httpd = PooledHTTPServer(
+            server_address,
+            RequestHandlerClass,
+            max_workers,
+            backlog,
+            bind_and_activate=False,
+        )
+    try:
+        if reuse_port:
+            httpd.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        httpd.server_bind()
+        httpd.server_activate()
+    except BaseException:
+        httpd.server_close()
+        raise
+    return httpd
+
+
+def serve_worker(httpd: BaseServer, drain_timeout: float) -> None:
+    """
+    Serves until `SIGTERM` or `SIGINT`, then stops accepting connections and gives
+    in-flight requests up to `drain_timeout` seconds to finish. Keep-alive connections are
+    closed after their current response (the handler's `stopping`).
+    """
+
+    def stop(signum, frame):
+        httpd.RequestHandlerClass.stopping = True  # type: ignore
+        # `shutdown` blocks until `serve_forever` returns, so it can't run on this thread
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    httpd.serve_forever()
+    # not `server_close`, the other workers may still be using an inherited socket
+    httpd.socket.close()
+    busy = getattr(httpd, "busy", lambda: threading.active_count() > 1)
+    deadline = monotonic() + drain_timeout
+    while busy() and monotonic() < deadline:
+        sleep(0.05)
+
+
+def supervise(workers: int, serve: Callable[[], None]) -> None:
+    """
+    Forks `workers` processes that each run `serve`, restarting them when they die,
+    until the supervisor receives `SIGTERM` or `SIGINT`.
+
+    Args:
+        workers (int): How many worker processes to keep running.
+        serve (Callable): What each worker runs. Should return once the worker is signalled to stop.
+    """
+    if not hasattr(os, "fork"):
+        raise OSError("Multiple workers need `os.fork`, which this platform doesn't have.")
+    children: dict[int, float] = {}
+    "Worker pids mapped to when they were started."
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            # the supervisor's handlers would signal our siblings
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            code = 0
+            try:
+                serve()
+            except BaseException:
+                print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        if monotonic() - started < RESTART_BACKOFF:
+            # probably crashing on startup, don't fork-bomb the machine
+            sleep(RESTART_BACKOFF)
+        if not stopping:
+            spawn()
@@ -0,0 +1,102 @@
+"""
+Measures what a request's `Request` and `Response` objects cost, allocated fresh for every
+request or reused (`Server(reuse_objects=True)`), and the latency of a keep-alive client
+against `Server` and `AsyncServer` either way.
+
+Usage:
+    `$ python tests/benchmark.py [-n REQUESTS]`
+"""
+
+import argparse
+import http.client
+import threading
+import tracemalloc
+from time import perf_counter, sleep
+from types import SimpleNamespace
+import http_plus_purplelemons_dev as http_plus
+
+parser = argparse.ArgumentParser(description="Benchmarks request objects.")
+parser.add_argument("-n", "--requests", type=int, default=5000, help="How many requests to time.")
+args = parser.parse_args()
+
+# just enough of a handler for `Request` and `Response`
+handler = SimpleNamespace(
+    path="/users/42",
+    command="get",
+    headers={"Authorization": "Bearer token", "Content-Type": "application/json"},
+    body=b'{"name": "lemon"}',
+    client_address=("127.0.0.1", 50000),
+    reuse_objects=False,
+    spare_request=None,
+    spare_response=None,
+)
+params = {"id": 42}
+
+
+def make_objects(reuse: bool):
+    handler.reuse_objects = reuse
+    request = http_plus.Handler.new_request(handler, params)  # type: ignore
+    response = http_plus.Handler.new_response(handler)  # type: ignore
+    response.set_body("ok")
+    return request, response
+
+
+def objects(reuse: bool, n: int) -> "tuple[float, float]":
+    "Returns the time (ns) and the memory allocated (bytes) per request."
+    kept = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(1000):
+        # kept alive, like they would be while their requests are in flight
+        kept.append(make_objects(reuse))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename")) / 1000
+    kept.clear()
+
+    start = perf_counter()
+    for _ in range(n):
+        make_objects(reuse)
+    return (perf_counter() - start) / n * 1e9, allocated
+
+
+def latency(server_class: type, reuse: bool, port: int, n: int) -> float:
+    "Returns the mean latency (µs) of `n` keep-alive requests."
+    server = server_class(page_dir="./nonexistent", reuse_objects=reuse, max_keep_alive_requests=None)
+
+    @server.get("/users/:id:int")
+    def _(req: http_plus.Request, res: http_plus.Response):
+        return res.set_body(f"user {req.params.id}")
+
+    threading.Thread(target=server.listen, args=(port, "127.0.0.1"), daemon=True).start()
+    sleep(0.5)
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    for _ in range(100):
+        # warm up
+        connection.request("GET", "/users/42")
+        connection.getresponse().read()
+    start = perf_counter()
+    for _ in range(n):
+        connection.request("GET", "/users/42")
+        connection.getresponse().read()
+    elapsed = perf_counter() - start
+    connection.close()
+    return elapsed / n * 1e6
+
+
+# the servers would print every request
+http_plus.Handler.log_message = lambda self, *args: None  # type: ignore
+
+print(f"{'':<26}{'ns/request':>12}{'bytes/request':>15}")
+for reuse in (False, True):
+    ns, allocated = objects(reuse, args.requests * 20)
+    print(f"{'objects, ' + ('reused' if reuse else 'fresh'):<26}{ns:>12.0f}{allocated:>15.0f}")
+
+print(f"\n{'':<26}{'µs/request':>12}")
+port = 8700
+for server_class in (http_plus.Server, http_plus.AsyncServer):
+    for reuse in (False, True):
+        port += 1
+        us = latency(server_class, reuse, port, args.requests)
+        name = f"{server_class.__name__}, {'reused' if reuse else 'fresh'}"
+        print(f"{name:<26}{us:>12.1f}")
@@ -1,5 +1,4 @@
 
-import aiofiles
 import asyncio
 from asyncio.transports import Transport
 
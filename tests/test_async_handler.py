@@ -0,0 +1,351 @@
+"""
+Tests for how `AsyncHandler` writes responses and applies back-pressure, with a fake
+transport standing in for the connection.
+"""
+
+import asyncio
+import threading
+import pytest
+import http_plus_purplelemons_dev as http_plus
+from http_plus_purplelemons_dev.cache import AssetCache
+
+
+class FakeTransport:
+    "Records what `AsyncHandler` does to its connection."
+
+    def __init__(self):
+        self.calls: "list[tuple[str, bytes]]" = []
+        "`(\"write\" or \"writelines\", data)` for every write."
+        self.closing = False
+        self.reading = True
+
+    def set_write_buffer_limits(self, high: int, low: int) -> None:
+        pass
+
+    def get_extra_info(self, name: str, default=None):
+        return ("127.0.0.1", 50000) if name == "peername" else default
+
+    def write(self, data: bytes) -> None:
+        self.calls.append(("write", bytes(data)))
+
+    def writelines(self, lines) -> None:
+        self.calls.append(("writelines", b"".join(lines)))
+
+    def pause_reading(self) -> None:
+        self.reading = False
+
+    def resume_reading(self) -> None:
+        self.reading = True
+
+    def is_closing(self) -> bool:
+        return self.closing
+
+    def close(self) -> None:
+        self.closing = True
+
+    @property
+    def written(self) -> bytes:
+        return b"".join(data for _, data in self.calls)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    server = http_plus.AsyncServer(page_dir=str(tmp_path), error_dir=str(tmp_path), max_pending=4)
+    # set by `AsyncServer.serve`, which these tests don't go through
+    monkeypatch.setattr(server.handler, "create_task", None)
+    monkeypatch.setattr(server.handler, "sync_slots", None)
+
+    @server.get("/async-handler/hello")
+    async def hello(req: http_plus.Request, res: http_plus.Response):
+        return res.set_body("hello")
+
+    return server
+
+
+async def connect(server) -> "tuple[http_plus.AsyncHandler, FakeTransport]":
+    server.handler.create_task = asyncio.get_running_loop().create_task
+    handler = server.handler()
+    transport = FakeTransport()
+    handler.connection_made(transport)  # type: ignore
+    return handler, transport
+
+
+async def settle() -> None:
+    "Lets the handler's callbacks and tasks run."
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_response_is_a_single_write(server):
+    async def run():
+        handler, transport = await connect(server)
+        handler.data_received(b"GET /async-handler/hello HTTP/1.1\r\n\r\n")
+        await settle()
+        return transport
+
+    transport = asyncio.run(run())
+    assert len(transport.calls) == 1
+    kind, response = transport.calls[0]
+    assert kind == "writelines"
+    head, _, body = response.partition(b"\r\n\r\n")
+    lines = head.split(b"\r\n")
+    assert lines[0] == b"HTTP/1.1 200 OK"
+    assert any(line.startswith(b"Date: ") for line in lines)
+    assert b"Content-Length: 5" in lines
+    assert body == b"hello"
+
+
+def test_pipelined_responses_are_a_write_each(server):
+    async def run():
+        handler, transport = await connect(server)
+        handler.data_received(b"GET /async-handler/hello HTTP/1.1\r\n\r\n" * 3)
+        await settle()
+        return transport
+
+    transport = asyncio.run(run())
+    assert [kind for kind, _ in transport.calls] == ["writelines"] * 3
+    assert transport.written.count(b"\r\n\r\nhello") == 3
+    assert not transport.closing
+
+
+def test_reading_pauses_while_too_many_requests_are_pending(server):
+    async def run():
+        gate = asyncio.Event()
+
+        @server.get("/async-handler/slow")
+        async def slow(req: http_plus.Request, res: http_plus.Response):
+            await gate.wait()
+            return res.set_body("slow")
+
+        handler, transport = await connect(server)
+        # one being answered, `max_pending` (4) waiting
+        handler.data_received(b"GET /async-handler/slow HTTP/1.1\r\n\r\n" * 5)
+        await settle()
+        paused = not transport.reading
+        gate.set()
+        await settle()
+        return paused, transport
+
+    paused, transport = asyncio.run(run())
+    assert paused
+    assert transport.reading
+    assert transport.written.count(b"\r\n\r\nslow") == 5
+
+
+def test_no_new_response_while_the_client_is_not_reading(server):
+    async def run():
+        handler, transport = await connect(server)
+        handler.pause_writing()
+        handler.data_received(b"GET /async-handler/hello HTTP/1.1\r\n\r\n" * 2)
+        await settle()
+        written_while_paused = transport.written
+        paused = not transport.reading
+        handler.resume_writing()
+        await settle()
+        return written_while_paused, paused, transport
+
+    written_while_paused, paused, transport = asyncio.run(run())
+    assert written_while_paused == b""
+    assert paused
+    assert transport.reading
+    assert transport.written.count(b"\r\n\r\nhello") == 2
+
+
+def test_stream_waits_for_the_client_between_chunks(server):
+    async def run():
+        @server.get("/async-handler/stream")
+        async def stream(req: http_plus.Request, res: http_plus.Response):
+            return res.set_body(["a", "b", "c"])
+
+        handler, transport = await connect(server)
+        handler.pause_writing()
+        # the request was already being answered when the buffer filled up
+        handler.busy = True
+        (request,) = handler.parser.feed(b"GET /async-handler/stream HTTP/1.1\r\n\r\n")
+        handler.handle_request(request)
+        await settle()
+        written_while_paused = transport.written
+        handler.resume_writing()
+        await settle()
+        return written_while_paused, transport
+
+    written_while_paused, transport = asyncio.run(run())
+    # the headers and the first chunk, then it waits
+    assert written_while_paused.endswith(b"\r\n\r\n1\r\na\r\n")
+    assert transport.written.endswith(b"1\r\na\r\n1\r\nb\r\n1\r\nc\r\n0\r\n\r\n")
+
+
+def test_drain_fails_once_the_client_is_gone(server):
+    async def run():
+        handler, transport = await connect(server)
+        handler.pause_writing()
+        drain = asyncio.ensure_future(handler.drain())
+        await settle()
+        waiting = not drain.done()
+        transport.close()
+        handler.connection_lost(None)
+        with pytest.raises(ConnectionResetError):
+            await drain
+        return waiting
+
+    assert asyncio.run(run())
+
+
+def test_parse_error_is_answered_after_the_requests_before_it(server):
+    async def run():
+        handler, transport = await connect(server)
+        handler.data_received(b"GET /async-handler/hello HTTP/1.1\r\n\r\n" * 2 + b"garbage\r\n\r\n")
+        await settle()
+        # nothing after the bad request is read
+        handler.data_received(b"GET /async-handler/hello HTTP/1.1\r\n\r\n")
+        await settle()
+        return transport
+
+    transport = asyncio.run(run())
+    responses = transport.written.split(b"HTTP/1.1 ")[1:]
+    assert [response[:3] for response in responses] == [b"200", b"200", b"400"]
+    assert b"Connection: close" in responses[2]
+    assert transport.closing
+
+
+def test_failing_stream_closes_the_connection(server):
+    async def run():
+        async def chunks():
+            yield "first"
+            raise ValueError("the stream broke")
+
+        @server.get("/async-handler/broken")
+        async def broken(req: http_plus.Request, res: http_plus.Response):
+            return res.set_body(chunks())
+
+        handler, transport = await connect(server)
+        handler.data_received(
+            b"GET /async-handler/broken HTTP/1.1\r\n\r\nGET /async-handler/hello HTTP/1.1\r\n\r\n"
+        )
+        await settle()
+        return transport
+
+    transport = asyncio.run(run())
+    assert transport.closing
+    # the body isn't terminated, so the client can tell it was cut short
+    assert transport.written.endswith(b"5\r\nfirst\r\n")
+    assert b"hello" not in transport.written
+
+
+def test_request_bodies_are_bounded(server):
+    limit = server.handler.max_body_size
+    assert limit is not None
+
+    async def run():
+        # too large up front: answered before the body arrives
+        handler, transport = await connect(server)
+        handler.data_received(b"POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % (limit + 1))
+        await settle()
+        assert transport.written.startswith(b"HTTP/1.1 413 ")
+        assert transport.closing
+
+        # a chunked body that never ends stops being buffered at the limit
+        handler, transport = await connect(server)
+        handler.data_received(b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n")
+        chunk = b"10000\r\n" + b"a" * 0x10000 + b"\r\n"
+        while handler.parser is not None:
+            parser = handler.parser
+            handler.data_received(chunk)
+            assert len(parser.buffer) + len(parser._chunks) <= limit + len(chunk)
+        await settle()
+        assert transport.written.startswith(b"HTTP/1.1 413 ")
+        assert transport.closing
+
+    asyncio.run(run())
+
+
+async def answered(transport: FakeTransport) -> None:
+    "Waits for a response that needs the executor."
+    for _ in range(200):
+        if transport.calls:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_the_disk_is_only_touched_on_the_executor(server, tmp_path, monkeypatch):
+    (tmp_path / "style.css").write_bytes(b"body {}")
+    (tmp_path / "404").mkdir()
+    (tmp_path / "404" / ".html").write_bytes(b"custom 404")
+    cache = AssetCache(1024 * 1024)
+    monkeypatch.setattr(server.handler, "asset_cache", cache)
+    monkeypatch.setattr(server.handler, "error_cache", AssetCache(1024 * 1024))
+    loaded_on = []
+    load_file = server.handler._load_file
+
+    def recording_load_file(self, filename, cache):
+        loaded_on.append(threading.get_ident())
+        return load_file(self, filename, cache)
+
+    monkeypatch.setattr(server.handler, "_load_file", recording_load_file)
+
+    async def run():
+        responses = []
+        for path in ("/style.css", "/style.css", "/missing.css", "/missing.css"):
+            handler, transport = await connect(server)
+            handler.data_received(f"GET {path} HTTP/1.1\r\n\r\n".encode())
+            await answered(transport)
+            responses.append(transport.written)
+        return responses
+
+    responses = asyncio.run(run())
+    assert [response.split(b"\r\n", 1)[0] for response in responses] == [
+        b"HTTP/1.1 200 OK",
+        b"HTTP/1.1 200 OK",
+        b"HTTP/1.1 404 Not Found",
+        b"HTTP/1.1 404 Not Found",
+    ]
+    assert responses[0].endswith(b"\r\n\r\nbody {}") and responses[1].endswith(b"\r\n\r\nbody {}")
+    assert responses[2].endswith(b"\r\n\r\ncustom 404")
+    # only the misses were loaded, on the executor's threads
+    assert len(loaded_on) == 2
+    assert threading.get_ident() not in loaded_on
+
+
+def test_head_closes_streamed_bodies(server):
+    closed = []
+
+    def chunks():
+        try:
+            yield "first"
+            yield "second"
+        finally:
+            closed.append("sync")
+
+    async def async_chunks():
+        try:
+            yield "first"
+            yield "second"
+        finally:
+            closed.append("async")
+
+    async def run():
+        sync_stream, async_stream = chunks(), async_chunks()
+        # started already, e.g. to find out the body isn't empty
+        next(sync_stream)
+        await async_stream.__anext__()
+
+        @server.head("/async-handler/sync-stream")
+        async def sync(req: http_plus.Request, res: http_plus.Response):
+            return res.set_body(sync_stream)
+
+        @server.head("/async-handler/async-stream")
+        async def async_(req: http_plus.Request, res: http_plus.Response):
+            return res.set_body(async_stream)
+
+        handler, transport = await connect(server)
+        handler.data_received(
+            b"HEAD /async-handler/sync-stream HTTP/1.1\r\n\r\n"
+            b"HEAD /async-handler/async-stream HTTP/1.1\r\n\r\n"
+        )
+        await settle()
+        return transport
+
+    transport = asyncio.run(run())
+    assert transport.written.count(b"HTTP/1.1 200 OK") == 2
+    assert b"first" not in transport.written
+    assert closed == ["sync", "async"]
@@ -0,0 +1,80 @@
+"""
+Tests for how a vendored brython `Runtime` is served: each encoding has its own `ETag`, and
+`304`s are only sent for the variant the client would get.
+"""
+
+import socket
+import pytest
+import http_plus_purplelemons_dev as http_plus
+from http_plus_purplelemons_dev.brython import Runtime
+from test_keep_alive import async_server, read_response, sync_server
+
+CORE = b"var __BRYTHON__ = {};\n" * 200
+
+
+@pytest.fixture
+def runtime(tmp_path) -> Runtime:
+    directory = tmp_path / "brython"
+    directory.mkdir()
+    (directory / "brython.min.js").write_bytes(CORE)
+    (directory / "brython_stdlib.js").write_bytes(b'var scripts = {"$timestamp": 1}\n')
+    return Runtime(str(directory))
+
+
+def test_each_encoding_has_its_own_etag(runtime):
+    file = runtime.get(runtime.core_url)
+    tags = set()
+    for accept_encoding in (None, "gzip", "identity, gzip;q=0"):
+        code, body, headers = file.negotiate(accept_encoding)
+        headers = dict(headers)
+        assert code == 200
+        assert headers["Vary"] == "Accept-Encoding"
+        assert int(headers["Content-Length"]) == len(body)
+        tags.add((headers["ETag"], headers.get("Content-Encoding")))
+    assert tags == {(file.etag, None), (file.variant_etag("gzip"), "gzip")}
+    assert file.etag != file.variant_etag("gzip")
+
+
+def test_not_modified_only_for_the_same_variant(runtime):
+    file = runtime.get(runtime.core_url)
+    gzip_etag = file.variant_etag("gzip")
+    code, body, headers = file.negotiate("gzip", gzip_etag)
+    assert (code, body) == (304, b"")
+    assert dict(headers)["ETag"] == gzip_etag
+    # the client cached the gzip variant but now wants the file as is, or the other way round
+    assert file.negotiate(None, gzip_etag)[0] == 200
+    assert file.negotiate("gzip", file.etag)[0] == 200
+    assert file.negotiate(None, f'"other", {file.etag}')[0] == 304
+    assert file.negotiate("gzip", f"W/{gzip_etag}")[0] == 304
+
+
+@pytest.mark.parametrize("start", [sync_server, async_server], ids=["Server", "AsyncServer"])
+def test_served_with_conditional_requests(start, runtime, tmp_path, monkeypatch):
+    monkeypatch.setattr(http_plus.Handler, "log_message", lambda self, *args: None)
+    _, port, stop = start(str(tmp_path), brython_runtime=runtime)
+    try:
+        connection = socket.create_connection(("127.0.0.1", port), timeout=5)
+        reader = connection.makefile("rb")
+
+        def get(*headers: str) -> "tuple[str, dict, bytes]":
+            lines = "".join(f"{header}\r\n" for header in headers)
+            connection.sendall(f"GET {runtime.core_url} HTTP/1.1\r\n{lines}\r\n".encode())
+            return read_response(reader)
+
+        status, headers, body = get("Accept-Encoding: gzip")
+        assert status == "HTTP/1.1 200 OK"
+        assert headers["content-encoding"] == "gzip"
+        assert headers["vary"] == "Accept-Encoding"
+        etag = headers["etag"]
+        status, headers, body = get("Accept-Encoding: gzip", f"If-None-Match: {etag}")
+        assert status.split(" ")[1] == "304"
+        assert headers["etag"] == etag
+        assert body == b""
+        # the same tag doesn't match the uncompressed file
+        status, headers, body = get(f"If-None-Match: {etag}")
+        assert status == "HTTP/1.1 200 OK"
+        assert body == CORE
+        assert headers["etag"] != etag
+        connection.close()
+    finally:
+        stop()
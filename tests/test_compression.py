@@ -0,0 +1,132 @@
+"""
+Tests for `http_plus.compression`: picking an encoding from `Accept-Encoding`, precompressed
+`.gz`/`.br` siblings of static files, and `Vary` on compressible responses.
+"""
+
+import gzip
+import os
+import socket
+import pytest
+import http_plus_purplelemons_dev as http_plus
+from http_plus_purplelemons_dev.compression import Compression, choose_encoding
+from test_keep_alive import async_server, read_response, sync_server
+
+STYLE = b"body { color: purple; }\n" * 100
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        (None, None),
+        ("", None),
+        ("gzip", "gzip"),
+        ("GZIP", "gzip"),
+        ("deflate, gzip", "gzip"),
+        ("br;q=0.5, gzip;q=0.8", "gzip"),
+        ("br;q=0.8, gzip;q=0.8", "br"),
+        ("gzip;q=0", None),
+        ("gzip;q=nonsense", None),
+        ("*", "br"),
+        ("*;q=0.1, gzip;q=0.5", "gzip"),
+        ("*, br;q=0", "gzip"),
+        ("compress", None),
+        # refusing the body as is doesn't change which encoding is picked
+        ("identity;q=0, gzip", "gzip"),
+        ("identity;q=0", None),
+    ],
+)
+def test_choose_encoding(accept_encoding, expected):
+    assert choose_encoding(accept_encoding, ("br", "gzip", "deflate")) == expected
+
+
+def test_choose_encoding_only_from_available():
+    assert choose_encoding("br, gzip;q=0.5", ("gzip",)) == "gzip"
+    assert choose_encoding("br", ("gzip",)) is None
+
+
+def test_compressible():
+    compression = Compression(min_size=10)
+    assert compression.compressible("text/html; charset=utf-8", 10)
+    assert compression.compressible("Application/JSON", 100)
+    assert not compression.compressible("text/html", 9)
+    assert not compression.compressible("image/png", 100)
+    assert not compression.compressible(None, 100)
+
+
+def write(path, data: bytes, mtime_ns: int) -> os.stat_result:
+    path.write_bytes(data)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    return os.stat(path)
+
+
+def test_fresh_sibling_is_used(tmp_path):
+    style = write(tmp_path / "style.css", STYLE, 2_000_000_000)
+    write(tmp_path / "style.css.gz", b"from the sibling", 2_000_000_000)
+    variant = Compression().static_variant(
+        str(tmp_path / "style.css"), style.st_mtime_ns, style.st_size, "gzip"
+    )
+    assert variant == b"from the sibling"
+
+
+def test_stale_sibling_is_ignored(tmp_path):
+    style = write(tmp_path / "style.css", STYLE, 2_000_000_000)
+    write(tmp_path / "style.css.gz", b"left over", 1_000_000_000)
+    compression = Compression()
+    filename = str(tmp_path / "style.css")
+    version = (style.st_mtime_ns, style.st_size)
+    assert compression.static_variant(filename, *version, "gzip", create=False) is None
+    variant = compression.static_variant(filename, *version, "gzip")
+    assert gzip.decompress(variant) == STYLE  # type: ignore
+
+
+def test_variants_follow_the_file(tmp_path):
+    compression = Compression()
+    filename = str(tmp_path / "style.css")
+    old = write(tmp_path / "style.css", STYLE, 1_000_000_000)
+    first = compression.static_variant(filename, old.st_mtime_ns, old.st_size, "gzip")
+    # cached, the file isn't read again
+    os.remove(filename)
+    assert compression.static_variant(filename, old.st_mtime_ns, old.st_size, "gzip") is first
+    new = write(tmp_path / "style.css", STYLE * 2, 2_000_000_000)
+    variant = compression.static_variant(filename, new.st_mtime_ns, new.st_size, "gzip")
+    assert gzip.decompress(variant) == STYLE * 2  # type: ignore
+
+
+def test_large_files_need_a_sibling(tmp_path):
+    style = write(tmp_path / "style.css", STYLE, 2_000_000_000)
+    compression = Compression(max_static_size=len(STYLE) - 1)
+    filename = str(tmp_path / "style.css")
+    assert compression.static_variant(filename, style.st_mtime_ns, style.st_size, "gzip") is None
+    write(tmp_path / "style.css.gz", b"from the sibling", 2_000_000_000)
+    variant = compression.static_variant(filename, style.st_mtime_ns, style.st_size, "gzip")
+    assert variant == b"from the sibling"
+
+
+@pytest.mark.parametrize("start", [sync_server, async_server], ids=["Server", "AsyncServer"])
+def test_served_compressed(start, tmp_path, monkeypatch):
+    monkeypatch.setattr(http_plus.Handler, "log_message", lambda self, *args: None)
+    (tmp_path / "style.css").write_bytes(STYLE)
+    # `AsyncServer` compresses static files in the background, a sibling is used straight away
+    (tmp_path / "style.css.gz").write_bytes(gzip.compress(STYLE))
+    server, port, stop = start(str(tmp_path), compression=True)
+
+    @server.get("/compression/page")
+    def page(req: http_plus.Request, res: http_plus.Response):
+        return res.set_body(STYLE.decode()).set_header("Content-Type", "text/html")
+
+    try:
+        connection = socket.create_connection(("127.0.0.1", port), timeout=5)
+        reader = connection.makefile("rb")
+        for path in ("/style.css", "/compression/page"):
+            for accept_encoding, encoding in (("gzip", "gzip"), ("identity", None)):
+                request = f"GET {path} HTTP/1.1\r\nAccept-Encoding: {accept_encoding}\r\n\r\n"
+                connection.sendall(request.encode())
+                status, headers, body = read_response(reader)
+                assert status == "HTTP/1.1 200 OK"
+                # caches have to know the body depends on the header, compressed or not
+                assert headers["vary"] == "Accept-Encoding"
+                assert headers.get("content-encoding") == encoding
+                assert (gzip.decompress(body) if encoding else body) == STYLE
+        connection.close()
+    finally:
+        stop()
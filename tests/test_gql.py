@@ -0,0 +1,221 @@
+"""
+Tests for GraphQL endpoints: `GQLResponse` (variables, batches, async resolvers, result
+caching, persisted queries) and `http_plus.gql` (`QueryCache`, `DataLoader`).
+"""
+
+import asyncio
+from hashlib import sha256
+from types import SimpleNamespace
+import pytest
+from http_plus_purplelemons_dev import gql, json_backend
+from http_plus_purplelemons_dev.communications import (
+    GQL_ERROR,
+    PERSISTED_QUERY_INVALID,
+    PERSISTED_QUERY_NOT_FOUND,
+    GQLResponse,
+)
+from http_plus_purplelemons_dev.gql import DataLoader, QueryCache
+
+SCHEMA = """
+type Query { hello(name: String): String, user(id: Int): User, users: [User] }
+type User { id: Int, name: String }
+type Mutation { bump: Int }
+"""
+QUERY = "query Hello($name: String) { hello(name: $name) }"
+
+
+def endpoint(result_ttl: "float | None" = None):
+    "Returns a function that answers a request body, like a `@server.gql` endpoint would."
+    cache = QueryCache(SCHEMA, result_ttl=result_ttl)
+    calls: "list[str]" = []
+
+    def hello(info, name="world"):
+        calls.append(name)
+        return f"hello {name}"
+
+    def answer(body, database=None) -> "tuple[int, object]":
+        # just enough of a handler for `GQLResponse`
+        handler = SimpleNamespace(json=body, path="/gql", gql_caches={"/gql": cache})
+        response = GQLResponse(handler)  # type: ignore
+        response.set_database(database or {"hello": hello, "bump": lambda info: 1})
+        response.prepare()
+        return response.status_code, json_backend.loads(response.body)
+
+    answer.calls = calls  # type: ignore
+    answer.cache = cache  # type: ignore
+    return answer
+
+
+def test_variables_and_operation_name():
+    answer = endpoint()
+    hello = {"query": QUERY, "variables": {"name": "lemon"}}
+    assert answer(hello) == (200, {"hello": "hello lemon"})
+    two = 'query A { hello } query B { hello(name: "b") }'
+    assert answer({"query": two, "operationName": "B"}) == (200, {"hello": "hello b"})
+
+
+def test_failed_operation():
+    assert endpoint()({"query": "{ nope }"}) == (500, GQL_ERROR)
+
+
+def test_batch():
+    status, results = endpoint()(
+        [
+            {"query": QUERY, "variables": {"name": "a"}},
+            {"query": "{ nope }"},
+            {"query": "mutation { bump }"},
+        ]
+    )
+    # one failed operation doesn't fail the others
+    assert status == 200
+    assert results == [{"hello": "hello a"}, GQL_ERROR, {"bump": 1}]
+
+
+def test_documents_are_parsed_once():
+    answer = endpoint()
+    for name in ("a", "b", "c"):
+        answer({"query": QUERY, "variables": {"name": name}})
+    assert len(answer.cache.documents) == 1  # type: ignore
+
+
+def test_results_are_cached_per_variables(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(gql, "monotonic", lambda: now[0])
+    answer = endpoint(result_ttl=10)
+    for name in ("a", "a", "b", "a"):
+        hello = {"query": QUERY, "variables": {"name": name}}
+        assert answer(hello) == (200, {"hello": f"hello {name}"})
+    assert answer.calls == ["a", "b"]  # type: ignore
+    now[0] += 11
+    answer({"query": QUERY, "variables": {"name": "a"}})
+    assert answer.calls == ["a", "b", "a"]  # type: ignore
+
+
+def test_mutations_are_not_cached():
+    bumps = []
+    answer = endpoint(result_ttl=10)
+    database = {"bump": lambda info: bumps.append(1) or len(bumps)}
+    assert answer({"query": "mutation { bump }"}, database) == (200, {"bump": 1})
+    assert answer({"query": "mutation { bump }"}, database) == (200, {"bump": 2})
+
+
+def test_async_resolvers():
+    async def hello(info, name="world"):
+        await asyncio.sleep(0)
+        return f"hi {name}"
+
+    assert endpoint()({"query": QUERY, "variables": {"name": "a"}}, {"hello": hello}) == (
+        200,
+        {"hello": "hi a"},
+    )
+
+
+def test_async_resolvers_on_a_running_loop():
+    cache = QueryCache(SCHEMA)
+
+    async def hello(info, name="world"):
+        return f"hi {name}"
+
+    async def run():
+        handler = SimpleNamespace(
+            json={"query": "{ hello }"}, path="/gql", gql_caches={"/gql": cache}
+        )
+        response = GQLResponse(handler).set_database({"hello": hello})  # type: ignore
+        await response.prepare_async(lambda func: asyncio.to_thread(func))
+        return json_backend.loads(response.body)
+
+    assert asyncio.run(run()) == {"hello": "hi world"}
+
+
+def test_loader_batches_a_query():
+    batches = []
+
+    async def users_by_id(ids):
+        batches.append(list(ids))
+        return [{"id": i, "name": f"user{i}"} for i in ids]
+
+    async def user(info, id):
+        return await info.context.loader(users_by_id).load(id)
+
+    query = "{ a: user(id: 1) { name } b: user(id: 2) { name } c: user(id: 1) { name } }"
+    status, result = endpoint()({"query": query}, {"user": user})
+    assert status == 200
+    assert result == {"a": {"name": "user1"}, "b": {"name": "user2"}, "c": {"name": "user1"}}
+    # one call, and the repeated key is only loaded once
+    assert batches == [[1, 2]]
+
+
+def test_loader_max_batch_size_and_failures():
+    batches = []
+
+    def load(keys):
+        batches.append(list(keys))
+        return [ValueError(key) if key == 2 else key * 10 for key in keys]
+
+    async def run():
+        loader = DataLoader(load, max_batch_size=2)
+        loads = (loader.load(key) for key in (1, 2, 3))
+        results = await asyncio.gather(*loads, return_exceptions=True)
+        # every key is loaded once, failed or not
+        again = await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert results[0] == 10 and isinstance(results[1], ValueError) and results[2] == 30
+    assert again[0] == 10 and isinstance(again[1], ValueError)
+    assert batches == [[1, 2], [3]]
+
+
+def test_loader_wrong_number_of_values():
+    async def run():
+        return await DataLoader(lambda keys: [1]).load_many([1, 2])
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+
+
+def persisted(sha256_hash: str) -> dict:
+    return {"persistedQuery": {"version": 1, "sha256Hash": sha256_hash}}
+
+
+def test_persisted_query():
+    answer = endpoint()
+    query = "{ hello }"
+    sha = sha256(query.encode()).hexdigest()
+    # the client tries the hash first, then sends the query along with it
+    assert answer({"extensions": persisted(sha)}) == (200, PERSISTED_QUERY_NOT_FOUND)
+    assert answer({"query": query, "extensions": persisted(sha)}) == (200, {"hello": "hello world"})
+    assert answer({"extensions": persisted(sha)}) == (200, {"hello": "hello world"})
+
+
+def test_persisted_query_hash_must_match():
+    answer = endpoint()
+    assert answer({"query": "{ hello }", "extensions": persisted("0" * 64)}) == (500, GQL_ERROR)
+
+
+@pytest.mark.parametrize("extensions", [None, {}, {"persistedQuery": None}, {"other": 1}])
+def test_absent_persisted_query(extensions):
+    answer = endpoint()
+    hello = {"query": "{ hello }", "extensions": extensions}
+    assert answer(hello) == (200, {"hello": "hello world"})
+
+
+@pytest.mark.parametrize(
+    "extensions",
+    [
+        [],
+        "",
+        0,
+        {"persistedQuery": []},
+        {"persistedQuery": ""},
+        {"persistedQuery": 0},
+        {"persistedQuery": {}},
+        {"persistedQuery": {"sha256Hash": None}},
+        {"persistedQuery": {"sha256Hash": 5}},
+    ],
+)
+def test_invalid_persisted_query(extensions):
+    answer = endpoint()
+    hello = {"query": "{ hello }", "extensions": extensions}
+    assert answer(hello) == (200, PERSISTED_QUERY_INVALID)
+    assert answer.calls == []  # type: ignore
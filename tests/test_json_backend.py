@@ -0,0 +1,90 @@
+"""
+Tests for `http_plus.json_backend`: which backend `use` picks, and that every installed one
+encodes and decodes the same way.
+"""
+
+from importlib.util import find_spec
+import sys
+import pytest
+from http_plus_purplelemons_dev import json_backend
+
+INSTALLED = [name for name in json_backend.BACKENDS if find_spec(name) is not None]
+DATA = {
+    "text": "héllo \"world\"\n",
+    "numbers": [0, -1, 2**40, 1.5],
+    "nested": {"list": [True, False, None], "empty": {}},
+}
+
+
+@pytest.fixture(autouse=True)
+def restore_backend():
+    backend = json_backend.backend
+    yield
+    json_backend.use(backend)
+
+
+def block(monkeypatch, *names: str) -> None:
+    "Makes importing `names` fail, as if they weren't installed."
+    for name in names:
+        monkeypatch.setitem(sys.modules, name, None)
+
+
+def test_auto_picks_the_fastest_installed():
+    assert json_backend.use() == INSTALLED[0]
+    assert json_backend.backend == INSTALLED[0]
+
+
+@pytest.mark.parametrize(
+    "blocked, expected",
+    [(("orjson",), "ujson"), (("ujson",), "orjson"), (("orjson", "ujson"), "json")],
+)
+def test_auto_falls_back_in_order(monkeypatch, blocked, expected):
+    block(monkeypatch, *blocked)
+    available = [name for name in INSTALLED if name not in blocked]
+    if expected not in available:
+        expected = available[0]
+    assert json_backend.use("auto") == expected
+
+
+@pytest.mark.parametrize("name", ["orjson", "ujson"])
+def test_missing_backend(monkeypatch, name):
+    block(monkeypatch, name)
+    before = json_backend.backend
+    with pytest.raises(ImportError):
+        json_backend.use(name)
+    assert json_backend.backend == before
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        json_backend.use("simplejson")
+
+
+@pytest.fixture(params=json_backend.BACKENDS)
+def backend(request):
+    if request.param not in INSTALLED:
+        pytest.skip(f"{request.param} isn't installed")
+    return json_backend.use(request.param)
+
+
+def test_round_trip(backend):
+    encoded = json_backend.dumps(DATA)
+    assert isinstance(encoded, bytes)
+    assert json_backend.loads(encoded) == DATA
+    assert json_backend.loads(encoded.decode()) == DATA
+    assert json_backend.loads(bytearray(encoded)) == DATA
+    assert json_backend.loads(memoryview(encoded)) == DATA
+
+
+def test_compact_and_sorted(backend):
+    assert json_backend.dumps({"b": [1, 2], "a": 1}, sort_keys=True) == b'{"a":1,"b":[1,2]}'
+
+
+def test_big_integers(backend):
+    assert json_backend.loads(json_backend.dumps([2**70])) == [2**70]
+
+
+@pytest.mark.parametrize("data", [b"", b"{", b"[1,]", b"nope"])
+def test_invalid_json_is_a_value_error(backend, data):
+    with pytest.raises(ValueError):
+        json_backend.loads(data)
@@ -0,0 +1,229 @@
+"""
+Tests for keep-alive and pipelining on `Server` and `AsyncServer`, over a real socket.
+"""
+
+import asyncio
+import socket
+import threading
+import time
+import pytest
+import http_plus_purplelemons_dev as http_plus
+from http_plus_purplelemons_dev.workers import make_httpd
+
+STYLE = b"body { color: purple; }"
+
+
+def sync_server(page_dir: str, **kwargs):
+    server = http_plus.Server(page_dir=page_dir, error_dir=f"{page_dir}/errors", **kwargs)
+    httpd = make_httpd(("127.0.0.1", 0), server.handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        httpd.shutdown()
+        httpd.server_close()
+
+    return server, httpd.server_address[1], stop
+
+
+def async_server(page_dir: str, **kwargs):
+    server = http_plus.AsyncServer(page_dir=page_dir, error_dir=f"{page_dir}/errors", **kwargs)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    listening = asyncio.run_coroutine_threadsafe(server.serve(0, "127.0.0.1"), loop).result(5)
+
+    def stop():
+        loop.call_soon_threadsafe(listening.close)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+
+    return server, listening.sockets[0].getsockname()[1], stop
+
+
+@pytest.fixture(params=[sync_server, async_server], ids=["Server", "AsyncServer"])
+def port(request, tmp_path, monkeypatch):
+    # no index.html, it would be served for every path that isn't a file
+    (tmp_path / "style.css").write_bytes(STYLE)
+    # the servers log every request
+    monkeypatch.setattr(http_plus.Handler, "log_message", lambda self, *args: None)
+    server, port, stop = request.param(str(tmp_path))
+
+    @server.get("/keep-alive/hello")
+    def hello(req: http_plus.Request, res: http_plus.Response):
+        return res.set_body("hello")
+
+    @server.head("/keep-alive/hello")
+    def hello_head(req: http_plus.Request, res: http_plus.Response):
+        return res.set_body("hello")
+
+    @server.get("/keep-alive/stream")
+    def stream(req: http_plus.Request, res: http_plus.Response):
+        return res.set_body(iter(["a", "b", "c"]))
+
+    yield port
+    stop()
+
+
+def exchange(port: int, requests: "list[tuple[str, str]]") -> "list[tuple[str, dict, bytes]]":
+    """
+    Sends every request at once on one connection (pipelined) and reads one response for each.
+    Fails if anything is left over after the last one.
+    """
+    connection = socket.create_connection(("127.0.0.1", port), timeout=5)
+    connection.sendall(
+        b"".join(
+            f"{method} {path} HTTP/1.1\r\nHost: test\r\n\r\n".encode() for method, path in requests
+        )
+    )
+    reader = connection.makefile("rb")
+    responses = []
+    for method, _ in requests:
+        status = reader.readline().decode().strip()
+        headers = {}
+        while (line := reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if method == "HEAD":
+            body = b""
+        elif headers.get("transfer-encoding") == "chunked":
+            body = b""
+            while size := int(reader.readline(), 16):
+                body += reader.read(size)
+                reader.readline()
+            reader.readline()
+        else:
+            body = reader.read(int(headers.get("content-length", 0)))
+        responses.append((status, headers, body))
+    connection.settimeout(0.2)
+    try:
+        leftover = connection.recv(1024)
+    except socket.timeout:
+        leftover = b""
+    connection.close()
+    assert leftover == b""
+    return responses
+
+
+@pytest.mark.parametrize("path", ["/keep-alive/hello", "/style.css", "/keep-alive/missing"])
+def test_pipelined_head_then_get(port, path):
+    (head_status, head, body), (status, headers, get_body) = exchange(
+        port, [("HEAD", path), ("GET", "/keep-alive/hello")]
+    )
+    assert body == b""
+    assert head_status.split(" ")[1] in ("200", "404")
+    assert status == "HTTP/1.1 200 OK"
+    assert get_body == b"hello"
+
+
+def test_head_has_the_length_get_would(port):
+    (_, head, _), (_, get, body) = exchange(port, [("HEAD", "/style.css"), ("GET", "/style.css")])
+    assert body == STYLE
+    assert head["content-length"] == get["content-length"] == f"{len(STYLE)}"
+
+
+def test_pipelined_requests_are_answered_in_order(port):
+    paths = [
+        "/keep-alive/hello",
+        "/style.css",
+        "/keep-alive/stream",
+        "/keep-alive/missing",
+        "/keep-alive/hello",
+    ]
+    responses = exchange(port, [("GET", path) for path in paths])
+    codes = [status.split(" ")[1] for status, _, _ in responses]
+    assert codes == ["200", "200", "200", "404", "200"]
+    assert responses[0][2] == responses[4][2] == b"hello"
+    assert responses[1][2] == STYLE
+    assert responses[2][2] == b"abc"
+
+
+def test_connection_close_is_honored(port):
+    connection = socket.create_connection(("127.0.0.1", port), timeout=5)
+    connection.sendall(b"GET /keep-alive/hello HTTP/1.1\r\nConnection: close\r\n\r\n")
+    response = b""
+    while data := connection.recv(4096):
+        response += data
+    connection.close()
+    assert response.endswith(b"\r\n\r\nhello")
+
+
+@pytest.fixture
+def quiet(monkeypatch):
+    monkeypatch.setattr(http_plus.Handler, "log_message", lambda self, *args: None)
+
+
+def read_response(reader) -> "tuple[str, dict, bytes]":
+    status = reader.readline().decode().strip()
+    headers = {}
+    while (line := reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, reader.read(int(headers.get("content-length", 0)))
+
+
+def test_idle_connection_is_closed(tmp_path, quiet):
+    server, port, stop = sync_server(str(tmp_path), keep_alive_timeout=0.3)
+
+    @server.get("/keep-alive/hello")
+    def hello(req: http_plus.Request, res: http_plus.Response):
+        return res.set_body("hello")
+
+    try:
+        connection = socket.create_connection(("127.0.0.1", port), timeout=5)
+        connection.sendall(b"GET /keep-alive/hello HTTP/1.1\r\n\r\n")
+        reader = connection.makefile("rb")
+        status, headers, body = read_response(reader)
+        assert (status, body) == ("HTTP/1.1 200 OK", b"hello")
+        assert "connection" not in headers
+        # nothing more is sent, the server hangs up well before our own timeout
+        started = time.monotonic()
+        assert connection.recv(1) == b""
+        assert 0.2 < time.monotonic() - started < 3
+        connection.close()
+    finally:
+        stop()
+
+
+def test_max_requests_per_connection(tmp_path, quiet):
+    server, port, stop = sync_server(str(tmp_path), max_keep_alive_requests=3)
+
+    @server.get("/keep-alive/hello")
+    def hello(req: http_plus.Request, res: http_plus.Response):
+        return res.set_body("hello")
+
+    try:
+        connection = socket.create_connection(("127.0.0.1", port), timeout=5)
+        reader = connection.makefile("rb")
+        for i in range(3):
+            connection.sendall(b"GET /keep-alive/hello HTTP/1.1\r\n\r\n")
+            status, headers, body = read_response(reader)
+            assert (status, body) == ("HTTP/1.1 200 OK", b"hello")
+            # only the last one says so
+            assert headers.get("connection") == ("close" if i == 2 else None)
+        assert connection.recv(1) == b""
+        connection.close()
+    finally:
+        stop()
+
+
+def test_event_stream_closes_the_connection(tmp_path, quiet):
+    server, port, stop = sync_server(str(tmp_path))
+
+    @server.stream("/keep-alive/events")
+    def events(req: http_plus.Request, res: http_plus.StreamResponse):
+        yield res.event("a")
+
+    try:
+        connection = socket.create_connection(("127.0.0.1", port), timeout=5)
+        connection.sendall(b"GET /keep-alive/events HTTP/1.1\r\nAccept: text/event-stream\r\n\r\n")
+        response = b""
+        while data := connection.recv(4096):
+            response += data
+        connection.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        assert b"\r\nConnection: close" in head
+        assert b"keep-alive" not in head
+        assert b"data: a" in body
+    finally:
+        stop()
@@ -0,0 +1,128 @@
+"""
+Tests for `http_plus.parser.RequestParser`: requests split across reads, pipelined,
+chunked, oversized and malformed.
+"""
+
+import pytest
+from http_plus_purplelemons_dev.parser import ParseError, RequestParser
+
+GET = b"GET /a HTTP/1.1\r\nHost: example.com\r\n\r\n"
+POST = b"POST /p HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello"
+CHUNKED = (
+    b"POST /c HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+    b"5\r\nhello\r\n6;ext=1\r\n world\r\n0\r\nTrailer: x\r\n\r\n"
+)
+
+
+def feed_bytewise(parser: RequestParser, data: bytes) -> list:
+    requests = []
+    for i in range(len(data)):
+        requests += parser.feed(data[i : i + 1])
+    return requests
+
+
+def test_single_request():
+    (request,) = RequestParser().feed(GET)
+    assert (request.method, request.path, request.version) == ("GET", "/a", "HTTP/1.1")
+    assert request.headers["host"] == "example.com"
+    assert request.headers.get("HOST") == "example.com"
+    assert request.body == b""
+    assert request.keep_alive
+
+
+@pytest.mark.parametrize("data", [GET, POST, CHUNKED])
+def test_split_at_every_byte(data):
+    (whole,) = RequestParser().feed(data)
+    (split,) = feed_bytewise(RequestParser(), data)
+    assert split == whole
+
+
+def test_incomplete_request_waits():
+    parser = RequestParser()
+    assert parser.feed(b"POST /p HTTP/1.1\r\nContent-Length: 5\r\n\r\nhel") == []
+    (request,) = parser.feed(b"lo")
+    assert request.body == b"hello"
+
+
+def test_pipelined_requests_in_order():
+    requests = RequestParser().feed(GET + POST + CHUNKED + b"\r\n" + GET)
+    assert [request.path for request in requests] == ["/a", "/p", "/c", "/a"]
+    assert requests[1].body == b"hello"
+
+
+def test_pipelined_and_split():
+    data = GET + POST + CHUNKED
+    requests = feed_bytewise(RequestParser(), data)
+    assert [request.path for request in requests] == ["/a", "/p", "/c"]
+
+
+def test_chunked_body():
+    (request,) = RequestParser().feed(CHUNKED)
+    assert request.body == b"hello world"
+
+
+def test_keep_alive():
+    (http11_close,) = RequestParser().feed(b"GET / HTTP/1.1\r\nConnection: close\r\n\r\n")
+    (http10,) = RequestParser().feed(b"GET / HTTP/1.0\r\n\r\n")
+    (http10_keep,) = RequestParser().feed(b"GET / HTTP/1.0\r\nConnection: keep-alive\r\n\r\n")
+    assert not http11_close.keep_alive
+    assert not http10.keep_alive
+    assert http10_keep.keep_alive
+
+
+def test_repeated_headers_are_joined():
+    (request,) = RequestParser().feed(b"GET / HTTP/1.1\r\nAccept: a\r\naccept: b\r\n\r\n")
+    assert request.headers["Accept"] == "a, b"
+
+
+def error(parser: RequestParser, data: bytes) -> ParseError:
+    with pytest.raises(ParseError) as info:
+        parser.feed(data)
+    return info.value
+
+
+def test_oversized_headers():
+    parser = RequestParser(max_header_size=64)
+    assert error(parser, b"GET / HTTP/1.1\r\nX: " + b"a" * 100).code == 431
+    # the limit holds when the whole head arrives at once too
+    whole = GET[:-2] + b"X: " + b"a" * 100 + b"\r\n\r\n"
+    assert error(RequestParser(max_header_size=64), whole).code == 431
+
+
+def test_oversized_body():
+    assert error(RequestParser(max_body_size=4), POST).code == 413
+    # chunked bodies are checked as they grow
+    assert error(RequestParser(max_body_size=8), CHUNKED).code == 413
+    (request,) = RequestParser(max_body_size=5).feed(POST)
+    assert request.body == b"hello"
+
+
+@pytest.mark.parametrize(
+    "data, code",
+    [
+        (b"garbage\r\n\r\n", 400),
+        (b"GET /\r\n\r\n", 400),
+        (b"GET / HTTP/2.0\r\n\r\n", 505),
+        (b"GET / HTTP/1.1\r\nNo colon\r\n\r\n", 400),
+        (b"GET / HTTP/1.1\r\n Host: x\r\n\r\n", 400),
+        (b"POST / HTTP/1.1\r\nContent-Length: x\r\n\r\n", 400),
+        (b"POST / HTTP/1.1\r\nContent-Length: -1\r\n\r\n", 400),
+        (b"POST / HTTP/1.1\r\nTransfer-Encoding: gzip\r\n\r\n", 501),
+        (b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n", 400),
+        (b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhelloXX0\r\n\r\n", 400),
+        (b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n" + b"1" * 2000, 400),
+    ],
+)
+def test_malformed(data, code):
+    assert error(RequestParser(), data).code == code
+
+
+def test_requests_before_an_error_are_kept():
+    e = error(RequestParser(), GET + POST + b"garbage\r\n\r\n" + GET)
+    assert e.code == 400
+    assert [request.path for request in e.requests] == ["/a", "/p"]
+
+
+def test_oversized_trailers():
+    data = CHUNKED[: CHUNKED.index(b"Trailer")] + b"Trailer: " + b"a" * 100
+    assert error(RequestParser(max_header_size=64), data).code == 431
@@ -0,0 +1,94 @@
+"""
+Tests for `http_plus.ranges`: parsing `Range` headers (suffix, multi-range, unsatisfiable)
+and deciding between `200`, `206`, `304` and `416`.
+"""
+
+from email.utils import formatdate
+from http_plus_purplelemons_dev.ranges import (
+    MAX_RANGES,
+    ByteRanges,
+    make_etag,
+    negotiate,
+    parse_range,
+)
+
+SIZE = 1000
+MTIME_NS = 1_700_000_000 * 10**9
+
+
+def test_single_range():
+    assert parse_range("bytes=0-99", SIZE) == [(0, 100)]
+    assert parse_range("bytes=900-", SIZE) == [(900, SIZE)]
+
+
+def test_range_past_the_end_is_clamped():
+    assert parse_range("bytes=900-5000", SIZE) == [(900, SIZE)]
+
+
+def test_suffix_range():
+    assert parse_range("bytes=-100", SIZE) == [(900, SIZE)]
+    # more than the whole file is the whole file
+    assert parse_range("bytes=-5000", SIZE) == [(0, SIZE)]
+
+
+def test_multi_range():
+    assert parse_range("bytes=0-9, 20-29,-5", SIZE) == [(0, 10), (20, 30), (995, SIZE)]
+
+
+def test_unsatisfiable_ranges():
+    assert parse_range("bytes=1000-", SIZE) == []
+    assert parse_range("bytes=-0", SIZE) == []
+    # only the satisfiable ones are kept
+    assert parse_range("bytes=2000-2100,0-0", SIZE) == [(0, 1)]
+
+
+def test_invalid_ranges_are_ignored():
+    for header in ("items=0-1", "bytes=", "bytes=5", "bytes=a-b", "bytes=10-5", "bytes=--1"):
+        assert parse_range(header, SIZE) is None, header
+    assert parse_range("bytes=" + ",".join(["0-0"] * (MAX_RANGES + 1)), SIZE) is None
+
+
+def test_single_range_body():
+    ranges = ByteRanges([(10, 20)], SIZE, "text/plain")
+    assert list(ranges.parts()) == [(b"", 10, 20)]
+    assert dict(ranges.headers()) == {
+        "Content-type": "text/plain",
+        "Content-Range": "bytes 10-19/1000",
+        "Content-length": "10",
+    }
+
+
+def test_multi_range_body():
+    ranges = ByteRanges([(0, 10), (995, SIZE)], SIZE, "text/plain", boundary="b")
+    body = b"".join(prefix + b"x" * (end - start) for prefix, start, end in ranges.parts())
+    part = b"\r\n--b\r\nContent-Type: text/plain\r\nContent-Range: bytes %b/1000\r\n\r\n"
+    assert body == (
+        part % b"0-9" + b"x" * 10 + part % b"995-999" + b"x" * 5 + b"\r\n--b--\r\n"
+    )
+    headers = dict(ranges.headers())
+    assert headers["Content-type"] == "multipart/byteranges; boundary=b"
+    assert headers["Content-length"] == f"{len(body)}"
+
+
+def test_negotiate():
+    etag = make_etag(MTIME_NS, SIZE)
+    last_modified = formatdate(MTIME_NS / 1e9, usegmt=True)
+    assert negotiate({}, SIZE, MTIME_NS, "text/plain") == (200, None)
+    assert negotiate({"If-None-Match": etag}, SIZE, MTIME_NS, "text/plain") == (304, None)
+    assert negotiate({"If-None-Match": f"W/{etag}"}, SIZE, MTIME_NS, "text/plain") == (304, None)
+    since = {"If-Modified-Since": last_modified}
+    assert negotiate(since, SIZE, MTIME_NS, "text/plain") == (304, None)
+    assert negotiate({"Range": "bytes=1000-"}, SIZE, MTIME_NS, "text/plain") == (416, None)
+    assert negotiate({"Range": "bytes=5"}, SIZE, MTIME_NS, "text/plain") == (200, None)
+    code, ranges = negotiate({"Range": "bytes=-100"}, SIZE, MTIME_NS, "text/plain")
+    assert code == 206 and ranges.ranges == [(900, SIZE)]
+
+
+def test_if_range():
+    etag = make_etag(MTIME_NS, SIZE)
+    fresh = {"Range": "bytes=0-9", "If-Range": etag}
+    code, ranges = negotiate(fresh, SIZE, MTIME_NS, "text/plain")
+    assert code == 206 and ranges.ranges == [(0, 10)]
+    # the client's copy is stale, it gets the whole file
+    stale = {"Range": "bytes=0-9", "If-Range": make_etag(MTIME_NS - 1, SIZE)}
+    assert negotiate(stale, SIZE, MTIME_NS, "text/plain") == (200, None)
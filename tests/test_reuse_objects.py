@@ -0,0 +1,112 @@
+"""
+Tests for `Server(reuse_objects=True)`: a connection's `Request` and `Response` are reused,
+and nothing from one request carries over to the next.
+"""
+
+import io
+import socket
+from types import SimpleNamespace
+import pytest
+import http_plus_purplelemons_dev as http_plus
+from test_keep_alive import async_server, read_response, sync_server
+
+
+def fake_handler(**request) -> SimpleNamespace:
+    "Just enough of a handler for `Request` and `Response`, see `tests/benchmark.py`."
+    return SimpleNamespace(
+        **{
+            "path": "/",
+            "command": "get",
+            "headers": {},
+            "body": b"",
+            "client_address": ("127.0.0.1", 50000),
+            **request,
+        },
+        reuse_objects=True,
+        spare_request=None,
+        spare_response=None,
+    )
+
+
+def test_request_is_reset():
+    handler = fake_handler(
+        path="/users/1",
+        command="post",
+        headers={"Authorization": "Bearer token"},
+        body=b"first",
+        client_address=("10.0.0.1", 1),
+    )
+    first = http_plus.Handler.new_request(handler, {"id": "1"})  # type: ignore
+    # worked out on first use, so they'd be kept if `reset` forgot them
+    assert first.params.id == "1"
+    assert first.authorization == ["Bearer", "token"]
+    assert first.text == "first"
+
+    handler.path, handler.command, handler.headers = "/other", "get", {}
+    handler.body, handler.client_address = b"", ("10.0.0.2", 2)
+    second = http_plus.Handler.new_request(handler, {})  # type: ignore
+    assert second is first
+    assert (second.path, second.method, second.body) == ("/other", "get", b"")
+    assert (second.ip, second.port) == ("10.0.0.2", 2)
+    assert second.headers == {}
+    assert second.authorization is None
+    assert second.text == ""
+    with pytest.raises(AttributeError):
+        second.params.id
+
+
+def test_response_is_reset():
+    handler = fake_handler()
+    first = http_plus.Handler.new_response(handler)  # type: ignore
+    first.set_body("first").set_header("X-First", "1").status(201)
+    first.file = io.BytesIO(b"file")
+    first.stream = iter([b"stream"])
+
+    second = http_plus.Handler.new_response(handler)  # type: ignore
+    assert second is first
+    assert second.headers == {}
+    assert second.body == b""
+    assert second.status_code == 200
+    assert (second.file, second.ranges, second.stream) == (None, None, None)
+
+
+def test_objects_are_not_reused_by_default():
+    handler = fake_handler()
+    handler.reuse_objects = False
+    new_request, new_response = http_plus.Handler.new_request, http_plus.Handler.new_response
+    assert new_request(handler, {}) is not new_request(handler, {})  # type: ignore
+    assert new_response(handler) is not new_response(handler)  # type: ignore
+
+
+@pytest.mark.parametrize("start", [sync_server, async_server], ids=["Server", "AsyncServer"])
+def test_nothing_carries_over_between_requests(start, tmp_path, monkeypatch):
+    monkeypatch.setattr(http_plus.Handler, "log_message", lambda self, *args: None)
+    server, port, stop = start(str(tmp_path), reuse_objects=True)
+    seen = []
+
+    @server.post("/reuse/:id")
+    def first(req: http_plus.Request, res: http_plus.Response):
+        seen.append((req.params.id, req.text, req.get_header("X-Secret")))
+        return res.set_body("first").set_header("X-First", "1").status(201)
+
+    @server.get("/reuse/second")
+    def second(req: http_plus.Request, res: http_plus.Response):
+        seen.append((getattr(req.params, "id", None), req.text, req.get_header("X-Secret")))
+        return res
+
+    try:
+        connection = socket.create_connection(("127.0.0.1", port), timeout=5)
+        reader = connection.makefile("rb")
+        connection.sendall(
+            b"POST /reuse/1 HTTP/1.1\r\nX-Secret: s\r\nContent-Length: 5\r\n\r\nhello"
+            b"GET /reuse/second HTTP/1.1\r\n\r\n"
+        )
+        status, headers, body = read_response(reader)
+        assert (status, headers["x-first"], body) == ("HTTP/1.1 201 Created", "1", b"first")
+        status, headers, body = read_response(reader)
+        assert (status, body) == ("HTTP/1.1 200 OK", b"")
+        assert "x-first" not in headers
+        connection.close()
+    finally:
+        stop()
+    assert seen == [("1", "hello", "s"), (None, "", None)]
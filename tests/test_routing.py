@@ -0,0 +1,103 @@
+"""
+Tests for `http_plus.routing`: precedence of static, keyword and wildcard segments, and
+the `:name:type` converters.
+"""
+
+import pytest
+from http_plus_purplelemons_dev.routing import RouteTree, compile_segment, match_route
+
+
+def tree(*routes: str) -> RouteTree:
+    "A tree with each route mapped to itself, so a lookup tells which route matched."
+    tree = RouteTree()
+    for route in routes:
+        tree.insert(route, route)
+    return tree
+
+
+def test_static_route():
+    routes = tree("/", "/about", "/about/team")
+    assert routes.lookup("/") == ("/", {})
+    assert routes.lookup("/about") == ("/about", {})
+    assert routes.lookup("/about/team") == ("/about/team", {})
+    assert routes.lookup("/contact") is None
+    assert routes.lookup("/about/team/lead") is None
+
+
+def test_static_beats_param_beats_wildcard():
+    routes = tree("/users/*", "/users/:name", "/users/me")
+    assert routes.lookup("/users/me") == ("/users/me", {})
+    assert routes.lookup("/users/lemon") == ("/users/:name", {"name": "lemon"})
+
+
+def test_precedence_does_not_depend_on_registration_order():
+    routes = tree("/users/me", "/users/:name", "/users/*")
+    assert routes.lookup("/users/me") == ("/users/me", {})
+    assert routes.lookup("/users/lemon") == ("/users/:name", {"name": "lemon"})
+
+
+def test_wildcard_matches_a_single_segment():
+    routes = tree("/files/*")
+    assert routes.lookup("/files/a.txt") == ("/files/*", {})
+    assert routes.lookup("/files/a/b.txt") is None
+
+
+def test_backtracks_when_the_static_branch_dead_ends():
+    routes = tree("/users/me/settings", "/users/:name/posts")
+    assert routes.lookup("/users/me/posts") == ("/users/:name/posts", {"name": "me"})
+
+
+def test_converters():
+    routes = tree("/n/:value:int", "/f/:value:float", "/b/:value:bool", "/s/:value:str")
+    assert routes.lookup("/n/12") == ("/n/:value:int", {"value": 12})
+    assert routes.lookup("/f/1.5") == ("/f/:value:float", {"value": 1.5})
+    assert routes.lookup("/b/true") == ("/b/:value:bool", {"value": True})
+    assert routes.lookup("/b/0") == ("/b/:value:bool", {"value": False})
+    assert routes.lookup("/s/12") == ("/s/:value:str", {"value": "12"})
+
+
+def test_failed_conversion_falls_through():
+    routes = tree("/product/:id:int", "/product/:slug", "/flag/:on:bool")
+    assert routes.lookup("/product/12") == ("/product/:id:int", {"id": 12})
+    assert routes.lookup("/product/lemon") == ("/product/:slug", {"slug": "lemon"})
+    assert routes.lookup("/flag/maybe") is None
+
+
+def test_params_only_come_from_the_matched_route():
+    routes = tree("/a/:x:int/b", "/a/:y/c")
+    assert routes.lookup("/a/1/c") == ("/a/:y/c", {"y": "1"})
+
+
+def test_registering_a_route_again_overwrites_it():
+    routes = RouteTree()
+    routes.insert("/a", "first")
+    routes.insert("/a", "second")
+    assert routes.lookup("/a") == ("second", {})
+
+
+def test_compile_segment():
+    assert compile_segment("static") is None
+    assert compile_segment(":id")[0] == "id"
+    assert compile_segment(":id:int") == ("id", int)
+    with pytest.raises(ValueError):
+        compile_segment(":id:complex")
+    with pytest.raises(ValueError):
+        compile_segment(":a:int:b")
+
+
+@pytest.mark.parametrize(
+    "route, path, params",
+    [
+        ("/about", "/about", {}),
+        ("/about", "/contact", None),
+        ("/product/:id:int", "/product/12", {"id": 12}),
+        ("/product/:id:int", "/product/lemon", None),
+        ("/users/:name/*", "/users/lemon/posts", {"name": "lemon"}),
+        ("/files/*", "/files/a/b.txt", None),
+        ("/", "/", {}),
+    ],
+)
+def test_match_route_agrees_with_the_tree(route, path, params):
+    assert match_route(path, route) == params
+    matched = tree(route).lookup(path)
+    assert (matched and matched[1]) == params
@@ -0,0 +1,72 @@
+"""
+Tests for `http_plus.static_responses.error_body`: the pre-rendered error pages, and what
+the servers put on them.
+"""
+
+import socket
+import pytest
+import http_plus_purplelemons_dev as http_plus
+from http_plus_purplelemons_dev.static_responses import (
+    ERROR_PAGES,
+    SEND_RESPONSE_CODE,
+    error_body,
+)
+from test_keep_alive import async_server, read_response, sync_server
+
+
+@pytest.mark.parametrize("code", sorted(ERROR_PAGES))
+def test_pages_match_a_fresh_render(code):
+    assert error_body(code) == SEND_RESPONSE_CODE(code).encode()
+    assert error_body(code, "/some/päth") == SEND_RESPONSE_CODE(code, "/some/päth").encode()
+
+
+def test_pages_are_rendered_once():
+    assert error_body(404) is error_body(404)
+    assert error_body(503, "") is error_body(503)
+
+
+def test_traceback():
+    traceback = "Traceback (most recent call last):\nValueError"
+    body = error_body(500, "/boom", traceback)
+    assert body == SEND_RESPONSE_CODE(500, "/boom", traceback).encode()
+    assert b'"/boom"' in body
+    assert f"<pre>{traceback}</pre>".encode() in body
+    assert b"<pre>" not in error_body(500, "/boom")
+
+
+@pytest.fixture(params=[sync_server, async_server], ids=["Server", "AsyncServer"])
+def start(request, tmp_path, monkeypatch):
+    "Starts a server with a route that raises, returns a function that GETs from it."
+    monkeypatch.setattr(http_plus.Handler, "log_message", lambda self, *args: None)
+    stops = []
+
+    def get(path: str, debug: bool) -> "tuple[str, dict, bytes]":
+        server, port, stop = request.param(str(tmp_path), debug=debug)
+        stops.append(stop)
+
+        @server.get("/static-responses/boom")
+        def boom(req: http_plus.Request, res: http_plus.Response):
+            raise ValueError("it went boom")
+
+        with socket.create_connection(("127.0.0.1", port), timeout=5) as connection:
+            connection.sendall(f"GET {path} HTTP/1.1\r\n\r\n".encode())
+            return read_response(connection.makefile("rb"))
+
+    yield get
+    for stop in stops:
+        stop()
+
+
+def test_path_on_the_page(start):
+    status, headers, body = start("/static-responses/missing", debug=False)
+    assert status == "HTTP/1.1 404 Not Found"
+    assert body == error_body(404, "/static-responses/missing")
+
+
+@pytest.mark.parametrize("debug", [False, True])
+def test_traceback_only_in_debug_mode(start, debug, capsys):
+    status, headers, body = start("/static-responses/boom", debug=debug)
+    assert status == "HTTP/1.1 500 Internal Server Error"
+    assert b'"it went boom"' in body
+    assert (b"<pre>Traceback (most recent call last):" in body) == debug
+    assert (b"ValueError: it went boom" in body) == debug
@@ -0,0 +1,80 @@
+"""
+Tests for `http_plus.workers.PooledHTTPServer`: connections past its capacity are turned
+away with a `503` the client can read.
+"""
+
+import socket
+import threading
+import time
+import pytest
+import http_plus_purplelemons_dev as http_plus
+from http_plus_purplelemons_dev.workers import PooledHTTPServer, make_httpd
+
+
+@pytest.fixture
+def saturated(tmp_path, monkeypatch):
+    "A pool with one thread, busy with a request until the test ends. Yields its port."
+    monkeypatch.setattr(http_plus.Handler, "log_message", lambda self, *args: None)
+    server = http_plus.Server(page_dir=str(tmp_path), error_dir=str(tmp_path))
+    httpd = make_httpd(("127.0.0.1", 0), server.handler, max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    @server.get("/workers/block")
+    def block(req: http_plus.Request, res: http_plus.Response):
+        started.set()
+        release.wait(10)
+        return res.set_body("done")
+
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    port = httpd.server_address[1]
+    busy = socket.create_connection(("127.0.0.1", port), timeout=5)
+    busy.sendall(b"GET /workers/block HTTP/1.1\r\n\r\n")
+    assert started.wait(5)
+    yield port
+    release.set()
+    busy.close()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def read_all(connection: socket.socket) -> bytes:
+    response = b""
+    while data := connection.recv(4096):
+        response += data
+    return response
+
+
+def assert_rejected(response: bytes) -> None:
+    "Checks that `response` is the whole `503`."
+    head, _, body = response.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 503 Service Unavailable\r\n")
+    assert b"\r\nRetry-After: 1\r\n" in head
+    assert f"\r\nContent-length: {len(body)}\r\n".encode() in head + b"\r\n"
+    assert body
+
+
+def test_rejected_with_503(saturated):
+    connection = socket.create_connection(("127.0.0.1", saturated), timeout=5)
+    connection.sendall(b"GET / HTTP/1.1\r\n\r\n")
+    response = read_all(connection)
+    connection.close()
+    assert_rejected(response)
+
+
+def test_rejection_is_not_reset():
+    # closing a socket with unread bytes resets the connection, which can lose the `503`
+    listener = socket.create_server(("127.0.0.1", 0))
+    client = socket.create_connection(listener.getsockname(), timeout=5)
+    client.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+    server_side, _ = listener.accept()
+    listener.close()
+    httpd = PooledHTTPServer(("127.0.0.1", 0), http_plus.Handler, 1, bind_and_activate=False)
+    try:
+        httpd.reject(server_side)
+        # more of the request arrives after the `503` was sent, and the client is slow to read
+        client.sendall(b"a" * 1000)
+        time.sleep(0.1)
+        assert_rejected(read_all(client))
+    finally:
+        client.close()
+        httpd.server_close()